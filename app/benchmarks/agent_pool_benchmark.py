@@ -0,0 +1,112 @@
+"""Simulate how queue wait time scales with the number of admins.
+
+Users arrive as a Poisson process and hold a session for an exponentially
+distributed time. The simulation drives the real ChatManager dispatch logic
+(claim_next_session/end_chat) on a simulated clock. First checks that the
+two dispatch strategies pick different admins where they should. Run from
+the app directory:
+
+    python -m benchmarks.agent_pool_benchmark
+"""
+import heapq
+import random
+
+from models.agent_pool import LEAST_LOADED, LONGEST_IDLE, AgentPool
+from models.chat_manager import ChatManager
+
+ARRIVALS = 5_000
+ARRIVAL_RATE = 1 / 60  # one new user per minute
+MEAN_SESSION = 240  # seconds
+AGENT_COUNTS = (1, 2, 4, 5, 6, 8)
+SLOTS_PER_AGENT = (1, 2)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def simulate(agents: int, slots: int, strategy: str = LEAST_LOADED, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    now = 0.0
+    manager = ChatManager(
+        max_queue_size=ARRIVALS,
+        agent_ids=range(1, agents + 1),
+        agent_max_sessions=slots,
+        dispatch_strategy=strategy,
+        clock=lambda: now,
+    )
+    events = []
+    t = 0.0
+    for user_id in range(1_000, 1_000 + ARRIVALS):
+        t += rng.expovariate(ARRIVAL_RATE)
+        heapq.heappush(events, (t, "arrive", user_id, None))
+
+    enqueued_at = {}
+    waits = []
+    per_agent = {}
+
+    def dispatch():
+        while True:
+            claimed = manager.claim_next_session()
+            if claimed is None:
+                return
+            user_id, admin_id = claimed
+            waits.append(now - enqueued_at.pop(user_id))
+            per_agent[admin_id] = per_agent.get(admin_id, 0) + 1
+            # A single admin juggling several chats works each of them more slowly
+            duration = rng.expovariate(1 / MEAN_SESSION) * (1 + 0.5 * (slots - 1))
+            heapq.heappush(events, (now + duration, "end", user_id, admin_id))
+
+    while events:
+        now, kind, user_id, admin_id = heapq.heappop(events)
+        if kind == "arrive":
+            manager.add_user_to_queue(user_id)
+            enqueued_at[user_id] = now
+        else:
+            manager.end_chat(user_id, admin_id)
+        dispatch()
+
+    return {
+        "mean": sum(waits) / len(waits),
+        "p50": percentile(waits, 50),
+        "p95": percentile(waits, 95),
+        "max": max(waits),
+        # Difference in sessions handled between the busiest and the quietest admin
+        "spread": max(per_agent.values()) - min(per_agent.values()) if per_agent else 0,
+    }
+
+
+def strategy_check():
+    """Admin 1 took a chat long ago and still holds it; admin 2 just finished one and is empty"""
+    picks = {}
+    for strategy in (LEAST_LOADED, LONGEST_IDLE):
+        now = [0.0]
+        pool = AgentPool([1, 2], max_sessions=2, strategy=strategy, clock=lambda: now[0])
+        now[0] = 10.0
+        pool.assign(1, 100)
+        now[0] = 20.0
+        pool.assign(2, 200)
+        now[0] = 30.0
+        pool.release(2, 200)
+        picks[strategy] = pool.choose_agent()
+    # The emptiest admin for least_loaded, the one left alone longest for longest_idle
+    assert picks == {LEAST_LOADED: 2, LONGEST_IDLE: 1}, picks
+    return picks
+
+
+def main():
+    picks = strategy_check()
+    print(f"strategy check: least_loaded picks admin {picks[LEAST_LOADED]}, "
+          f"longest_idle picks admin {picks[LONGEST_IDLE]}")
+    print(f"arrivals={ARRIVALS} rate={ARRIVAL_RATE * 3600:.0f}/h mean_session={MEAN_SESSION}s")
+    print(f"{'agents':>6} {'slots':>5} {'mean wait':>10} {'p50':>9} {'p95':>9} {'max':>9} {'spread':>7}")
+    for slots in SLOTS_PER_AGENT:
+        for agents in AGENT_COUNTS:
+            r = simulate(agents, slots)
+            print(f"{agents:>6} {slots:>5} {r['mean']:>9.0f}s {r['p50']:>8.0f}s "
+                  f"{r['p95']:>8.0f}s {r['max']:>8.0f}s {r['spread']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Exercise the state backends with several concurrent workers.
+
+Runs the same join -> claim -> timeout workload against InMemoryBackend and
+against RedisBackend talking to the local fake Redis server, with two
+RedisBackend workers sharing one queue. It checks the invariants the
+backends promise and reports operations per second. Run from the app
+directory:
+
+    python -m benchmarks.backend_benchmark
+"""
+import asyncio
+import time
+
+from devtools.fake_redis import FakeRedisServer
+from models.chat_manager import ChatManager
+from models.redis_backend import RedisBackend
+from models.state_backend import InMemoryBackend
+from services.resp_client import RespClient
+
+USERS = 2_000
+MAX_QUEUE = 1_500
+AGENTS = list(range(1, 6))
+SLOTS = 4
+TIMEOUT = 0.2
+
+
+async def run_workload(workers) -> dict:
+    claimed = {}
+    fired = {}
+
+    async def on_timeout(user_id, admin_id):
+        fired[user_id] = fired.get(user_id, 0) + 1
+        await workers[0].end_chat(user_id, admin_id)
+
+    for worker in workers:
+        await worker.start(on_timeout)
+
+    start = time.perf_counter()
+    # Every user tries to join through a different worker at once
+    joined = await asyncio.gather(*(
+        workers[i % len(workers)].add_user_to_queue(10_000 + i) for i in range(USERS)
+    ))
+    queue_size = await workers[0].get_queue_size()
+    assert queue_size == sum(joined) == min(USERS, MAX_QUEUE), (queue_size, sum(joined))
+
+    # All workers race to claim sessions until every slot is taken
+    async def claim(worker):
+        while True:
+            session = await worker.claim_next_session()
+            if session is None:
+                return
+            user_id, admin_id = session
+            assert user_id not in claimed, f"user {user_id} claimed twice"
+            claimed[user_id] = admin_id
+
+    await asyncio.gather(*(claim(worker) for worker in workers))
+    assert len(claimed) == len(AGENTS) * SLOTS, len(claimed)
+    for admin_id in AGENTS:
+        assert len(await workers[0].get_agent_sessions(admin_id)) == SLOTS
+    elapsed = time.perf_counter() - start
+
+    # Let every session time out; each must be ended exactly once
+    await asyncio.sleep(TIMEOUT + 1.5)
+    assert set(fired) == set(claimed), (len(fired), len(claimed))
+    assert all(count == 1 for count in fired.values()), fired
+
+    for worker in workers:
+        await worker.stop()
+    return {"ops": USERS + len(claimed), "elapsed": elapsed}
+
+
+async def main():
+    manager = ChatManager(max_queue_size=MAX_QUEUE, chat_timeout=TIMEOUT, agent_ids=AGENTS, agent_max_sessions=SLOTS)
+    manager.timeouts.tick_interval = 0.05
+    memory = await run_workload([InMemoryBackend(manager)])
+
+    server = FakeRedisServer()
+    await server.start()
+    workers = [
+        RedisBackend(
+            RespClient("127.0.0.1", server.port), agent_ids=AGENTS, agent_max_sessions=SLOTS,
+            max_queue_size=MAX_QUEUE, chat_timeout=TIMEOUT, worker_id=f"worker-{i}", tick_interval=0.05,
+        )
+        for i in range(2)
+    ]
+    redis = await run_workload(workers)
+    await server.stop()
+
+    print(f"{'backend':<22} {'ops':>6} {'ops/s':>10}")
+    print(f"{'memory (1 worker)':<22} {memory['ops']:>6} {memory['ops'] / memory['elapsed']:>10.0f}")
+    print(f"{'fake redis (2 workers)':<22} {redis['ops']:>6} {redis['ops'] / redis['elapsed']:>10.0f}")
+    print(f"fake redis served {server.redis.commands} commands; all invariants held")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,292 @@
+"""Hammer the bot with concurrent updates for the same users and check the state invariants.
+
+Waves of overlapping /chat, /stop, stop-button, /queue and relayed messages
+from the same users and admins are pushed through the application's update
+queue, so they run through the configured update processor exactly as in
+production. Bot API calls are answered by the fake Bot API with random
+latency, so handlers interleave at every await, and chat timeouts are short
+enough to race with /stop. While the waves run, a sampler checks the
+queue/session invariants of the ChatManager after every step of the event
+loop. At the end it checks that relayed messages reached each recipient in
+the order the sender sent them, that nobody got the generic error reply,
+and that the queue keeps moving.
+
+Every processor runs twice: with the state in memory, where a handler
+reads its chat partner without suspending, and with "remote" state whose
+lookups take a random round trip, as they do with Redis. Only the second
+gives a later update of a chat the chance to overtake an earlier one
+between reading the partner and relaying, which is what the unordered
+processor gets wrong. Relayed messages are copied one by one (no relay
+window), so a batch sorted by message id cannot put an overtaken message
+back in place. Run from the app directory:
+
+    python -m benchmarks.concurrency_stress
+    python -m benchmarks.concurrency_stress --processor per-chat --waves 100
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import List
+
+USERS = 300
+AGENTS = list(range(1, 6))
+SLOTS = 2
+MAX_QUEUE = 100
+WAVES = 20
+USERS_PER_WAVE = 40
+LATENCY = 0.002
+JITTER = 0.003
+STATE_LATENCY = 0.05  # upper bound of a remote state lookup, as from a loaded server in another zone
+
+# bot.py reads its configuration at import time
+os.environ.update({
+    "TELEGRAM_BOT_TOKEN": "123:stress",
+    "ADMIN_USER_ID": str(AGENTS[0]),
+    "ADMIN_USER_IDS": ",".join(str(agent) for agent in AGENTS),
+    "AGENT_MAX_SESSIONS": str(SLOTS),
+    "MAX_QUEUE_SIZE": str(MAX_QUEUE),
+    "CHAT_TIMEOUT": "1",
+    "STATE_BACKEND": "memory",
+    "STATE_DIR": "",
+    "TRANSCRIPT_DIR": "",
+    "WEBHOOK_URL": "",
+    # Both send faster than any person would on purpose
+    "FLOOD_RATE": "0",
+})
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, SimpleUpdateProcessor  # noqa: E402
+
+import bot  # noqa: E402
+from devtools.fake_bot_api import FakeBotApi, FakeBotRequest, callback_update, message_update  # noqa: E402
+from models.chat_manager import ChatManager  # noqa: E402
+from models.state_backend import InMemoryBackend  # noqa: E402
+from services.relay import RelayBuffer  # noqa: E402
+from services.update_processor import ChatSerializedProcessor  # noqa: E402
+
+PROCESSORS = {
+    # What main() used before: one update at a time
+    "sequential": lambda limit: False,
+    # Plain concurrent_updates: fast, but a chat's updates may overtake each other
+    "unordered": lambda limit: SimpleUpdateProcessor(limit),
+    "per-chat": lambda limit: ChatSerializedProcessor(limit),
+}
+ERROR_REPLY = "Terjadi kesalahan"
+
+
+class RemoteState(InMemoryBackend):
+    """InMemoryBackend whose chat partner lookups take a random round trip, as over the network"""
+
+    def __init__(self, chat_manager: ChatManager, seed: int):
+        super().__init__(chat_manager)
+        self.random = random.Random(seed)
+
+    async def get_active_chat_partner(self, user_id: int):
+        await asyncio.sleep(self.random.random() * STATE_LATENCY)
+        return await super().get_active_chat_partner(user_id)
+
+
+def check_state(manager: ChatManager) -> List[str]:
+    """Invariants that must hold at every point the event loop can switch tasks"""
+    problems = []
+    queue = list(manager.user_queue)
+    if len(set(queue)) != len(queue):
+        problems.append("a user is queued twice")
+    if len(queue) > manager.max_queue_size:
+        problems.append("queue is over its size limit")
+    if set(queue) & manager.sessions.keys():
+        problems.append("a user is both queued and in a chat")
+    if set(AGENTS) & (set(queue) | manager.sessions.keys()):
+        problems.append("an admin is queued or chatting as a user")
+    sessions = 0
+    for admin_id in AGENTS:
+        users = manager.get_agent_sessions(admin_id)
+        sessions += len(users)
+        if len(users) > SLOTS:
+            problems.append("an admin has more chats than slots")
+        if any(manager.get_active_chat_partner(user_id) != admin_id for user_id in users):
+            problems.append("an admin's session list disagrees with the user's chat")
+    if sessions != len(manager.sessions):
+        problems.append("a chat is missing from its admin's sessions")
+    if any(user_id not in manager.sessions for user_id in manager.timeouts._deadlines):
+        problems.append("a timeout is armed for a chat that is over")
+    return problems
+
+
+def check_settled(manager: ChatManager) -> List[str]:
+    """Invariants that must hold once no update or timeout is in flight"""
+    problems = []
+    if any(user_id not in manager.timeouts for user_id in manager.sessions):
+        problems.append("a chat has no timeout armed")
+    free = sum(SLOTS - len(manager.get_agent_sessions(admin_id)) for admin_id in AGENTS)
+    if manager.user_queue and free:
+        problems.append("users wait while an admin has a free slot")
+    return problems
+
+
+def order_violations(api: FakeBotApi) -> int:
+    """Relayed messages that reached a chat before one sent to it earlier by the same sender"""
+    last = {}
+    violations = 0
+    for method, params in api.requests:
+        if method == "copyMessage":
+            message_ids = [int(params["message_id"])]
+        elif method == "copyMessages":
+            message_ids = [int(message_id) for message_id in params["message_ids"]]
+        else:
+            continue
+        pair = (int(params["from_chat_id"]), int(params["chat_id"]))
+        for message_id in message_ids:
+            if message_id < last.get(pair, 0):
+                violations += 1
+            last[pair] = max(message_id, last.get(pair, 0))
+    return violations
+
+
+class Stress:
+    """One application, fed waves of overlapping updates through its update queue"""
+
+    def __init__(self, options, processor):
+        self.options = options
+        self.random = random.Random(options.seed)
+        self.api = FakeBotApi(latency=LATENCY, record=True, seed=options.seed, jitter=JITTER)
+        self.application = (
+            Application.builder()
+            .token(os.environ["TELEGRAM_BOT_TOKEN"])
+            .request(FakeBotRequest(self.api))
+            .get_updates_request(FakeBotRequest(self.api))
+            .concurrent_updates(processor)
+            .build()
+        )
+        bot.add_handlers(self.application)
+        self.users = list(range(100_000, 100_000 + USERS))
+        self.manager: ChatManager = bot.state.backend.chat_manager
+        self.problems: Counter = Counter()
+        self.updates = 0
+        self._update_ids = iter(range(1, 1 << 62))
+
+    def _user_burst(self, user_id: int) -> List[dict]:
+        burst = []
+        for _ in range(self.random.randint(1, 4)):
+            action = self.random.choice(("/chat", "/chat", "message", "message", "message", "/stop", "button", "/queue"))
+            update_id = next(self._update_ids)
+            if action == "button":
+                burst.append(callback_update(update_id, user_id, "stop_chat"))
+            elif action == "message":
+                burst.append(message_update(update_id, user_id, f"pesan {update_id}"))
+            else:
+                burst.append(message_update(update_id, user_id, action))
+        return burst
+
+    def _admin_burst(self, admin_id: int) -> List[dict]:
+        burst = [
+            message_update(next(self._update_ids), admin_id, "balasan")
+            for _ in range(self.random.randint(0, 3))
+        ]
+        if self.random.random() < 0.3:
+            burst.append(message_update(next(self._update_ids), admin_id, "/stop"))
+        return burst
+
+    async def _sample(self):
+        while True:
+            for problem in check_state(self.manager):
+                self.problems[problem] += 1
+            await asyncio.sleep(0)
+
+    async def _settle(self):
+        await self.application.update_queue.join()
+        processor = self.application.update_processor
+        while getattr(processor, "busy_chats", 0):
+            await asyncio.sleep(0.001)
+
+    async def run(self) -> float:
+        await self.application.initialize()
+        await bot.post_init(self.application)
+        await self.application.start()
+        sampler = asyncio.create_task(self._sample())
+        start = time.perf_counter()
+        for _ in range(self.options.waves):
+            bursts = [self._user_burst(user_id) for user_id in self.random.sample(self.users, USERS_PER_WAVE)]
+            bursts += [burst for burst in map(self._admin_burst, AGENTS) if burst]
+            # Interleave the bursts while keeping each chat's own updates in order
+            while bursts:
+                burst = self.random.choice(bursts)
+                data = burst.pop(0)
+                if not burst:
+                    bursts.remove(burst)
+                await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+                self.updates += 1
+            await asyncio.sleep(self.random.random() * 0.01)
+        await self._settle()
+        elapsed = time.perf_counter() - start
+
+        # Timeouts fire once a second, so give the last ones time to land
+        deadline = time.monotonic() + 3
+        while check_settled(self.manager) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            await self._settle()
+        for problem in check_settled(self.manager):
+            self.problems[problem] += 1
+        sampler.cancel()
+        await self.application.stop()
+        await bot.post_stop(self.application)
+        await bot.post_shutdown(self.application)
+        await self.application.shutdown()
+        return elapsed
+
+
+async def stress(options, name: str, remote: bool) -> dict:
+    bot.state = bot.create_state_backend()
+    bot.relay = RelayBuffer(window=0)
+    if remote:
+        bot.state.backend = RemoteState(bot.state.backend.chat_manager, options.seed)
+    run = Stress(options, PROCESSORS[name](options.concurrency))
+    elapsed = await run.run()
+    errors = sum(
+        1 for method, params in run.api.requests
+        if method == "sendMessage" and str(params.get("text", "")).startswith(ERROR_REPLY)
+    )
+    return {
+        "processor": name,
+        "state": "remote" if remote else "memory",
+        "updates": run.updates,
+        "updates_per_second": run.updates / elapsed,
+        "problems": run.problems,
+        "order_violations": order_violations(run.api),
+        "error_replies": errors,
+    }
+
+
+async def main(options) -> int:
+    logging.disable(logging.ERROR)
+    names = [options.processor] if options.processor else list(PROCESSORS)
+    results = [await stress(options, name, remote) for name in names for remote in (False, True)]
+
+    print(f"{'processor':<12} {'state':<7} {'updates':>8} {'updates/s':>10} {'invar.':>7} {'order':>7} {'errors':>7}")
+    for result in results:
+        print(f"{result['processor']:<12} {result['state']:<7} {result['updates']:>8} "
+              f"{result['updates_per_second']:>10.0f} {sum(result['problems'].values()):>7} "
+              f"{result['order_violations']:>7} {result['error_replies']:>7}")
+    failed = False
+    for result in results:
+        for problem, count in result["problems"].items():
+            print(f"{result['processor']} ({result['state']} state): {problem} (seen {count}x)")
+        # Only the per-chat processor promises ordering; the others are shown for comparison
+        if result["processor"] != "unordered" and (result["problems"] or result["order_violations"] or result["error_replies"]):
+            failed = True
+    print("FAILED" if failed else "all invariants held")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processor", choices=list(PROCESSORS), help="run only this update processor")
+    parser.add_argument("--waves", type=int, default=WAVES)
+    parser.add_argument("--concurrency", type=int, default=64, help="max_concurrent_updates")
+    parser.add_argument("--seed", type=int, default=1)
+    sys.exit(asyncio.run(main(parser.parse_args())))
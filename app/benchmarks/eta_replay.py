@@ -0,0 +1,268 @@
+"""Replay session logs and check the queue wait estimates against the waits users really had.
+
+The log is the state journal (STATE_DIR/journal.log): every user joining
+the queue, starting a chat and ending it, with wall-clock times. Replaying
+it rebuilds the queue, asks each estimator for the wait of every user at
+the position they joined at, and compares that with when their chat really
+started; chat lengths are fed to the estimators as the chats end, as the
+bot does. Without --journal, a week of a busy help desk is first simulated
+through ChatManager on a simulated clock, with the load and the length of
+chats changing over the day, and its journal is replayed.
+
+Run from the app directory:
+
+    python -m benchmarks.eta_replay
+    python -m benchmarks.eta_replay --journal ../data/state/journal.log --slots 3
+
+A journal only covers what happened since the last snapshot, so replay
+one that started with an empty queue (or several in order) for exact
+positions.
+"""
+import argparse
+import heapq
+import itertools
+import json
+import math
+import random
+import time
+
+from models.chat_manager import ChatManager
+from models.priority_queue import NORMAL, PriorityQueue
+from services.eta import WaitEstimator
+
+# Simulated help desk, in seconds
+SLOTS = 4
+MEAN_CHAT = 300
+DAILY_SWING = 0.6  # chats are this much longer or shorter than the mean at the peak and the trough
+CHAT_SPREAD = 0.8  # sigma of the lognormal chat length
+LOAD = 0.9  # average share of slot time that is busy
+LOAD_SWING = 0.5  # arrivals are this much above or below average at the peak and the trough
+DAY = 86400
+
+POSITION_BANDS = ((1, 1), (2, 5), (6, 20), (21, None))
+
+
+class FixedGuess:
+    """Baseline that assumes every chat takes the same time"""
+
+    def __init__(self, slots: int, seconds: float):
+        self.per_position = seconds / slots
+
+    def record_end(self, duration: float):
+        pass
+
+    def estimate(self, position: int) -> float:
+        return position * self.per_position
+
+
+class SimulatedJournal:
+    """Stands in for the StateStore and keeps the records, stamped with the simulated clock"""
+
+    def __init__(self, now: list):
+        self.now = now
+        self.records = []
+        self._seq = itertools.count(1)
+
+    def record(self, op: str, user: int, **fields):
+        if op == "deadline":
+            return
+        for name in ("since", "started_at", "ended_at"):
+            if name in fields:
+                fields[name] = self.now[0]
+        self.records.append({"seq": next(self._seq), "op": op, "user": user, **fields})
+
+
+def simulate_journal(days: float, seed: int) -> list:
+    """Journal of a simulated help desk whose load and chat lengths follow the time of day"""
+    rng = random.Random(seed)
+    now = [0.0]
+    manager = ChatManager(max_queue_size=1 << 30, chat_timeout=1 << 30, agent_ids=range(1, SLOTS + 1),
+                          clock=lambda: now[0])
+    journal = SimulatedJournal(now)
+    manager.store = journal
+    events = []
+    seq = itertools.count()
+    users = itertools.count(1000)
+    mean_rate = LOAD * SLOTS / MEAN_CHAT
+
+    def push(delay: float, kind: str, data=None):
+        heapq.heappush(events, (now[0] + delay, next(seq), kind, data))
+
+    def phase(offset: float = 0.0) -> float:
+        return math.sin(2 * math.pi * (now[0] / DAY + offset))
+
+    push(rng.expovariate(mean_rate), "arrive")
+    while events:
+        now[0], _, kind, data = heapq.heappop(events)
+        if kind == "arrive":
+            if now[0] < days * DAY:
+                manager.add_user_to_queue(next(users))
+                push(rng.expovariate(mean_rate * (1 + LOAD_SWING * phase())), "arrive")
+        else:
+            manager.end_chat(*data)
+        while True:
+            claimed = manager.claim_next_session()
+            if claimed is None:
+                break
+            # Chats get longer towards the evening, a quarter of a day after the busiest hour
+            mean = MEAN_CHAT * (1 + DAILY_SWING * phase(-0.25))
+            length = rng.lognormvariate(math.log(mean) - CHAT_SPREAD ** 2 / 2, CHAT_SPREAD)
+            push(length, "end", claimed)
+    return journal.records
+
+
+def read_journals(paths) -> list:
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn last line, as StateStore.load skips
+                    continue
+    return records
+
+
+def busiest(records: list) -> int:
+    """Most chats ever running at once in a log, a lower bound on the slots"""
+    running = most = 0
+    active = set()
+    for record in records:
+        if record["op"] == "start":
+            active.add(record["user"])
+        elif record["op"] == "end":
+            active.discard(record["user"])
+        running = len(active)
+        most = max(most, running)
+    return most
+
+
+def replay(records: list, boosts: dict, estimators: dict) -> dict:
+    """(position, predicted, actual) waits per estimator for every user seen joining and starting"""
+    queue = PriorityQueue(boosts)
+    started = {}
+    joined = {}
+    latest = float("-inf")
+    results = {name: [] for name in estimators}
+    for record in records:
+        op = record["op"]
+        user = record["user"]
+        if op == "enqueue":
+            if user in queue or record.get("since") is None:
+                continue
+            # Arrivals must not go backwards; a wall clock stepping back could make them
+            latest = max(latest, record["since"])
+            queue.append(user, record.get("cls") or NORMAL, latest)
+            position = queue.index(user) + 1
+            joined[user] = (latest, position, {name: model.estimate(position) for name, model in estimators.items()})
+        elif op == "dequeue":
+            if user in queue:
+                queue.remove(user)
+            joined.pop(user, None)
+        elif op == "start":
+            if user in queue:
+                queue.remove(user)
+            started[user] = record["started_at"]
+            entry = joined.pop(user, None)
+            if entry is not None:
+                since, position, predictions = entry
+                for name, predicted in predictions.items():
+                    results[name].append((position, predicted, record["started_at"] - since))
+        elif op == "end":
+            started_at = started.pop(user, None)
+            if started_at is not None and record.get("ended_at") is not None:
+                for model in estimators.values():
+                    model.record_end(record["ended_at"] - started_at)
+    return results
+
+
+def summarize(samples: list) -> dict:
+    """Error statistics in seconds over (position, predicted, actual) samples that have a prediction"""
+    known = [(predicted, actual) for _, predicted, actual in samples if predicted is not None]
+    if not known:
+        return {"count": 0, "missing": len(samples)}
+    errors = sorted(abs(predicted - actual) for predicted, actual in known)
+    signed = sorted(predicted - actual for predicted, actual in known)
+    # Close enough for a user: within 30% of the real wait, or within a minute of it
+    close = sum(abs(predicted - actual) <= max(60.0, 0.3 * actual) for predicted, actual in known)
+    return {
+        "count": len(known),
+        "missing": len(samples) - len(known),
+        "p50": errors[len(errors) // 2],
+        "p90": errors[int(len(errors) * 0.9)],
+        "bias": signed[len(signed) // 2],
+        "close": close / len(known),
+    }
+
+
+def print_row(label: str, summary: dict):
+    if not summary["count"]:
+        print(f"{label:<22} {0:>7} {summary['missing']:>8}")
+        return
+    print(f"{label:<22} {summary['count']:>7} {summary['missing']:>8} {summary['p50'] / 60:>9.1f} "
+          f"{summary['p90'] / 60:>9.1f} {summary['bias'] / 60:>+9.1f} {summary['close']:>7.0%}")
+
+
+def parse_boosts(text: str) -> dict:
+    boosts = {}
+    for pair in text.split(","):
+        if pair.strip():
+            name, seconds = pair.split(":")
+            boosts[name.strip()] = float(seconds)
+    return boosts
+
+
+def main(options):
+    if options.journal:
+        records = read_journals(options.journal)
+        slots = options.slots or busiest(records)
+        source = f"{', '.join(options.journal)}: {len(records)} records"
+    else:
+        records = simulate_journal(options.days, options.seed)
+        slots = options.slots or SLOTS
+        source = (f"simulated: {options.days:g} days, {SLOTS} slots {LOAD:.0%} busy, chats of "
+                  f"{MEAN_CHAT / 60:g} min +/-{DAILY_SWING:.0%} over the day; {len(records)} records")
+    print(source)
+
+    estimators = {f"ewma {sessions} chats": WaitEstimator(slots, sessions) for sessions in options.sessions}
+    estimators["all-time mean"] = WaitEstimator(slots, sessions=10 ** 12)
+    estimators[f"fixed {options.guess / 60:g} min"] = FixedGuess(slots, options.guess)
+    results = replay(records, parse_boosts(options.boosts), estimators)
+
+    print(f"\nwait estimate at join vs real wait, {slots} slots; errors in minutes, "
+          f"close = within 30% or a minute")
+    print(f"{'estimator':<22} {'users':>7} {'no est.':>8} {'abs p50':>9} {'abs p90':>9} {'bias p50':>9} {'close':>7}")
+    for name, samples in results.items():
+        print_row(name, summarize(samples))
+
+    shipped = f"ewma {options.sessions[0]} chats"
+    print(f"\n{shipped} by position at join")
+    for low, high in POSITION_BANDS:
+        band = [sample for sample in results[shipped] if sample[0] >= low and (high is None or sample[0] <= high)]
+        print_row(f"position {low}" + ("" if high == low else f"-{high}" if high else "+"), summarize(band))
+
+    model = WaitEstimator(slots, options.sessions[0])
+    start = time.perf_counter()
+    for duration in range(1, options.timed + 1):
+        model.record_end(duration)
+    per_end = (time.perf_counter() - start) / options.timed * 1e9
+    start = time.perf_counter()
+    for position in range(1, options.timed + 1):
+        model.estimate(position)
+    per_estimate = (time.perf_counter() - start) / options.timed * 1e9
+    print(f"\ncost: record_end {per_end:.0f} ns, estimate {per_estimate:.0f} ns")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--journal", nargs="+", help="journal files to replay, oldest first")
+    parser.add_argument("--slots", type=int, help="admins x AGENT_MAX_SESSIONS; default: most chats seen at once")
+    parser.add_argument("--boosts", default="", help="QUEUE_PRIORITY_CLASSES of the logged bot")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[50, 10, 200],
+                        help="ETA_SESSIONS values to compare; the first one is broken down by position")
+    parser.add_argument("--guess", type=float, default=MEAN_CHAT, help="chat length of the fixed baseline")
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--timed", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,123 @@
+"""Measure the inbound flood guard: cost per update, memory and effect on a spammer.
+
+1. RateTable.hit on a steady working set and on a stream of millions of
+   distinct user ids, with a simulated clock; the table's size should stay
+   flat because idle entries are reclaimed.
+2. FloodGuard.check per update, which is what every update pays.
+3. One user spamming text outside a chat through the real handlers, with and
+   without the guard, counting the replies the bot would send.
+
+Run from the app directory:
+
+    python -m benchmarks.flood_benchmark
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+RATE = 1.0
+BURST = 20
+
+os.environ.update({
+    "TELEGRAM_BOT_TOKEN": "123:flood",
+    "ADMIN_USER_ID": "1",
+    "ADMIN_USER_IDS": "1",
+    "STATE_BACKEND": "memory",
+    "STATE_DIR": "",
+    "TRANSCRIPT_DIR": "",
+    "WEBHOOK_URL": "",
+    "FLOOD_RATE": str(RATE),
+    "FLOOD_BURST": str(BURST),
+})
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+import bot  # noqa: E402
+from devtools.fake_bot_api import FakeBotApi, FakeBotRequest, message_update  # noqa: E402
+from services.flood_guard import FloodGuard, RateTable  # noqa: E402
+
+
+def table_steady(users: int, hits: int) -> float:
+    """ns per hit for a working set that fits the table"""
+    table = RateTable(RATE, BURST)
+    now = 0.0
+    step = 1.0 / users
+    start = time.perf_counter()
+    for i in range(hits):
+        now += step
+        table.hit(100_000 + i % users, now)
+    return (time.perf_counter() - start) / hits * 1e9
+
+
+def table_stream(distinct: int, per_second: int):
+    """Every hit comes from a new id; report the table size as ids pile up"""
+    table = RateTable(RATE, BURST)
+    step = 1.0 / per_second
+    checkpoint = distinct // 5
+    start = time.perf_counter()
+    for i in range(distinct):
+        table.hit(1_000_000 + i, i * step)
+        if (i + 1) % checkpoint == 0:
+            print(f"  {i + 1:>9} ids seen: {table.capacity:>7} slots, {table.nbytes / 1024:>7.0f} KiB, "
+                  f"{table.rebuilds} rebuilds")
+    return (time.perf_counter() - start) / distinct * 1e9
+
+
+async def guard_cost(users: int, updates: int) -> float:
+    """µs per FloodGuard.check for updates that are let through"""
+    guard = FloodGuard(RATE, BURST)
+    batch = [Update.de_json(message_update(i, 100_000 + i % users, "halo"), None) for i in range(users)]
+    now = [0.0]
+    guard.clock = lambda: now[0]
+    start = time.perf_counter()
+    for i in range(updates):
+        now[0] += 1.0 / users
+        await guard.check(batch[i % users], None)
+    return (time.perf_counter() - start) / updates * 1e6
+
+
+async def spam(messages: int, guarded: bool) -> dict:
+    bot.state = bot.create_state_backend()
+    bot.flood_guard = FloodGuard(RATE, BURST) if guarded else None
+    api = FakeBotApi()
+    application = (
+        Application.builder()
+        .token(os.environ["TELEGRAM_BOT_TOKEN"])
+        .request(FakeBotRequest(api))
+        .get_updates_request(FakeBotRequest(api))
+        .build()
+    )
+    bot.add_handlers(application)
+    await application.initialize()
+    start = time.perf_counter()
+    for i in range(messages):
+        await application.process_update(Update.de_json(message_update(i + 1, 100_000, "spam"), application.bot))
+    elapsed = time.perf_counter() - start
+    await application.shutdown()
+    return {"replies": api.calls["sendMessage"], "per_update_us": elapsed / messages * 1e6}
+
+
+async def main(options):
+    logging.disable(logging.WARNING)
+    print(f"GCRA {RATE:g}/s per user, burst {BURST}")
+    print(f"table, {options.users} active users:      {table_steady(options.users, options.hits):.0f} ns/hit")
+    print(f"table, {options.distinct} distinct ids at {options.per_second}/s:")
+    print(f"  {table_stream(options.distinct, options.per_second):.0f} ns/hit")
+    print(f"FloodGuard.check:                 {await guard_cost(options.users, options.hits):.2f} µs/update")
+    for guarded in (False, True):
+        result = await spam(options.spam, guarded)
+        print(f"spam of {options.spam} texts, guard {'on ' if guarded else 'off'}: {result['replies']:>5} replies, "
+              f"{result['per_update_us']:.0f} µs/update")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--hits", type=int, default=500_000)
+    parser.add_argument("--distinct", type=int, default=2_000_000)
+    parser.add_argument("--per-second", type=int, default=50_000)
+    parser.add_argument("--spam", type=int, default=1_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,186 @@
+"""Measure cold start and the memory the bot keeps per chat and per queued user.
+
+1. Startup, in fresh processes: the bot's startup profile (see
+   STARTUP_PROFILE) from the top of bot.py to the first update handled,
+   against a fake Bot API and with --queued users to restore from the state
+   directory. Reports the median time of each step over --starts runs.
+2. Memory, with tracemalloc: bytes held by ChatManager per queued user and
+   per running chat (queue, session record, admin slot and armed timeout),
+   and what a session record costs on its own next to the two dicts (admin
+   id, start datetime) it replaces.
+3. Reply markups: building the stop button per message against reusing the
+   prebuilt one.
+
+Run from the app directory:
+
+    python -m benchmarks.footprint_benchmark
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from models.chat_manager import ChatManager, Session
+from services.state_store import StateStore
+
+AGENTS = list(range(1, 11))
+
+# Runs in a fresh interpreter: start the bot the way main() does, minus the network, and hand one update to it
+STARTUP_SCRIPT = """
+import asyncio, json, os
+import bot
+from telegram import Update
+from telegram.ext import Application
+from devtools.fake_bot_api import FakeBotApi, FakeBotRequest, message_update
+
+
+async def run():
+    api = FakeBotApi()
+    application = (
+        Application.builder().token(os.environ["TELEGRAM_BOT_TOKEN"])
+        .request(FakeBotRequest(api)).get_updates_request(FakeBotRequest(api)).build()
+    )
+    bot.startup.mark("application built")
+    bot.add_handlers(application)
+    await application.initialize()
+    await bot.post_init(application)
+    await application.process_update(Update.de_json(message_update(1, 10**9, "/start"), application.bot))
+    await bot.post_shutdown(application)
+    await application.shutdown()
+    print(json.dumps(bot.startup.marks))
+
+asyncio.run(run())
+"""
+
+
+async def write_state(directory: str, queued: int):
+    """A snapshot of `queued` waiting users for the bot to restore"""
+    store = StateStore(directory, compact_every=1)
+    manager = ChatManager(max_queue_size=queued, agent_ids=AGENTS)
+    manager.restore_state(store.load())
+    manager.store = store
+    store.start(manager.export_state)
+    for user_id in range(1_000, 1_000 + queued):
+        manager.add_user_to_queue(user_id)
+    await store.close()
+
+
+def startup_profile(starts: int, queued: int):
+    """Median seconds since the top of bot.py at each step, over `starts` fresh processes"""
+    with tempfile.TemporaryDirectory() as directory:
+        state_dir = os.path.join(directory, "state")
+        asyncio.run(write_state(state_dir, queued))
+        env = dict(
+            os.environ,
+            TELEGRAM_BOT_TOKEN="123:footprint",
+            ADMIN_USER_ID=str(AGENTS[0]),
+            ADMIN_USER_IDS=",".join(map(str, AGENTS)),
+            MAX_QUEUE_SIZE=str(queued * 2),
+            STATE_BACKEND="memory",
+            STATE_DIR=state_dir,
+            TRANSCRIPT_DIR=os.path.join(directory, "transcripts"),
+            WEBHOOK_URL="",
+            METRICS_PORT="0",
+            STARTUP_PROFILE="1",
+        )
+        runs = []
+        for _ in range(starts):
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], env=env, check=True,
+                                    capture_output=True, text=True).stdout
+            runs.append(dict(json.loads(output.splitlines()[-1])))
+    steps = [step for step, _ in json.loads(output.splitlines()[-1])]
+    return [(step, statistics.median(run[step] for run in runs)) for step in steps]
+
+
+def measure(build) -> int:
+    """Bytes still allocated after build() returns, with what it returns kept alive"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def manager_footprint(count: int):
+    """Bytes per queued user, and per chat once they are all claimed"""
+    manager = ChatManager(max_queue_size=count, agent_ids=AGENTS, agent_max_sessions=count // len(AGENTS),
+                          chat_timeout=3600)
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for user_id in range(1_000, 1_000 + count):
+        manager.add_user_to_queue(user_id)
+    queued = tracemalloc.get_traced_memory()[0] - base
+    while manager.claim_next_session():
+        pass
+    chatting = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    assert len(manager.sessions) == count and not manager.user_queue
+    return queued / count, chatting / count
+
+
+def record_footprint(count: int):
+    """Bytes per chat of the session record against the dicts it replaced"""
+    now = time.time()
+
+    def parallel_dicts():
+        admins, starts = {}, {}
+        for user_id in range(1_000, 1_000 + count):
+            admins[user_id] = AGENTS[user_id % len(AGENTS)]
+            starts[user_id] = datetime.fromtimestamp(now)
+        return admins, starts
+
+    def records():
+        return {user_id: Session(AGENTS[user_id % len(AGENTS)], now) for user_id in range(1_000, 1_000 + count)}
+
+    return measure(parallel_dicts) / count, measure(records) / count
+
+
+def markup_cost(rounds: int):
+    """µs per stop button markup built for each message and reused"""
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    from utils.helpers import create_stop_chat_keyboard
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        InlineKeyboardMarkup([[InlineKeyboardButton("❌ Akhiri Obrolan", callback_data="stop_chat")]])
+    built = (time.perf_counter() - start) / rounds * 1e6
+    start = time.perf_counter()
+    for _ in range(rounds):
+        create_stop_chat_keyboard()
+    reused = (time.perf_counter() - start) / rounds * 1e6
+    return built, reused
+
+
+def main(options):
+    print(f"startup, median of {options.starts} processes, {options.queued} queued users to restore")
+    previous = 0.0
+    for step, at in startup_profile(options.starts, options.queued):
+        print(f"  {step:<20} {at * 1000:>8.1f} ms  (+{(at - previous) * 1000:.1f})")
+        previous = at
+
+    per_queued, per_chat = manager_footprint(options.users)
+    print(f"\nChatManager with {options.users} users: {per_queued:.0f} bytes per queued user, "
+          f"{per_chat:.0f} bytes per running chat")
+    old, new = record_footprint(options.users)
+    print(f"session record: {new:.0f} bytes per chat (two dicts with a datetime: {old:.0f})")
+
+    built, reused = markup_cost(options.rounds)
+    print(f"\nstop button markup: {built:.2f} µs built per message, {reused:.2f} µs reused")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--starts", type=int, default=5)
+    parser.add_argument("--queued", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=100_000)
+    main(parser.parse_args())
@@ -0,0 +1,214 @@
+"""Drive simulated users through the bot's handlers and measure them.
+
+Every user goes through /start -> /chat -> queue -> relay -> /stop against the
+real handlers in bot.py, with Bot API calls answered in-process by the fake
+Bot API (optionally slowed down or failing). Outbound rate limiting and the
+flood guard are left out so the numbers reflect the handlers and the state
+backend only. Reports
+throughput, p50/p99 latency per update kind and peak traced memory, and
+compares them with the stored baseline. Run from the app directory:
+
+    python -m benchmarks.handler_benchmark
+    python -m benchmarks.handler_benchmark --latency 0.002 --error-rate 0.01
+    python -m benchmarks.handler_benchmark --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+
+USERS = 3_000
+AGENTS = list(range(1, 11))
+SLOTS = 3
+MESSAGES_PER_SESSION = 3
+QUEUE_CHECKS_PER_ROUND = 20
+BASELINE = Path(__file__).with_name("handler_baseline.json")
+REGRESSION_THRESHOLD = 0.2
+
+# bot.py reads its configuration at import time
+os.environ.update({
+    "TELEGRAM_BOT_TOKEN": "123:benchmark",
+    "ADMIN_USER_ID": str(AGENTS[0]),
+    "ADMIN_USER_IDS": ",".join(str(agent) for agent in AGENTS),
+    "AGENT_MAX_SESSIONS": str(SLOTS),
+    "MAX_QUEUE_SIZE": str(USERS),
+    "CHAT_TIMEOUT": "3600",
+    "STATE_BACKEND": "memory",
+    "STATE_DIR": "",
+    "TRANSCRIPT_DIR": os.environ.get("TRANSCRIPT_DIR", ""),
+    "WEBHOOK_URL": "",
+    # Simulated users send faster than any person would on purpose
+    "FLOOD_RATE": "0",
+})
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, ContextTypes  # noqa: E402
+
+import bot  # noqa: E402
+from devtools.fake_bot_api import FakeBotApi, FakeBotRequest, callback_update, message_update  # noqa: E402
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Simulation:
+    """Feeds updates to one application and times how long each takes to handle"""
+
+    def __init__(self, api: FakeBotApi, seed: int):
+        self.api = api
+        self.random = random.Random(seed)
+        self.application = (
+            Application.builder()
+            .token(os.environ["TELEGRAM_BOT_TOKEN"])
+            .request(FakeBotRequest(api))
+            .get_updates_request(FakeBotRequest(api))
+            .build()
+        )
+        bot.add_handlers(self.application)
+        self.application.add_error_handler(self._on_error)
+        self.latencies = defaultdict(list)
+        self.handler_errors = 0
+        self._update_ids = iter(range(1, 1 << 62))
+
+    async def _on_error(self, update, context):
+        self.handler_errors += 1
+
+    async def send(self, kind: str, data: dict):
+        update = Update.de_json(data, self.application.bot)
+        start = time.perf_counter()
+        await self.application.process_update(update)
+        self.latencies[kind].append(time.perf_counter() - start)
+
+    async def text(self, kind: str, user_id: int, text: str):
+        await self.send(kind, message_update(next(self._update_ids), user_id, text))
+
+    async def press_stop(self, user_id: int):
+        await self.send("callback", callback_update(next(self._update_ids), user_id, "stop_chat"))
+
+    async def serve_agent(self, admin_id: int):
+        """Relay a short conversation for each of an admin's sessions, then end it"""
+        for user_id in await bot.state.get_agent_sessions(admin_id):
+            for i in range(MESSAGES_PER_SESSION):
+                await self.text("relay user", user_id, f"halo {i}")
+                await self.text("relay admin", admin_id, f"balasan {i}")
+            if self.random.random() < 0.5:
+                await self.text("/stop", user_id, "/stop")
+            else:
+                await self.press_stop(user_id)
+
+    async def run(self, users: list):
+        await self.application.initialize()
+        await bot.post_init(self.application)
+        await asyncio.gather(*(self.text("/start", user_id, "/start") for user_id in users))
+        await asyncio.gather(*(self.text("/chat", user_id, "/chat") for user_id in users))
+        while await bot.state.get_queue_size() or any([await bot.state.get_agent_sessions(a) for a in AGENTS]):
+            waiting = self.random.sample(users, min(QUEUE_CHECKS_PER_ROUND, len(users)))
+            await asyncio.gather(
+                *(self.serve_agent(admin_id) for admin_id in AGENTS),
+                *(self.text("/queue", user_id, "/queue") for user_id in waiting),
+            )
+            if not any([await bot.state.get_agent_sessions(a) for a in AGENTS]):
+                # A failed notification can leave claimable users behind; retry like the next /chat would
+                await bot.dispatch_queue(ContextTypes.DEFAULT_TYPE(self.application))
+        await bot.post_stop(self.application)
+        await bot.post_shutdown(self.application)
+        await self.application.shutdown()
+
+
+async def simulate(options, trace_memory: bool) -> dict:
+    bot.state = bot.create_state_backend()
+    api = FakeBotApi(latency=options.latency, error_rate=options.error_rate, seed=options.seed)
+    simulation = Simulation(api, options.seed)
+    users = list(range(100_000, 100_000 + options.users))
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    await simulation.run(users)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else 0
+    if trace_memory:
+        tracemalloc.stop()
+
+    all_latencies = sorted(value for values in simulation.latencies.values() for value in values)
+    return {
+        "updates": len(all_latencies),
+        "elapsed": elapsed,
+        "updates_per_second": len(all_latencies) / elapsed,
+        "p50_ms": percentile(all_latencies, 0.5) * 1000,
+        "p99_ms": percentile(all_latencies, 0.99) * 1000,
+        "kinds": {
+            kind: {
+                "count": len(values),
+                "p50_ms": percentile(sorted(values), 0.5) * 1000,
+                "p99_ms": percentile(sorted(values), 0.99) * 1000,
+            }
+            for kind, values in simulation.latencies.items()
+        },
+        "api_calls": sum(api.calls.values()),
+        "api_errors": sum(api.errors.values()),
+        "handler_errors": simulation.handler_errors,
+        "peak_memory_mb": peak / (1024 * 1024),
+    }
+
+
+def report(result: dict, baseline: dict):
+    def delta(key: str, higher_is_better: bool) -> str:
+        if key not in baseline or not baseline[key]:
+            return ""
+        change = (result[key] - baseline[key]) / baseline[key]
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > REGRESSION_THRESHOLD else ""
+        return f"  ({change:+.0%} vs baseline){flag}"
+
+    print(f"{'update':<14} {'count':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for kind, stats in result["kinds"].items():
+        print(f"{kind:<14} {stats['count']:>7} {stats['p50_ms']:>8.3f} {stats['p99_ms']:>8.3f}")
+    print()
+    print(f"updates handled   {result['updates']} in {result['elapsed']:.2f}s")
+    print(f"throughput        {result['updates_per_second']:.0f} updates/s{delta('updates_per_second', True)}")
+    print(f"latency p50       {result['p50_ms']:.3f} ms{delta('p50_ms', False)}")
+    print(f"latency p99       {result['p99_ms']:.3f} ms{delta('p99_ms', False)}")
+    print(f"peak memory       {result['peak_memory_mb']:.1f} MB{delta('peak_memory_mb', False)}")
+    print(f"Bot API calls     {result['api_calls']} ({result['api_errors']} injected errors, "
+          f"{result['handler_errors']} reached the error handler)")
+
+
+async def main(options):
+    # Per-update logs, and the expected failures under --error-rate, would drown the report
+    logging.disable(logging.ERROR)
+    result = await simulate(options, trace_memory=False)
+    result["peak_memory_mb"] = (await simulate(options, trace_memory=True))["peak_memory_mb"]
+    result["config"] = {
+        "users": options.users, "agents": len(AGENTS), "slots": SLOTS,
+        "latency": options.latency, "error_rate": options.error_rate, "python": platform.python_version(),
+    }
+
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    comparable = ("users", "latency", "error_rate")
+    if any(baseline.get("config", {}).get(key) != result["config"][key] for key in comparable):
+        baseline = {}
+    report(result, baseline)
+    if options.save_baseline:
+        BASELINE.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"Baseline written to {BASELINE}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=USERS)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every Bot API call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of Bot API calls that fail")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,78 @@
+"""Measure how fast one bot process can ingest updates: polling versus webhook.
+
+Starts the local fake Bot API, points an Application at it and delivers the
+same synthetic update stream through getUpdates, through the webhook one
+update per request (as Telegram does) and through the webhook in bulk. The
+handler only counts updates, so the numbers are the ingestion ceiling.
+Run from the app directory:
+
+    python -m benchmarks.ingest_benchmark
+"""
+import asyncio
+import time
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from devtools.fake_bot_api import FakeBotApi, FakeBotApiServer, synthetic_updates
+from services.webhook import WebhookServer
+
+UPDATES = 20_000
+USERS = 1_000
+SECRET = "benchmark-secret"
+
+
+async def run(mode: str, webhook_batch_size: int = 1, connections: int = 8) -> float:
+    server = FakeBotApiServer(FakeBotApi(webhook_batch_size=webhook_batch_size))
+    await server.start()
+    application = Application.builder().token("123:fake").base_url(server.base_url).build()
+    done = asyncio.Event()
+    received = 0
+
+    async def count(update: Update, context):
+        nonlocal received
+        received += 1
+        if received == UPDATES:
+            done.set()
+
+    application.add_handler(TypeHandler(Update, count))
+    await application.initialize()
+    await application.start()
+    webhook = None
+    if mode == "polling":
+        await application.updater.start_polling(poll_interval=0, timeout=1)
+    else:
+        webhook = WebhookServer(application, SECRET, host="127.0.0.1", port=0)
+        await webhook.start()
+        await application.bot.set_webhook(
+            f"http://127.0.0.1:{webhook.port}{webhook.path}", secret_token=SECRET, max_connections=connections
+        )
+
+    start = time.perf_counter()
+    server.api.feed(synthetic_updates(UPDATES, USERS))
+    await asyncio.wait_for(done.wait(), 120)
+    elapsed = time.perf_counter() - start
+
+    if application.updater.running:
+        await application.updater.stop()
+    if webhook is not None:
+        await webhook.stop()
+    await application.stop()
+    await application.shutdown()
+    await server.stop()
+    return UPDATES / elapsed
+
+
+async def main():
+    results = [
+        ("polling (100 per getUpdates)", await run("polling")),
+        ("webhook (1 per request)", await run("webhook", webhook_batch_size=1)),
+        ("webhook (100 per request)", await run("webhook", webhook_batch_size=100)),
+    ]
+    print(f"{'mode':<30} {'updates/s':>10}")
+    for name, rate in results:
+        print(f"{name:<30} {rate:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,266 @@
+"""Show what letting one admin run several chats at once does for the queue.
+
+1. Routing, through the real handlers in bot.py: one admin serves SESSIONS
+   users at once and answers each of them by replying to a message that
+   user sent or to one of its own earlier answers to them, in random
+   order, occasionally writing without a reply (which goes to the user who
+   spoke last). Every admin message must reach the user it was meant for.
+   Once all but one of the chats are over, replies to messages of the
+   users who left must reach nobody, not even the one user left, while a
+   reply to a message the bot never relayed (as after a restart, or on
+   another worker) goes to that user. The reply map must be empty once
+   every chat is over.
+2. Throughput, on a simulated clock driven through ChatManager: users
+   arrive faster than the admins can serve them one at a time. A chat is a
+   few exchanges; between them the user is typing, which is time an admin
+   with a single session spends waiting. With K sessions per admin, the
+   admin answers whichever of their users is waiting. Reports chats served
+   per admin hour, queue waits and chat lengths for several K.
+
+Run from the app directory:
+
+    python -m benchmarks.multiplex_benchmark
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+from collections import deque
+
+ADMIN = 1
+SESSIONS = 4
+
+os.environ.update({
+    "TELEGRAM_BOT_TOKEN": "123:multiplex",
+    "ADMIN_USER_ID": str(ADMIN),
+    "ADMIN_USER_IDS": str(ADMIN),
+    "AGENT_MAX_SESSIONS": str(SESSIONS),
+    "MAX_QUEUE_SIZE": "1000",
+    "CHAT_TIMEOUT": "3600",
+    "STATE_BACKEND": "memory",
+    "STATE_DIR": "",
+    "TRANSCRIPT_DIR": "",
+    "WEBHOOK_URL": "",
+    "FLOOD_RATE": "0",
+    "RELAY_WINDOW": "0",
+})
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+import bot  # noqa: E402
+from devtools.fake_bot_api import FakeBotApi, FakeBotRequest, message_update  # noqa: E402
+from models.chat_manager import ChatManager  # noqa: E402
+from services.reply_router import ReplyRouter  # noqa: E402
+
+# Simulated help desk, in seconds
+EXCHANGES = 4  # user message + admin answer pairs per chat
+MEAN_TYPING = 60  # user composing their next message
+MEAN_ANSWER = 20  # admin reading and answering one message
+
+
+class CopyTrackingApi(FakeBotApi):
+    """Fake Bot API that remembers where each copied message came from and went"""
+
+    def __init__(self):
+        super().__init__()
+        # (chat_id, copy message_id) -> chat the original came from
+        self.copied_from = {}
+        # (from_chat_id, original message_id) -> chat the copy went to
+        self.copied_to = {}
+
+    async def api_copymessage(self, chat_id, from_chat_id=None, message_id=None, **kwargs):
+        copy = await super().api_copymessage(chat_id, **kwargs)
+        self.copied_from[(chat_id, copy["message_id"])] = from_chat_id
+        self.copied_to[(from_chat_id, message_id)] = chat_id
+        return copy
+
+    async def api_copymessages(self, chat_id, message_ids, from_chat_id=None, **kwargs):
+        copies = await super().api_copymessages(chat_id, message_ids, **kwargs)
+        for message_id, copy in zip(message_ids, copies):
+            self.copied_from[(chat_id, copy["message_id"])] = from_chat_id
+            self.copied_to[(from_chat_id, message_id)] = chat_id
+        return copies
+
+
+async def routing_check(rounds: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    bot.state = bot.create_state_backend()
+    bot.replies = ReplyRouter()
+    api = CopyTrackingApi()
+    application = (
+        Application.builder()
+        .token(os.environ["TELEGRAM_BOT_TOKEN"])
+        .request(FakeBotRequest(api))
+        .get_updates_request(FakeBotRequest(api))
+        .build()
+    )
+    bot.add_handlers(application)
+    await application.initialize()
+    await bot.post_init(application)
+    update_ids = itertools.count(1)
+
+    async def send(user_id: int, text: str, reply_to=None) -> int:
+        update_id = next(update_ids)
+        data = message_update(update_id, user_id, text, reply_to=reply_to)
+        await application.process_update(Update.de_json(data, application.bot))
+        return update_id
+
+    users = list(range(100_000, 100_000 + SESSIONS))
+    for user_id in users:
+        await send(user_id, "/chat")
+    expected = {}
+    answered = {}  # user -> admin messages that went to them
+    last_speaker = None
+    for _ in range(rounds):
+        for user_id in rng.sample(users, len(users)):
+            await send(user_id, "pertanyaan")
+            last_speaker = user_id
+        await bot.relay.close()
+        # Messages from users now in the admin's chat, by the user they came from
+        inbox = {}
+        for (chat_id, copy_id), from_chat in api.copied_from.items():
+            if chat_id == ADMIN:
+                inbox.setdefault(from_chat, []).append(copy_id)
+        for user_id in rng.sample(users, len(users)):
+            roll = rng.random()
+            if roll < 0.2:
+                # No reply: goes to whoever the admin's chat last moved to
+                target, reply_to = last_speaker, None
+            elif roll < 0.4 and answered.get(user_id):
+                target, reply_to = user_id, rng.choice(answered[user_id])
+            else:
+                target, reply_to = user_id, rng.choice(inbox[user_id])
+            message_id = await send(ADMIN, "jawaban", reply_to=reply_to)
+            expected[message_id] = target
+            answered.setdefault(target, []).append(message_id)
+            last_speaker = target
+        await bot.relay.close()
+
+    misrouted = sum(api.copied_to.get((ADMIN, message_id)) != target for message_id, target in expected.items())
+    routes_during = len(bot.replies)
+    # Replies to a chat that is over must not fall through to the chat still running
+    *gone, staying = users
+    for user_id in gone:
+        await send(user_id, "/stop")
+    stale = [await send(ADMIN, "jawaban", reply_to=rng.choice(inbox[user_id])) for user_id in gone]
+    await bot.relay.close()
+    stale_relayed = sum((ADMIN, message_id) in api.copied_to for message_id in stale)
+    unknown = await send(ADMIN, "jawaban", reply_to=1 << 40)
+    await bot.relay.close()
+    unknown_placed = api.copied_to.get((ADMIN, unknown)) == staying
+    await send(staying, "/stop")
+    routes_after = len(bot.replies)
+    await bot.post_stop(application)
+    await bot.post_shutdown(application)
+    await application.shutdown()
+    return {"answers": len(expected), "misrouted": misrouted, "stale": len(stale), "stale_relayed": stale_relayed,
+            "unknown_placed": unknown_placed,
+            "routes": routes_during, "routes_after": routes_after}
+
+
+def simulate(admins: int, sessions: int, arrival_rate: float, hours: float, seed: int) -> dict:
+    """Chats served per admin hour and queue waits with `sessions` chats per admin"""
+    rng = random.Random(seed)
+    now = [0.0]
+    agents = list(range(1, admins + 1))
+    manager = ChatManager(max_queue_size=1 << 30, agent_ids=agents, agent_max_sessions=sessions,
+                          chat_timeout=1 << 30, clock=lambda: now[0])
+    events = []
+    seq = itertools.count()
+    users = itertools.count(1000)
+    joined = {}
+    waits = []
+    lengths = []
+    left = {}  # user -> exchanges still to go
+    started = {}
+    # Each admin answers one waiting user at a time, oldest message first
+    inbox = {agent: deque() for agent in agents}
+    answering = {agent: False for agent in agents}
+    served = 0
+    duration = hours * 3600
+
+    def push(delay: float, kind: str, data):
+        heapq.heappush(events, (now[0] + delay, next(seq), kind, data))
+
+    def answer_next(agent: int):
+        if not answering[agent] and inbox[agent]:
+            answering[agent] = True
+            push(rng.expovariate(1 / MEAN_ANSWER), "answered", (agent, inbox[agent].popleft()))
+
+    push(rng.expovariate(arrival_rate), "arrive", None)
+    while events:
+        now[0], _, kind, data = heapq.heappop(events)
+        if now[0] > duration:
+            break
+        if kind == "arrive":
+            user_id = next(users)
+            manager.add_user_to_queue(user_id)
+            joined[user_id] = now[0]
+            push(rng.expovariate(arrival_rate), "arrive", None)
+        elif kind == "message":
+            user_id, agent = data
+            inbox[agent].append(user_id)
+            answer_next(agent)
+        elif kind == "answered":
+            agent, user_id = data
+            answering[agent] = False
+            left[user_id] -= 1
+            if left[user_id]:
+                push(rng.expovariate(1 / MEAN_TYPING), "message", (user_id, agent))
+            else:
+                manager.end_chat(user_id, agent)
+                lengths.append(now[0] - started.pop(user_id))
+                served += 1
+            answer_next(agent)
+
+        while True:
+            claimed = manager.claim_next_session()
+            if claimed is None:
+                break
+            user_id, agent = claimed
+            waits.append(now[0] - joined.pop(user_id))
+            started[user_id] = now[0]
+            left[user_id] = EXCHANGES
+            # The user writes their first message right away
+            push(rng.expovariate(1 / MEAN_TYPING) * 0.25, "message", (user_id, agent))
+    waits.sort()
+    lengths.sort()
+    return {
+        "per_admin_hour": served / admins / hours,
+        "queued": manager.get_queue_size(),
+        "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+        "wait_p90": waits[int(len(waits) * 0.9)] if waits else 0.0,
+        "length_p50": lengths[len(lengths) // 2] if lengths else 0.0,
+    }
+
+
+async def main(options):
+    logging.disable(logging.ERROR)
+    result = await routing_check(options.rounds, options.seed)
+    print(f"routing: 1 admin, {SESSIONS} chats, {result['answers']} admin messages, "
+          f"{result['misrouted']} misrouted; {result['stale_relayed']} of {result['stale']} replies to ended chats "
+          f"relayed; reply to an unknown message {'reached' if result['unknown_placed'] else 'did NOT reach'} "
+          f"the chat left; {result['routes']} routes held, {result['routes_after']} after /stop")
+
+    print(f"\n{options.admins} admins, a user every {60 / (options.arrivals / 60):.0f}s, chats of {EXCHANGES} exchanges "
+          f"({MEAN_TYPING}s typing, {MEAN_ANSWER}s per answer on average), {options.hours:g} simulated hours")
+    print(f"{'chats/admin':>11} {'served/admin h':>15} {'left queued':>12} {'wait p50 min':>13} "
+          f"{'wait p90 min':>13} {'chat p50 min':>13}")
+    for sessions in (1, 2, 3, 5):
+        stats = simulate(options.admins, sessions, options.arrivals / 3600, options.hours, options.seed)
+        print(f"{sessions:>11} {stats['per_admin_hour']:>15.1f} {stats['queued']:>12} "
+              f"{stats['wait_p50'] / 60:>13.1f} {stats['wait_p90'] / 60:>13.1f} {stats['length_p50'] / 60:>13.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--arrivals", type=float, default=90, help="users joining per hour")
+    parser.add_argument("--hours", type=float, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,136 @@
+"""Measure the cost of pushing queue positions to thousands of waiting users.
+
+Fills the queue, tracks a status message for every user and serves the
+queue one user at a time, running a notifier pass after each advance. Reports
+how many messages were edited compared with editing every waiting user on
+every advance, and how long a pass takes. With the per-pass cap, users far
+back whose bucket changed several times get a single edit once their turn
+comes. A last check runs passes against a backend whose lookups yield,
+the way Redis round trips do, while users ask for their position again in
+between, and verifies that every tracked user is left in exactly the bucket
+of their status message. Run from the app directory:
+
+    python -m benchmarks.position_benchmark
+    python -m benchmarks.position_benchmark --users 100000 --advances 50
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from models.chat_manager import ChatManager
+from models.state_backend import InMemoryBackend
+from services.position_notifier import PositionNotifier
+
+USERS = 5_000
+ADVANCES = 1_000
+CHURN_PER_PASS = 50  # users re-tracked while a pass waits on its lookups
+FRONT = 50  # ... picked from this many at the front of the queue
+
+
+class RecordingBot:
+    """Stands in for telegram.Bot and only counts edits"""
+
+    rate_limiter = None
+
+    def __init__(self):
+        self.edits = 0
+
+    async def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        self.edits += 1
+
+
+class YieldingBackend(InMemoryBackend):
+    """InMemoryBackend whose position lookups suspend, as a round trip to Redis does"""
+
+    async def get_user_queue_positions(self, user_ids):
+        await asyncio.sleep(0)
+        return await super().get_user_queue_positions(user_ids)
+
+
+async def run(users: int, advances: int, max_per_pass: int) -> dict:
+    manager = ChatManager(max_queue_size=users)
+    state = InMemoryBackend(manager)
+    notifier = PositionNotifier(top=3, bucket_size=10, max_per_pass=max_per_pass)
+    bot = RecordingBot()
+    for i in range(users):
+        user_id = 100_000 + i
+        manager.add_user_to_queue(user_id)
+        notifier.track(user_id, message_id=i + 1, position=i + 1)
+
+    naive = 0
+    start = time.perf_counter()
+    for _ in range(advances):
+        manager.user_queue.popleft()
+        naive += manager.get_queue_size()
+        await notifier.update(bot, state)
+    return {"edits": bot.edits, "naive": naive, "elapsed": time.perf_counter() - start}
+
+
+def bucket_problems(notifier: PositionNotifier) -> int:
+    """Tracked users missing from their status' bucket, plus bucket members with another or no status"""
+    problems = 0
+    for bucket, members in notifier._buckets.items():
+        problems += sum(1 for user_id in members
+                        if user_id not in notifier._status or notifier._status[user_id].bucket != bucket)
+    problems += sum(1 for user_id, status in notifier._status.items()
+                    if user_id not in notifier._buckets.get(status.bucket, ()))
+    return problems
+
+
+async def churn_check(users: int, advances: int, seed: int) -> dict:
+    """Re-track users near the front while passes wait on lookups; count failed passes and inconsistent buckets"""
+    rng = random.Random(seed)
+    manager = ChatManager(max_queue_size=users)
+    state = YieldingBackend(manager)
+    # Uncapped, so a pass ranks every batch and holds the front users' statuses across all those lookups
+    notifier = PositionNotifier(top=3, bucket_size=10, max_per_pass=users)
+    bot = RecordingBot()
+    for i in range(users):
+        user_id = 100_000 + i
+        manager.add_user_to_queue(user_id)
+        notifier.track(user_id, message_id=i + 1, position=i + 1)
+
+    async def ask_again():
+        # What /queue does: a fresh status message at the user's current position
+        for _ in range(CHURN_PER_PASS):
+            await asyncio.sleep(0)
+            # Near the front, where the users a pass is about to edit are
+            queued = manager.get_queued_users()[:FRONT]
+            if queued:
+                user_id = rng.choice(queued)
+                notifier.track(user_id, rng.randrange(1 << 30), manager.get_user_queue_position(user_id))
+
+    failed = 0
+    for _ in range(advances):
+        manager.user_queue.popleft()
+        results = await asyncio.gather(notifier.update(bot, state), ask_again(), return_exceptions=True)
+        failed += isinstance(results[0], Exception)
+    return {"failed": failed, "problems": bucket_problems(notifier)}
+
+
+async def main(options):
+    print(f"{options.users} waiting users, {options.advances} advances, one pass per advance")
+    print(f"{'strategy':<32} {'edits':>9} {'per advance':>12} {'ms per pass':>12}")
+    unlimited = await run(options.users, options.advances, max_per_pass=options.users)
+    throttled = await run(options.users, options.advances, max_per_pass=20)
+    rows = [
+        ("edit everyone", unlimited["naive"], None),
+        ("bucket boundaries only", unlimited["edits"], unlimited["elapsed"]),
+        ("boundaries, 20 edits per pass", throttled["edits"], throttled["elapsed"]),
+    ]
+    for name, edits, elapsed in rows:
+        ms = f"{elapsed / options.advances * 1000:>12.3f}" if elapsed is not None else f"{'':>12}"
+        print(f"{name:<32} {edits:>9} {edits / options.advances:>12.1f} {ms}")
+
+    churn = await churn_check(options.users, min(options.advances, 200), options.seed)
+    print(f"\nre-tracking {CHURN_PER_PASS} of the first {FRONT} users during each pass: {churn['failed']} passes failed, "
+          f"{churn['problems']} users in the wrong bucket")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=USERS)
+    parser.add_argument("--advances", type=int, default=ADVANCES)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
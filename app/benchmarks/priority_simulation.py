@@ -0,0 +1,162 @@
+"""Simulate the priority queue and report wait-time percentiles per class.
+
+1. A busy help desk on a simulated clock, driven through ChatManager: new
+   users arrive at random (some of them VIPs), chats last a random time and
+   some end by timeout, and many users join again a little later, which
+   puts them in the timed_out or returning class. The same run is repeated
+   with every head start set to zero (plain FIFO), with the configured head
+   starts, and with the head starts but no re-queue cap.
+2. The cost of claiming the next user and of a /queue position lookup in a
+   long mixed queue, with the positions checked against the serving order.
+
+Run from the app directory:
+
+    python -m benchmarks.priority_simulation
+"""
+import argparse
+import heapq
+import itertools
+import random
+import time
+
+from models.chat_manager import ChatManager
+from models.priority_queue import NORMAL, RETURNING, TIMED_OUT, VIP
+
+CLASSES = {VIP: 600, TIMED_OUT: 300, RETURNING: 60}
+AGENTS = list(range(1, 6))
+MEAN_CHAT = 240  # seconds
+TIMED_OUT_SHARE = 0.3
+VIP_SHARE = 0.05
+REJOIN_SHARE = 0.4
+MEAN_REJOIN_DELAY = 120
+MAX_REQUEUES = 3
+LOAD = 0.95  # share of agent time that is busy
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def simulate(boosts: dict, max_requeues: int, duration: float, seed: int) -> dict:
+    """Wait times in seconds per class the users were queued in"""
+    rng = random.Random(seed)
+    now = [0.0]
+    # Rejoins add to the load: every chat is followed by another with probability REJOIN_SHARE
+    arrival_rate = LOAD * len(AGENTS) / MEAN_CHAT * (1 - REJOIN_SHARE)
+    vip_ids = set()
+    manager = ChatManager(
+        max_queue_size=1 << 30,
+        agent_ids=AGENTS,
+        priority_classes=boosts,
+        vip_ids=vip_ids,
+        max_requeues=max_requeues,
+        requeue_window=3600,
+        clock=lambda: now[0],
+    )
+    # The manager copies vip_ids; new VIPs are added to its set as they appear
+    vip_ids = manager.vip_ids
+    events = []
+    seq = itertools.count()
+    new_users = itertools.count(1000)
+    joined = {}
+    waits = {cls: [] for cls in (VIP, TIMED_OUT, RETURNING, NORMAL)}
+
+    heapq.heappush(events, (rng.expovariate(arrival_rate), next(seq), "new", None))
+    while events:
+        now[0], _, kind, data = heapq.heappop(events)
+        if kind == "new":
+            if now[0] < duration:
+                user_id = next(new_users)
+                if rng.random() < VIP_SHARE:
+                    vip_ids.add(user_id)
+                data = user_id
+                heapq.heappush(events, (now[0] + rng.expovariate(arrival_rate), next(seq), "new", None))
+            else:
+                continue
+        if kind in ("new", "rejoin"):
+            if manager.add_user_to_queue(data):
+                joined[data] = (now[0], manager.get_user_priority_class(data))
+        elif kind == "end":
+            user_id, admin_id, timed_out = data
+            manager.end_chat(user_id, admin_id, timed_out)
+            if rng.random() < REJOIN_SHARE and now[0] < duration:
+                delay = rng.expovariate(1 / MEAN_REJOIN_DELAY)
+                heapq.heappush(events, (now[0] + delay, next(seq), "rejoin", user_id))
+
+        while True:
+            claimed = manager.claim_next_session()
+            if claimed is None:
+                break
+            user_id, admin_id = claimed
+            joined_at, cls = joined.pop(user_id)
+            waits[cls].append(now[0] - joined_at)
+            timed_out = rng.random() < TIMED_OUT_SHARE
+            length = rng.expovariate(1 / MEAN_CHAT)
+            heapq.heappush(events, (now[0] + length, next(seq), "end", (user_id, admin_id, timed_out)))
+    return {cls: sorted(values) for cls, values in waits.items()}
+
+
+def queue_costs(size: int, lookups: int, seed: int):
+    """µs per position lookup and per claim in a queue of `size` users of mixed classes"""
+    rng = random.Random(seed)
+    manager = ChatManager(max_queue_size=size, agent_ids=AGENTS, priority_classes=CLASSES)
+    queue = manager.user_queue
+    classes = [VIP, TIMED_OUT, RETURNING, NORMAL]
+    weights = [VIP_SHARE, 0.1, 0.2, 0.65]
+    arrival = 0.0
+    for user_id in range(1000, 1000 + size):
+        arrival += rng.expovariate(1.0)
+        queue.append(user_id, rng.choices(classes, weights)[0], arrival)
+
+    serving_order = list(queue)
+    sample = rng.sample(serving_order, min(lookups, size))
+    start = time.perf_counter()
+    for user_id in sample:
+        manager.get_user_queue_position(user_id)
+    per_lookup = (time.perf_counter() - start) / len(sample) * 1e6
+    positions = {user_id: position for position, user_id in enumerate(serving_order, 1)}
+    assert all(manager.get_user_queue_position(user_id) == positions[user_id] for user_id in sample)
+
+    claims = len(sample)
+    start = time.perf_counter()
+    claimed = [queue.popleft() for _ in range(claims)]
+    per_claim = (time.perf_counter() - start) / claims * 1e6
+    assert claimed == serving_order[:claims]
+    return per_lookup, per_claim
+
+
+def main(options):
+    days = options.days
+    print(f"{len(AGENTS)} admins, {LOAD:.0%} busy, chats of {MEAN_CHAT}s on average, "
+          f"{REJOIN_SHARE:.0%} of users join again; {days:g} simulated days")
+    print(f"head starts: {', '.join(f'{cls} {seconds}s' for cls, seconds in CLASSES.items())}; waits in minutes")
+    print(f"{'queue':<22} {'class':<10} {'users':>7} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7}")
+    runs = (
+        ("fifo", {cls: 0 for cls in CLASSES}, MAX_REQUEUES),
+        ("priority", CLASSES, MAX_REQUEUES),
+        ("priority, no cap", CLASSES, 1 << 30),
+    )
+    for name, boosts, max_requeues in runs:
+        waits = simulate(boosts, max_requeues, days * 86400, options.seed)
+        for cls, values in waits.items():
+            if not values:
+                continue
+            print(f"{name:<22} {cls:<10} {len(values):>7} {percentile(values, 0.5) / 60:>7.1f} "
+                  f"{percentile(values, 0.9) / 60:>7.1f} {percentile(values, 0.99) / 60:>7.1f} "
+                  f"{values[-1] / 60:>7.1f}")
+            name = ""
+
+    for size in options.sizes:
+        per_lookup, per_claim = queue_costs(size, options.lookups, options.seed)
+        print(f"{size:>8} queued: position {per_lookup:.2f} µs, claim {per_claim:.2f} µs")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--lookups", type=int, default=10_000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000])
+    main(parser.parse_args())
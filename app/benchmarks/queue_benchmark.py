@@ -0,0 +1,79 @@
+"""Compare the old deque-backed waiting queue with IndexedQueue.
+
+Run from the app directory:
+
+    python -m benchmarks.queue_benchmark
+"""
+import random
+import time
+from collections import deque
+
+from models.indexed_queue import IndexedQueue
+
+SIZES = (10, 10_000, 100_000)
+OPS = 2_000
+
+
+def _fill(queue, size: int):
+    for user_id in range(size):
+        queue.append(user_id)
+
+
+def _time_per_op(func, ops: int) -> float:
+    start = time.perf_counter()
+    func(ops)
+    return (time.perf_counter() - start) / ops * 1e6
+
+
+def bench(queue_factory, size: int) -> dict:
+    rng = random.Random(size)
+    queue = queue_factory()
+    _fill(queue, size)
+    next_id = size
+
+    def membership(ops):
+        for _ in range(ops):
+            rng.randrange(size) in queue
+
+    def position(ops):
+        for _ in range(ops):
+            user_id = rng.choice(members)
+            queue.index(user_id)
+
+    def remove_middle(ops):
+        # Remove a waiting user and enqueue a new one so the size stays constant
+        nonlocal next_id
+        for _ in range(ops):
+            i = rng.randrange(len(members))
+            queue.remove(members[i])
+            members[i] = next_id
+            queue.append(next_id)
+            next_id += 1
+
+    def dequeue(ops):
+        nonlocal next_id
+        for _ in range(ops):
+            queue.popleft()
+            queue.append(next_id)
+            next_id += 1
+
+    members = list(range(size))
+    return {
+        "membership": _time_per_op(membership, OPS),
+        "position": _time_per_op(position, OPS),
+        "remove_middle": _time_per_op(remove_middle, OPS),
+        "dequeue": _time_per_op(dequeue, OPS),
+    }
+
+
+def main():
+    print(f"{'size':>8} {'operation':<14} {'deque us/op':>12} {'indexed us/op':>14} {'speedup':>8}")
+    for size in SIZES:
+        old = bench(deque, size)
+        new = bench(IndexedQueue, size)
+        for op in old:
+            print(f"{size:>8} {op:<14} {old[op]:>12.2f} {new[op]:>14.2f} {old[op] / new[op]:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
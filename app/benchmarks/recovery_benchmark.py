@@ -0,0 +1,80 @@
+"""Measure how long a restart takes to rebuild state from snapshot + journal.
+
+Writes a snapshot of a large queue, then a journal tail of mixed mutations,
+and times StateStore.load() plus ChatManager.restore_state(). Run from the
+app directory:
+
+    python -m benchmarks.recovery_benchmark
+"""
+import asyncio
+import random
+import tempfile
+import time
+
+from models.chat_manager import ChatManager
+from services.state_store import StateStore
+
+CASES = (
+    # (queued users in snapshot, journal records after it)
+    (1_000, 1_000),
+    (10_000, 10_000),
+    (50_000, 50_000),
+)
+AGENTS = list(range(1, 11))
+
+
+def new_manager(queue_size: int) -> ChatManager:
+    return ChatManager(max_queue_size=queue_size * 2, agent_ids=AGENTS, agent_max_sessions=3)
+
+
+async def write_state(directory: str, queued: int, records: int):
+    store = StateStore(directory, compact_every=queued)
+    manager = new_manager(queued)
+    manager.restore_state(store.load())
+    manager.store = store
+    store.start(manager.export_state)
+    for user_id in range(queued):
+        manager.add_user_to_queue(1_000 + user_id)
+    # Force the snapshot, then build the journal tail from here
+    await store.flush()
+    store.compact_every = records * 10
+    rng = random.Random(queued)
+    next_user = 1_000 + queued
+    for i in range(records):
+        op = rng.random()
+        if op < 0.3:
+            manager.add_user_to_queue(next_user)
+            next_user += 1
+        elif op < 0.5:
+            manager.claim_next_session()
+        elif op < 0.7 and manager.sessions:
+            user_id = next(iter(manager.sessions))
+            manager.end_chat(user_id, manager.sessions[user_id].admin_id)
+        elif manager.sessions:
+            manager.reset_timeout(rng.choice(list(manager.sessions)))
+        if i % 500 == 0:
+            # Let batches be cut at realistic sizes
+            await store.flush()
+    await store.close()
+    return manager.export_state()
+
+
+async def main():
+    print(f"{'queued':>8} {'journal':>8} {'load ms':>8} {'restore ms':>11} {'total ms':>9}")
+    for queued, records in CASES:
+        with tempfile.TemporaryDirectory() as directory:
+            expected = await write_state(directory, queued, records)
+            start = time.perf_counter()
+            state = StateStore(directory).load()
+            loaded = time.perf_counter()
+            manager = new_manager(queued)
+            manager.restore_state(state)
+            restored = time.perf_counter()
+            # Waiting times are converted between clocks, so compare the order only
+            assert [entry[0] for entry in manager.export_state()["queue"]] == [entry[0] for entry in expected["queue"]]
+            print(f"{queued:>8} {records:>8} {(loaded - start) * 1000:>8.1f} "
+                  f"{(restored - loaded) * 1000:>11.1f} {(restored - start) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
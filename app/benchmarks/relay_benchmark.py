@@ -0,0 +1,222 @@
+"""Compare relaying every message on its own with coalesced bulk copies.
+
+Users in active chats send albums and short bursts of text, and their
+admins answer, all through the real handlers in bot.py. Bot API requests
+go through the outbound dispatcher with Telegram's rate limits, so the
+per-chat limit on a busy admin's chat decides how fast messages get there.
+To keep the run short, every rate and the relay window are sped up SPEEDUP
+times and the reported delivery times are scaled back to real seconds.
+First, a batch holding a message the Bot API refuses to copy must still
+deliver all the others, in order, and edited messages must not be relayed.
+Run from the app directory:
+
+    python -m benchmarks.relay_benchmark
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+AGENTS = list(range(1, 11))
+SLOTS = 3
+ROUNDS = 3
+ALBUM = 4
+TEXTS = 2
+REPLIES = 2
+SPEEDUP = 20
+WINDOW = 0.3
+
+os.environ.update({
+    "TELEGRAM_BOT_TOKEN": "123:relay",
+    "ADMIN_USER_ID": str(AGENTS[0]),
+    "ADMIN_USER_IDS": ",".join(str(agent) for agent in AGENTS),
+    "AGENT_MAX_SESSIONS": str(SLOTS),
+    "MAX_QUEUE_SIZE": "1000",
+    "CHAT_TIMEOUT": "3600",
+    "STATE_BACKEND": "memory",
+    "STATE_DIR": "",
+    "TRANSCRIPT_DIR": "",
+    "WEBHOOK_URL": "",
+    # Both send faster than any person would on purpose
+    "FLOOD_RATE": "0",
+})
+
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+import bot  # noqa: E402
+from devtools.fake_bot_api import ApiError, FakeBotApi, FakeBotRequest, media_update, message_update  # noqa: E402
+from services.outbound import OutboundDispatcher  # noqa: E402
+from services.relay import RelayBuffer  # noqa: E402
+
+
+class RefusingApi(FakeBotApi):
+    """Fake Bot API that will not copy one message, as for a message its sender deleted"""
+
+    def __init__(self, refused: int):
+        super().__init__()
+        self.refused = refused
+        # Ids of the messages copied, in the order they were
+        self.copied = []
+
+    async def api_copymessage(self, chat_id, message_id=None, **kwargs):
+        if int(message_id) == self.refused:
+            raise ApiError(400, "Bad Request: message to copy not found")
+        self.copied.append(int(message_id))
+        return await super().api_copymessage(chat_id, **kwargs)
+
+    async def api_copymessages(self, chat_id, message_ids, **kwargs):
+        if self.refused in map(int, message_ids):
+            raise ApiError(400, "Bad Request: message to copy not found")
+        self.copied.extend(map(int, message_ids))
+        return await super().api_copymessages(chat_id, message_ids, **kwargs)
+
+
+async def split_check(burst: int) -> dict:
+    """Relay a burst with one uncopyable message in it, then an edit of a relayed message"""
+    bot.state = bot.create_state_backend()
+    bot.relay = RelayBuffer(window=WINDOW / SPEEDUP)
+    refused = 1_000 + burst // 2
+    api = RefusingApi(refused)
+    application = (
+        Application.builder()
+        .token(os.environ["TELEGRAM_BOT_TOKEN"])
+        .request(FakeBotRequest(api))
+        .get_updates_request(FakeBotRequest(api))
+        .build()
+    )
+    bot.add_handlers(application)
+    errors = []
+
+    async def on_error(update, context):
+        errors.append(context.error)
+
+    application.add_error_handler(on_error)
+    await application.initialize()
+    await bot.post_init(application)
+    failed = []
+
+    async def finished(from_chat_id, to_chat_id, messages, error, copied_ids):
+        if error is not None:
+            failed.extend(message.message_id for message in messages)
+
+    bot.relay.start(application.bot, finished)
+    user_id = 100_000
+    await application.process_update(Update.de_json(message_update(1, user_id, "/chat"), application.bot))
+    for message_id in range(1_000, 1_000 + burst):
+        data = message_update(message_id, user_id, f"pesan {message_id}", message_id=message_id)
+        await application.process_update(Update.de_json(data, application.bot))
+    await bot.relay.close()
+    edited = message_update(burst + 1, user_id, "pesan diubah", message_id=1_000)
+    edited["edited_message"] = edited.pop("message")
+    calls_before = sum(api.calls.values())
+    await application.process_update(Update.de_json(edited, application.bot))
+    await bot.relay.close()
+    edit_calls = sum(api.calls.values()) - calls_before
+
+    await bot.post_stop(application)
+    await bot.post_shutdown(application)
+    await application.shutdown()
+    expected = [message_id for message_id in range(1_000, 1_000 + burst) if message_id != refused]
+    return {"delivered": api.copied == expected, "failed": failed, "refused": refused,
+            "calls": api.calls["copyMessage"] + api.calls["copyMessages"], "edit_calls": edit_calls,
+            "errors": len(errors)}
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run(max_batch: int) -> dict:
+    bot.state = bot.create_state_backend()
+    bot.relay = RelayBuffer(window=WINDOW / SPEEDUP, max_batch=max_batch)
+    api = FakeBotApi()
+    dispatcher = OutboundDispatcher(global_rate=30 * SPEEDUP, chat_rate=1 * SPEEDUP)
+    application = (
+        Application.builder()
+        .token(os.environ["TELEGRAM_BOT_TOKEN"])
+        .request(FakeBotRequest(api))
+        .get_updates_request(FakeBotRequest(api))
+        .rate_limiter(dispatcher)
+        .build()
+    )
+    bot.add_handlers(application)
+    await application.initialize()
+    await bot.post_init(application)
+
+    update_ids = iter(range(1, 1 << 62))
+    arrived = {}
+    delivered = {}
+
+    async def finished(from_chat_id, to_chat_id, messages, error, copied_ids):
+        now = time.perf_counter()
+        for message in messages:
+            delivered[(from_chat_id, message.message_id)] = now
+
+    bot.relay.start(application.bot, finished)
+
+    async def send(data: dict):
+        update = Update.de_json(data, application.bot)
+        arrived[(update.effective_user.id, update.effective_message.message_id)] = time.perf_counter()
+        await application.process_update(update)
+
+    users = list(range(100_000, 100_000 + len(AGENTS) * SLOTS))
+    for user_id in users:
+        await send(message_update(next(update_ids), user_id, "/chat"))
+    # Session start notices are not what is measured
+    while dispatcher.queue_depth:
+        await asyncio.sleep(0.01)
+    calls_before = sum(api.calls.values())
+
+    start = time.perf_counter()
+    for round_number in range(ROUNDS):
+        for user_id in users:
+            album = f"album-{user_id}-{round_number}"
+            for i in range(ALBUM):
+                await send(media_update(next(update_ids), user_id, album, caption="bukti" if i == 0 else None))
+            for i in range(TEXTS):
+                await send(message_update(next(update_ids), user_id, f"pesan {i}"))
+            admin_id = await bot.state.get_active_chat_partner(user_id)
+            for i in range(REPLIES):
+                await send(message_update(next(update_ids), admin_id, f"balasan {i}"))
+            await asyncio.sleep(0.001)
+    await bot.relay.close()
+    elapsed = time.perf_counter() - start
+    calls = sum(api.calls.values()) - calls_before
+
+    await bot.post_stop(application)
+    await bot.post_shutdown(application)
+    await application.shutdown()
+
+    latencies = sorted((delivered[key] - arrived[key]) * SPEEDUP for key in delivered)
+    return {
+        "messages": len(delivered),
+        "calls": calls,
+        "elapsed": elapsed * SPEEDUP,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+    }
+
+
+async def main(options):
+    logging.disable(logging.ERROR)
+    check = await split_check(burst=9)
+    print(f"burst of 9 with message {check['refused']} refused: others delivered once and in order: "
+          f"{check['delivered']}; failed: {check['failed']}; {check['calls']} copy calls")
+    print(f"edit of a relayed message: {check['edit_calls']} Bot API calls; {check['errors']} handler errors\n")
+    print(f"{len(AGENTS)} admins x {SLOTS} chats, {ROUNDS} rounds of a {ALBUM}-photo album, "
+          f"{TEXTS} texts and {REPLIES} replies; times in real-rate seconds")
+    print(f"{'relay':<12} {'messages':>9} {'API calls':>10} {'all sent s':>11} {'p50 s':>7} {'p99 s':>7}")
+    for name, max_batch in (("per-message", 1), ("coalesced", options.max_batch)):
+        result = await run(max_batch)
+        print(f"{name:<12} {result['messages']:>9} {result['calls']:>10} {result['elapsed']:>11.1f} "
+              f"{result['p50']:>7.2f} {result['p99']:>7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-batch", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,96 @@
+"""Measure the /stats aggregates: cost per event, cost of a snapshot and memory over time.
+
+Feeds LiveStats months of simulated joins, chat starts and ends on a
+simulated clock, then reports nanoseconds per event, microseconds per
+snapshot (what /stats pays), the memory held by the aggregates as events
+pile up, and the sketch's quantiles against exact ones. Run from the app
+directory:
+
+    python -m benchmarks.stats_benchmark
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from services.live_stats import LiveStats
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def exact_quantile(sorted_values, q: float) -> float:
+    return sorted_values[int(q * (len(sorted_values) - 1))]
+
+
+def feed(stats: LiveStats, now: list, rng: random.Random, chats: int, waits: list, sessions: list):
+    """One join, start and end per chat, a chat every 20 seconds on average"""
+    for _ in range(chats):
+        now[0] += rng.expovariate(1 / 20)
+        wait = rng.lognormvariate(4, 1.2)
+        session = rng.lognormvariate(5, 0.8)
+        stats.record_join()
+        stats.record_start(wait)
+        stats.record_end(session, timed_out=rng.random() < 0.2)
+        waits.append(wait)
+        sessions.append(session)
+
+
+class _Null:
+    """Stand-in with the same calls as LiveStats that does nothing"""
+
+    def record_join(self):
+        pass
+
+    def record_start(self, wait=None):
+        pass
+
+    def record_end(self, duration=None, timed_out=False):
+        pass
+
+
+def main(options):
+    rng = random.Random(options.seed)
+    now = [0.0]
+    waits, sessions = [], []
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    stats = LiveStats(clock=lambda: now[0])
+    print(f"{'chats':>10} {'simulated days':>15} {'stats KiB':>10}")
+    step = options.chats // 5
+    for done in range(step, options.chats + 1, step):
+        feed(stats, now, rng, step, [], [])
+        print(f"{done:>10} {now[0] / 86400:>15.1f} {(tracemalloc.get_traced_memory()[0] - baseline) / 1024:>10.1f}")
+    tracemalloc.stop()
+
+    stats = LiveStats(clock=lambda: now[0])
+    start = time.perf_counter()
+    feed(stats, now, rng, options.timed, waits, sessions)
+    elapsed = time.perf_counter() - start
+    # feed() also draws the random values; take that out
+    start = time.perf_counter()
+    feed(_Null(), now, rng, options.timed, [], [])
+    overhead = time.perf_counter() - start
+    print(f"record: {(elapsed - overhead) / (options.timed * 3) * 1e9:.0f} ns per event")
+
+    start = time.perf_counter()
+    for _ in range(options.snapshots):
+        stats.snapshot()
+    print(f"snapshot: {(time.perf_counter() - start) / options.snapshots * 1e6:.1f} µs")
+
+    snapshot = stats.snapshot()
+    for name, values, estimates in (("wait", waits, snapshot["waits"]), ("session", sessions, snapshot["sessions"])):
+        values.sort()
+        for q, estimate in zip(QUANTILES, estimates):
+            exact = exact_quantile(values, q)
+            print(f"{name:<8} p{q * 100:g}: exact {exact:>8.1f}s  sketch {estimate:>8.1f}s  "
+                  f"error {abs(estimate - exact) / exact:.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chats", type=int, default=500_000)
+    parser.add_argument("--timed", type=int, default=200_000)
+    parser.add_argument("--snapshots", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+"""Compare per-message asyncio timeout tasks with the shared TimeoutScheduler.
+
+The scheduler runs against a fake clock, so expiry is measured without real
+sleeps. Run from the app directory:
+
+    python -m benchmarks.timeout_benchmark
+"""
+import asyncio
+import random
+import time
+
+from models.timeout_scheduler import TimeoutScheduler
+
+SESSIONS = (10, 1_000, 10_000)
+MESSAGES = 50_000
+TIMEOUT = 300
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def bench_tasks(sessions: int) -> float:
+    """Old approach: cancel the session's sleep task and create a new one per message"""
+    async def sleeper():
+        try:
+            await asyncio.sleep(TIMEOUT)
+        except asyncio.CancelledError:
+            pass
+
+    rng = random.Random(sessions)
+    tasks = {user_id: asyncio.create_task(sleeper()) for user_id in range(sessions)}
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    for _ in range(MESSAGES):
+        user_id = rng.randrange(sessions)
+        tasks[user_id].cancel()
+        tasks[user_id] = asyncio.create_task(sleeper())
+        # Let the loop run the cancellations, as it would between updates
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    for task in tasks.values():
+        task.cancel()
+    await asyncio.gather(*tasks.values())
+    return elapsed / MESSAGES * 1e6
+
+
+async def bench_scheduler(sessions: int) -> float:
+    """New approach: reset only rewrites the deadline"""
+    rng = random.Random(sessions)
+    clock = FakeClock()
+    scheduler = TimeoutScheduler(TIMEOUT, clock=clock)
+    for user_id in range(sessions):
+        scheduler.arm(user_id, 0)
+    start = time.perf_counter()
+    for _ in range(MESSAGES):
+        clock.now += 0.001
+        scheduler.reset(rng.randrange(sessions))
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    return elapsed / MESSAGES * 1e6
+
+
+async def bench_expiry(sessions: int) -> float:
+    """Time for one ticker pass to fire every session after the clock jumps past the timeout"""
+    clock = FakeClock()
+    scheduler = TimeoutScheduler(TIMEOUT, clock=clock)
+    fired = 0
+
+    async def on_expired(user_id, admin_id):
+        nonlocal fired
+        fired += 1
+
+    for user_id in range(sessions):
+        scheduler.arm(user_id, 0)
+        clock.now += 0.01
+        scheduler.reset(user_id)
+    clock.now += TIMEOUT + 1
+    start = time.perf_counter()
+    await scheduler.fire_expired(on_expired)
+    await scheduler.wait_fired()
+    elapsed = time.perf_counter() - start
+    assert fired == sessions
+    return elapsed / sessions * 1e6
+
+
+async def main():
+    print(f"{'sessions':>8} {'task reset us/msg':>18} {'scheduler reset us/msg':>23} {'expiry us/session':>18}")
+    for sessions in SESSIONS:
+        old = await bench_tasks(sessions)
+        new = await bench_scheduler(sessions)
+        expiry = await bench_expiry(sessions)
+        print(f"{sessions:>8} {old:>18.2f} {new:>23.2f} {expiry:>18.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""Measure the transcript store: recording cost, /history reads and startup.
+
+Records relayed messages for many users into small segments so that most
+of them end up rotated and compressed, then reads each user's recent
+history, reopens the store and reads again. Run from the app directory:
+
+    python -m benchmarks.transcript_benchmark
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from services.transcripts import TranscriptStore
+from utils.constants import TO_ADMIN, TO_USER
+
+MESSAGES = 200_000
+USERS = 2_000
+SEGMENT_SIZE = 1024 * 1024
+HISTORY = 50
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+async def read_histories(store: TranscriptStore, users) -> float:
+    start = time.perf_counter()
+    for user_id in users:
+        entries = await store.history(user_id, HISTORY)
+        assert entries and all(entry.user_id == user_id for entry in entries)
+    return (time.perf_counter() - start) / len(users)
+
+
+async def main():
+    directory = tempfile.mkdtemp(prefix="transcripts-")
+    rng = random.Random(7)
+    store = TranscriptStore(directory, segment_size=SEGMENT_SIZE)
+    await store.start()
+
+    recording = 0.0
+    raw_bytes = 0
+    for i in range(MESSAGES):
+        user_id = 100_000 + rng.randrange(USERS)
+        words = (rng.choice(("halo", "admin", "tolong", "akun", "terima kasih")) for _ in range(8))
+        text = f"Pesan nomor {i}: " + " ".join(words)
+        raw_bytes += len(text)
+        start = time.perf_counter()
+        store.record(user_id, 1, TO_ADMIN if i % 2 else TO_USER, i, text)
+        recording += time.perf_counter() - start
+        if i % 10_000 == 0:
+            # Let the writer run, as it would between updates
+            await asyncio.sleep(0)
+    await store.flush()
+    sample = rng.sample(range(100_000, 100_000 + USERS), 200)
+    warm = await read_histories(store, sample)
+    await store.close()
+
+    start = time.perf_counter()
+    reopened = TranscriptStore(directory, segment_size=SEGMENT_SIZE)
+    await reopened.start()
+    load = time.perf_counter() - start
+    cold = await read_histories(reopened, sample)
+    await reopened.close()
+
+    segments = [name for name in os.listdir(directory) if name.startswith("0")]
+    compressed = [name for name in segments if name.endswith(".segz")]
+    print(f"{MESSAGES} messages from {USERS} users, {len(segments)} segments ({len(compressed)} compressed)")
+    print(f"record()                  {recording / MESSAGES * 1e6:>8.2f} us per message on the event loop")
+    print(f"history, last {HISTORY}        {warm * 1000:>8.3f} ms (before compression)")
+    print(f"history, last {HISTORY}        {cold * 1000:>8.3f} ms (compressed, after reopening)")
+    print(f"reopen with saved index   {load * 1000:>8.1f} ms")
+    print(f"on disk                   {directory_size(directory) / 1e6:>8.1f} MB for {raw_bytes / 1e6:.1f} MB of text")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,20 +1,93 @@
-import os
+from utils.startup_profile import StartupProfile
+
+# Started before any other import, so the profile covers them
+startup = StartupProfile()
+
 import asyncio
-from datetime import datetime
-from dotenv import load_dotenv
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes
+import functools
+import signal
+from typing import Optional
+from telegram import Update
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, filters, CallbackQueryHandler, ContextTypes, TypeHandler
+)
 import logging
 
-from config.settings import BOT_TOKEN, ADMIN_USER_ID, CHAT_TIMEOUT
+startup.mark("telegram imported")
+
+from config.settings import (
+    BOT_TOKEN,
+    ADMIN_USER_IDS,
+    AGENT_MAX_SESSIONS,
+    AGENT_DISPATCH_STRATEGY,
+    CHAT_TIMEOUT,
+    MAX_QUEUE_SIZE,
+    QUEUE_PRIORITY_CLASSES,
+    VIP_USER_IDS,
+    QUEUE_MAX_REQUEUES,
+    QUEUE_REQUEUE_WINDOW,
+    CONCURRENT_UPDATES,
+    REPLY_ROUTES,
+    RELAY_WINDOW,
+    FLOOD_RATE,
+    FLOOD_BURST,
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_CHAT_RATE,
+    OUTBOUND_MAX_QUEUE,
+    OUTBOUND_MAX_RETRIES,
+    STATE_DIR,
+    STATE_FLUSH_INTERVAL,
+    STATE_COMPACT_EVERY,
+    STATE_BACKEND,
+    REDIS_URL,
+    REDIS_PREFIX,
+    TIMEOUT_LEASE_TTL,
+    WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    METRICS_PORT,
+    METRICS_LISTEN,
+    POSITION_TOP,
+    POSITION_BUCKET_SIZE,
+    POSITION_UPDATE_INTERVAL,
+    POSITION_UPDATES_PER_PASS,
+    STATS_WINDOW,
+    STATS_RATE_TAU,
+    ETA_SESSIONS,
+    STARTUP_PROFILE,
+    TRANSCRIPT_DIR,
+    TRANSCRIPT_SEGMENT_MB,
+    TRANSCRIPT_RETENTION_DAYS,
+    TRANSCRIPT_MAX_MB,
+)
 from models.chat_manager import ChatManager
-from utils.helpers import create_stop_chat_keyboard, format_chat_ended_message
+from models.metered_backend import MeteredBackend
+from models.state_backend import InMemoryBackend, StateBackend
+from services.flood_guard import FloodGuard
+from services.eta import WaitEstimator
+from services.live_stats import LiveStats
+from services.metrics import ACTIVE_SESSIONS, OUTBOUND_QUEUE_DEPTH, QUEUE_DEPTH, MetricsServer, timed_handler
+from services.outbound import OutboundDispatcher
+from services.position_notifier import PositionNotifier
+from services.relay import RelayBuffer
+from services.reply_router import ReplyRouter
+from services.state_store import StateStore
+from services.transcripts import TranscriptStore
+from services.update_processor import ChatSerializedProcessor
+from utils.constants import TO_ADMIN, TO_USER
+from utils.helpers import (
+    create_stop_chat_keyboard, create_stop_session_keyboard, describe_message, format_chat_ended_message
+)
 from handlers.command_handlers import (
     handle_start_command, 
     handle_queue_command, 
     handle_chat_command, 
     handle_stop_command,
-    handle_help_command
+    handle_help_command,
+    handle_history_command,
+    handle_stats_command,
 )
 from handlers.message_handlers import handle_message
 from handlers.callback_handlers import handle_callback_query
@@ -24,16 +97,104 @@ logging.basicConfig(
     level=logging.INFO
 )
 logger = logging.getLogger(__name__)
+startup.mark("modules imported")
+
+# Rolling aggregates behind /stats, fed by the state backend
+stats = LiveStats(window=STATS_WINDOW, tau=STATS_RATE_TAU)
+
+# Estimated queue waits, learned from the length of chats as they end
+eta = (
+    WaitEstimator(slots=len(ADMIN_USER_IDS) * AGENT_MAX_SESSIONS, sessions=ETA_SESSIONS)
+    if ETA_SESSIONS > 0 else None
+)
+
+
+def create_state_backend() -> StateBackend:
+    """Build the queue/session state backend selected by STATE_BACKEND, with metrics"""
+    if STATE_BACKEND == "redis":
+        # Only needed with Redis; imported here so the default setup does not load them
+        from models.redis_backend import RedisBackend
+        from services.resp_client import RespClient
+        return MeteredBackend(RedisBackend(
+            RespClient.from_url(REDIS_URL),
+            agent_ids=ADMIN_USER_IDS,
+            agent_max_sessions=AGENT_MAX_SESSIONS,
+            dispatch_strategy=AGENT_DISPATCH_STRATEGY,
+            max_queue_size=MAX_QUEUE_SIZE,
+            chat_timeout=CHAT_TIMEOUT,
+            prefix=REDIS_PREFIX,
+            lease_ttl=TIMEOUT_LEASE_TTL,
+            priority_classes=QUEUE_PRIORITY_CLASSES,
+            vip_ids=VIP_USER_IDS,
+            max_requeues=QUEUE_MAX_REQUEUES,
+            requeue_window=QUEUE_REQUEUE_WINDOW,
+        ), stats, eta)
+    chat_manager = ChatManager(
+        max_queue_size=MAX_QUEUE_SIZE,
+        chat_timeout=CHAT_TIMEOUT,
+        agent_ids=ADMIN_USER_IDS,
+        agent_max_sessions=AGENT_MAX_SESSIONS,
+        dispatch_strategy=AGENT_DISPATCH_STRATEGY,
+        priority_classes=QUEUE_PRIORITY_CLASSES,
+        vip_ids=VIP_USER_IDS,
+        max_requeues=QUEUE_MAX_REQUEUES,
+        requeue_window=QUEUE_REQUEUE_WINDOW,
+    )
+    state_store = (
+        StateStore(STATE_DIR, flush_interval=STATE_FLUSH_INTERVAL, compact_every=STATE_COMPACT_EVERY)
+        if STATE_DIR else None
+    )
+    return MeteredBackend(InMemoryBackend(chat_manager, state_store), stats, eta)
+
+
+# Initialize chat state
+state = create_state_backend()
+
+# Every Bot API request goes through the outbound dispatcher (see Application.builder().rate_limiter)
+outbound = OutboundDispatcher(
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    chat_rate=OUTBOUND_CHAT_RATE,
+    max_queue=OUTBOUND_MAX_QUEUE,
+    max_retries=OUTBOUND_MAX_RETRIES,
+)
+
+# Pushes queue position changes to waiting users so they need not poll /queue
+positions = PositionNotifier(
+    top=POSITION_TOP,
+    bucket_size=POSITION_BUCKET_SIZE,
+    interval=POSITION_UPDATE_INTERVAL,
+    max_per_pass=POSITION_UPDATES_PER_PASS,
+    eta=eta,
+)
+
+# Drops updates from users who flood the bot before any handler can reply to them
+flood_guard = (
+    FloodGuard(rate=FLOOD_RATE, burst=FLOOD_BURST, exempt=lambda user_id: user_id in ADMIN_USER_IDS)
+    if FLOOD_RATE > 0 else None
+)
 
-load_dotenv()
+# Relayed messages are copied in bulk per sender/recipient pair
+relay = RelayBuffer(window=RELAY_WINDOW)
 
-# Initialize chat manager
-chat_manager = ChatManager(chat_timeout=CHAT_TIMEOUT)
+# Which user each message in an admin's chat belongs to, so admins with several sessions answer by replying
+replies = ReplyRouter(capacity=REPLY_ROUTES)
 
-async def start_chat_with_user(user_id: int, context: ContextTypes.DEFAULT_TYPE):
-    """Start a chat session with a user"""
-    chat_manager.start_chat(user_id, ADMIN_USER_ID)
+# Record of every relayed message, for /history
+transcripts = (
+    TranscriptStore(
+        TRANSCRIPT_DIR,
+        segment_size=int(TRANSCRIPT_SEGMENT_MB * 1024 * 1024),
+        retention_days=TRANSCRIPT_RETENTION_DAYS,
+        max_bytes=int(TRANSCRIPT_MAX_MB * 1024 * 1024),
+    )
+    if TRANSCRIPT_DIR else None
+)
+
+metrics_server = None
+startup.mark("objects built")
 
+async def start_chat_with_user(user_id: int, admin_id: int, context: ContextTypes.DEFAULT_TYPE):
+    """Notify both sides of a chat session that was just started"""
     keyboard = create_stop_chat_keyboard()
     
     try:
@@ -42,26 +203,44 @@ async def start_chat_with_user(user_id: int, context: ContextTypes.DEFAULT_TYPE)
             text="Kamu sekarang terhubung dengan admin. Silakan kirim pesan.", 
             reply_markup=keyboard
         )
-        await context.bot.send_message(
-            chat_id=ADMIN_USER_ID, 
-            text=f"User {user_id} sekarang terhubung. Obrolan dimulai."
+        notice = await context.bot.send_message(
+            chat_id=admin_id,
+            text=f"User {user_id} sekarang terhubung. Obrolan dimulai. Balas (reply) pesannya untuk menjawab user ini.",
+            reply_markup=create_stop_session_keyboard(user_id),
         )
-        logger.info(f"Chat started between user {user_id} and admin.")
-
-        # Start timeout checker
-        await chat_manager.start_timeout_task(user_id, ADMIN_USER_ID, end_chat_callback)
+        replies.remember(admin_id, [notice.message_id], user_id)
+        logger.info(f"Chat started between user {user_id} and admin {admin_id}.")
     except Exception as e:
         logger.error(f"Failed to start chat with user {user_id}: {e}")
 
 
-async def end_chat_callback(user_id: int, admin_id: int):
+async def dispatch_queue(context: ContextTypes.DEFAULT_TYPE):
+    """Start chats for queued users while any admin has a free session slot"""
+    while True:
+        claimed = await state.claim_next_session()
+        if claimed is None:
+            return
+        positions.queue_changed()
+        user_id, admin_id = claimed
+        await start_chat_with_user(user_id, admin_id, context)
+
+
+async def end_chat_callback(user_id: int, admin_id: int, application: Application):
     """Callback function when chat times out"""
-    await end_chat(user_id, admin_id, None)
+    await end_chat(user_id, admin_id, ContextTypes.DEFAULT_TYPE(application), timed_out=True)
 
 
-async def end_chat(user_id: int, admin_id: int, context: ContextTypes.DEFAULT_TYPE):
+async def end_chat(user_id: int, admin_id: int, context: ContextTypes.DEFAULT_TYPE, timed_out: bool = False):
     """End a chat session"""
-    chat_manager.end_chat(user_id, admin_id)
+    if not await state.end_chat(user_id, admin_id, timed_out):
+        return
+    # Messages sent before the end still go out ahead of the end notices
+    await relay.flush(user_id, admin_id)
+    await relay.flush(admin_id, user_id)
+    # After the flush, so copies still in flight cannot add routes or transcript lines back
+    replies.end_session(user_id)
+    if transcripts:
+        transcripts.end_session(user_id)
     
     if context:
         try:
@@ -70,21 +249,90 @@ async def end_chat(user_id: int, admin_id: int, context: ContextTypes.DEFAULT_TY
         except Exception as e:
             logger.error(f"Failed to send end chat messages: {e}")
     
-    logger.info(f"Chat ended between user {user_id} and admin.")
+    logger.info(f"Chat ended between user {user_id} and admin {admin_id}.")
 
     # Start next chat if available
-    next_user_id = chat_manager.get_next_user_in_queue()
-    if next_user_id and not chat_manager.is_user_in_active_chat(admin_id):
-        if context:
-            await start_chat_with_user(next_user_id, context)
+    if context:
+        await dispatch_queue(context)
+
+
+async def get_session_for(user_id: int):
+    """Return the (user_id, admin_id) session a user or admin is currently in"""
+    partner = await state.get_active_chat_partner(user_id)
+    if partner is None:
+        return None
+    if state.is_agent(user_id):
+        return partner, user_id
+    return user_id, partner
+
+
+async def get_admin_target(admin_id: int, message) -> Optional[int]:
+    """User an admin's message is meant for: the one whose message it replies to, else the focused session.
+
+    Returns None, after telling the admin, when the message replies to one
+    from a chat that is over: it was meant for that user, and the focused
+    session, even the only one, is someone else. Replies to messages the
+    router does not know (evicted, or relayed by another worker) go to the
+    focused session.
+    """
+    replied = message.reply_to_message if message else None
+    if replied is not None:
+        user_id = replies.lookup(admin_id, replied.message_id)
+        if user_id is not None and await state.get_active_chat_partner(user_id) == admin_id:
+            return user_id
+        if user_id is not None or replies.ended(admin_id, replied.message_id):
+            await message.reply_text(
+                "Pesan yang kamu balas bukan dari obrolan yang masih aktif, jadi pesan ini tidak diteruskan. "
+                "Balas pesan dari user yang ingin kamu jawab, atau kirim tanpa membalas."
+            )
+            return None
+    return await state.get_active_chat_partner(admin_id)
+
+
+async def get_admin_stop_target(admin_id: int, update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[int]:
+    """User whose session an admin's /stop ends: /stop <user_id>, a reply to their message, or the focused one"""
+    if context.args:
+        try:
+            return int(context.args[0])
+        except ValueError:
+            return None
+    replied = update.message.reply_to_message if update.message else None
+    if replied is not None:
+        user_id = replies.lookup(admin_id, replied.message_id)
+        if user_id is not None:
+            return user_id
+    return await state.get_active_chat_partner(admin_id)
+
+
+async def handle_chat_command_wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Wrapper for chat command that starts the chat as soon as an admin is free"""
+    try:
+        await handle_chat_command(update, context, state, positions, eta)
+    finally:
+        # Even if the reply failed the user may be queued, so keep the queue moving
+        await dispatch_queue(context)
 
 
 async def handle_stop_command_wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Wrapper for stop command that handles the actual chat ending"""
     user_id = update.effective_user.id
-    if (chat_manager.get_active_chat_partner(user_id) == ADMIN_USER_ID or 
-        chat_manager.get_active_chat_partner(ADMIN_USER_ID) == user_id):
-        await end_chat(user_id, ADMIN_USER_ID, context)
+    if state.is_agent(user_id):
+        # Admins with several sessions pick the one to end
+        target = await get_admin_stop_target(user_id, update, context)
+        if target is not None and await state.get_active_chat_partner(target) == user_id:
+            await end_chat(target, user_id, context)
+            if update.message:
+                await update.message.reply_text(f"Obrolan dengan user {target} telah diakhiri.")
+        elif update.message:
+            if await state.is_user_in_active_chat(user_id):
+                await update.message.reply_text("Kamu tidak sedang mengobrol dengan user tersebut.")
+            else:
+                await update.message.reply_text("Kamu tidak sedang dalam sesi obrolan.")
+        return
+
+    session = await get_session_for(user_id)
+    if session:
+        await end_chat(*session, context)
         if update.message:
             await update.message.reply_text("Obrolan telah diakhiri.")
     else:
@@ -98,75 +346,214 @@ async def handle_callback_query_wrapper(update: Update, context: ContextTypes.DE
     await query.answer()
 
     if query.data == "stop_chat":
-        user_id = query.from_user.id
-        if (chat_manager.get_active_chat_partner(user_id) == ADMIN_USER_ID or 
-            chat_manager.get_active_chat_partner(ADMIN_USER_ID) == user_id):
-            await end_chat(user_id, ADMIN_USER_ID, context)
+        session = await get_session_for(query.from_user.id)
+        if session:
+            await end_chat(*session, context)
             await query.edit_message_text(text=format_chat_ended_message())
         else:
             await query.edit_message_text(text="Kamu tidak sedang dalam sesi obrolan.")
+    elif query.data.startswith("stop_chat:") and state.is_agent(query.from_user.id):
+        # The button on an admin's session start notice
+        admin_id = query.from_user.id
+        target = int(query.data.partition(":")[2])
+        if await state.get_active_chat_partner(target) == admin_id:
+            await end_chat(target, admin_id, context)
+            await query.edit_message_text(text=f"Obrolan dengan user {target} telah diakhiri.")
+        else:
+            await query.edit_message_text(text=f"Obrolan dengan user {target} sudah berakhir.")
 
 
 async def handle_message_wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Wrapper for message handling that includes chat timeout reset"""
     user_id = update.effective_user.id
+    is_admin = state.is_agent(user_id)
     
-    # If user is in active chat with admin, forward message to admin
-    if chat_manager.get_active_chat_partner(user_id) == ADMIN_USER_ID:
-        try:
-            await context.bot.copy_message(chat_id=ADMIN_USER_ID, from_chat_id=user_id, message_id=update.message.message_id)
-            logger.info(f"Forwarded message from user {user_id} to admin.")
-            
-            # Reset timeout
-            chat_manager.cancel_timeout_task(user_id)
-            await chat_manager.start_timeout_task(user_id, ADMIN_USER_ID, end_chat_callback)
-        except Exception as e:
-            logger.error(f"Failed to forward message from user {user_id} to admin: {e}")
-            if update.message:
-                await update.message.reply_text(f"Gagal mengirim pesan: {e}")
+    # If user is in active chat with an admin, forward message to that admin
+    admin_id = None if is_admin else await state.get_active_chat_partner(user_id)
+    if admin_id is not None:
+        relay.add(user_id, admin_id, update.message)
+        logger.debug("Queued message from user %s for admin %s.", user_id, admin_id)
+
+        # Reset timeout and route the admin's next reply here
+        await state.reset_timeout(user_id)
+        await state.touch_session(user_id)
         return
 
-    # If admin is sending message, forward to user in active chat
-    if user_id == ADMIN_USER_ID:
-        user_in_chat = chat_manager.get_active_chat_partner(ADMIN_USER_ID)
+    # If admin is sending message, forward to the user it replies to, or the one they are focused on
+    if is_admin:
+        user_in_chat = await get_admin_target(user_id, update.message)
         if user_in_chat:
-            try:
-                await context.bot.copy_message(chat_id=user_in_chat, from_chat_id=ADMIN_USER_ID, message_id=update.message.message_id)
-                logger.info(f"Forwarded message from admin to user {user_in_chat}.")
-                
-                # Reset timeout for the user
-                chat_manager.cancel_timeout_task(user_in_chat)
-                await chat_manager.start_timeout_task(user_in_chat, ADMIN_USER_ID, end_chat_callback)
-            except Exception as e:
-                logger.error(f"Failed to forward message from admin to user {user_in_chat}: {e}")
-                if update.message:
-                    await update.message.reply_text(f"Gagal mengirim pesan: {e}")
+            relay.add(user_id, user_in_chat, update.message)
+            logger.debug("Queued message from admin %s for user %s.", user_id, user_in_chat)
+
+            # Reset timeout for the user and keep unreplied messages going to them
+            await state.reset_timeout(user_in_chat)
+            await state.touch_session(user_in_chat)
         return
 
     # If user is not in chat, direct them to use /chat command
-    if user_id != ADMIN_USER_ID:
-        if update.message:
-            await update.message.reply_text("Gunakan /chat untuk meminta obrolan dengan admin.")
+    if update.message:
+        await update.message.reply_text("Gunakan /chat untuk meminta obrolan dengan admin.")
+
+
+async def relay_finished(from_chat_id: int, to_chat_id: int, messages: list, error: Exception,
+                         copied_ids: list, bot):
+    """Record a relayed batch in the transcript, or tell the sender it was not delivered"""
+    if error is not None:
+        await bot.send_message(chat_id=from_chat_id, text=f"Gagal mengirim pesan: {error}")
+        return
+    logger.debug("Relayed %s messages from %s to %s.", len(messages), from_chat_id, to_chat_id)
+    if state.is_agent(to_chat_id):
+        replies.remember(to_chat_id, copied_ids, from_chat_id)
+    elif state.is_agent(from_chat_id):
+        # An admin may also answer by replying to what they sent the user earlier
+        replies.remember(from_chat_id, [message.message_id for message in messages], to_chat_id)
+    if transcripts:
+        if state.is_agent(from_chat_id):
+            user_id, admin_id, direction = to_chat_id, from_chat_id, TO_USER
+        else:
+            user_id, admin_id, direction = from_chat_id, to_chat_id, TO_ADMIN
+        for message in messages:
+            transcripts.record(user_id, admin_id, direction, message.message_id, describe_message(message))
+
+
+async def collect_metrics():
+    """Refresh the gauges right before a scrape"""
+    QUEUE_DEPTH.set(await state.get_queue_size())
+    ACTIVE_SESSIONS.set(sum([len(await state.get_agent_sessions(admin_id)) for admin_id in ADMIN_USER_IDS]))
+    OUTBOUND_QUEUE_DEPTH.set(outbound.queue_depth)
+
+
+async def post_init(application: Application):
+    """Load state and start background tasks once the event loop is running"""
+    global metrics_server
+    loads = [state.start(functools.partial(end_chat_callback, application=application))]
+    if transcripts:
+        # Started first: the transcript index loads in a worker thread while the state loads
+        loads.insert(0, transcripts.start())
+    await asyncio.gather(*loads)
+    startup.mark("state loaded")
+    positions.start(application.bot, state)
+    relay.start(application.bot, functools.partial(relay_finished, bot=application.bot))
+    if METRICS_PORT:
+        metrics_server = MetricsServer(host=METRICS_LISTEN, port=METRICS_PORT, collect=collect_metrics)
+        await metrics_server.start()
+    await dispatch_queue(ContextTypes.DEFAULT_TYPE(application))
+    startup.mark("initialized")
+
+
+async def post_stop(application: Application):
+    """Send relayed messages that are still buffered while the bot can still reach Telegram"""
+    await relay.close()
+
+
+async def post_shutdown(application: Application):
+    """Stop background tasks and flush persisted state"""
+    if metrics_server is not None:
+        await metrics_server.stop()
+    await positions.stop()
+    if transcripts:
+        await transcripts.close()
+    await state.stop()
+
+
+async def report_startup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Log the startup profile when the first update comes in"""
+    if not startup.seen("first update"):
+        startup.mark("first update")
+        logger.info(startup.report())
+
+
+def add_handlers(application: Application):
+    """Register the bot's handlers on an application"""
+    if STARTUP_PROFILE:
+        application.add_handler(TypeHandler(Update, report_startup), group=-2)
+    if flood_guard:
+        application.add_handler(TypeHandler(Update, flood_guard.check), group=-1)
+    application.add_handler(CommandHandler("start", timed_handler("start", lambda u, c: handle_start_command(u, c, state))))
+    application.add_handler(CommandHandler(
+        "queue", timed_handler("queue", lambda u, c: handle_queue_command(u, c, state, positions, eta))
+    ))
+    application.add_handler(CommandHandler("chat", timed_handler("chat", handle_chat_command_wrapper)))
+    application.add_handler(CommandHandler("stop", timed_handler("stop", handle_stop_command_wrapper)))
+    application.add_handler(CommandHandler("help", timed_handler("help", handle_help_command)))
+    application.add_handler(CommandHandler(
+        "history", timed_handler("history", lambda u, c: handle_history_command(u, c, state, transcripts))
+    ))
+    application.add_handler(CommandHandler(
+        "stats", timed_handler("stats", lambda u, c: handle_stats_command(u, c, state, stats, ADMIN_USER_IDS))
+    ))
+    # New messages only: an edit would be relayed again as a copy of the edited message
+    application.add_handler(MessageHandler(
+        filters.UpdateType.MESSAGE & ~filters.COMMAND & ~filters.StatusUpdate.ALL,
+        timed_handler("message", handle_message_wrapper),
+    ))
+    application.add_handler(CallbackQueryHandler(timed_handler("callback", handle_callback_query_wrapper)))
+
+
+async def run_webhook(application: Application):
+    """Serve updates from our own webhook endpoint until SIGINT/SIGTERM"""
+    stop_signal = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_signal.set)
+
+    from services.webhook import WebhookServer
+
+    server = WebhookServer(application, WEBHOOK_SECRET, WEBHOOK_PATH, WEBHOOK_LISTEN, WEBHOOK_PORT)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        await server.start()
+        await application.bot.set_webhook(
+            WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info("Webhook registered. Waiting for updates...")
+        await stop_signal.wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
 
 
 def main():
     logger.info("Bot is starting...")
     try:
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .rate_limiter(outbound)
+            .concurrent_updates(ChatSerializedProcessor(CONCURRENT_UPDATES) if CONCURRENT_UPDATES > 1 else False)
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
         logger.info("Application built successfully.")
+        startup.mark("application built")
     except Exception as e:
         logger.error(f"Failed to build application: {e}")
         print(f"Error: {e}")
         return
 
-    # Add handlers
-    application.add_handler(CommandHandler("start", lambda u, c: handle_start_command(u, c, chat_manager)))
-    application.add_handler(CommandHandler("queue", lambda u, c: handle_queue_command(u, c, chat_manager)))
-    application.add_handler(CommandHandler("chat", lambda u, c: handle_chat_command(u, c, chat_manager)))
-    application.add_handler(CommandHandler("stop", handle_stop_command_wrapper))
-    application.add_handler(CommandHandler("help", handle_help_command))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message_wrapper))
-    application.add_handler(CallbackQueryHandler(handle_callback_query_wrapper))
+    add_handlers(application)
+
+    if WEBHOOK_URL:
+        logger.info("Handlers added. Starting webhook...")
+        try:
+            asyncio.run(run_webhook(application))
+        except Exception as e:
+            logger.error(f"Error during webhook: {e}")
+            print(f"Webhook error: {e}")
+        return
 
     logger.info("Handlers added. Starting polling...")
     try:
@@ -176,4 +563,4 @@ def main():
         print(f"Polling error: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
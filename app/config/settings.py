@@ -1,4 +1,5 @@
 import os
+import secrets
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -18,6 +19,117 @@ try:
 except ValueError:
     raise ValueError("ADMIN_USER_ID must be an integer")
 
+# Agent pool configuration: ADMIN_USER_ID plus any extra admins
+ADMIN_USER_IDS = [ADMIN_USER_ID]
+for _admin_id in os.getenv("ADMIN_USER_IDS", "").split(","):
+    if not _admin_id.strip():
+        continue
+    try:
+        _admin_id = int(_admin_id)
+    except ValueError:
+        raise ValueError("ADMIN_USER_IDS must be a comma-separated list of integers")
+    if _admin_id not in ADMIN_USER_IDS:
+        ADMIN_USER_IDS.append(_admin_id)
+
+AGENT_MAX_SESSIONS = int(os.getenv("AGENT_MAX_SESSIONS", 1))  # Concurrent chats per admin
+AGENT_DISPATCH_STRATEGY = os.getenv("AGENT_DISPATCH_STRATEGY", "least_loaded")  # or "longest_idle"
+
 # Chat configuration
 CHAT_TIMEOUT = int(os.getenv("CHAT_TIMEOUT", 300))  # Default 5 minutes
-MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", 10))  # Default max 10 users in queue
\ No newline at end of file
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", 10))  # Default max 10 users in queue
+
+# Queue priority: comma-separated CLASS:SECONDS pairs giving each class a head start over normal users.
+# Classes are vip (VIP_USER_IDS), timed_out (last chat timed out) and returning (last chat ended normally).
+# Everyone gains a second of priority per second waited, so normal users are never starved.
+# Empty (the default) keeps a plain FIFO queue; e.g. "vip:600,timed_out:300,returning:60" enables all three
+QUEUE_PRIORITY_CLASSES = {}
+for _pair in os.getenv("QUEUE_PRIORITY_CLASSES", "").split(","):
+    if not _pair.strip():
+        continue
+    try:
+        _name, _seconds = _pair.split(":")
+        QUEUE_PRIORITY_CLASSES[_name.strip()] = float(_seconds)
+    except ValueError:
+        raise ValueError("QUEUE_PRIORITY_CLASSES must look like 'vip:600,timed_out:300,returning:60'")
+    if _name.strip() not in ("vip", "timed_out", "returning"):
+        raise ValueError("QUEUE_PRIORITY_CLASSES classes must be vip, timed_out or returning")
+
+VIP_USER_IDS = []
+for _vip_id in os.getenv("VIP_USER_IDS", "").split(","):
+    if not _vip_id.strip():
+        continue
+    try:
+        VIP_USER_IDS.append(int(_vip_id))
+    except ValueError:
+        raise ValueError("VIP_USER_IDS must be a comma-separated list of integers")
+
+# Re-joins within QUEUE_REQUEUE_WINDOW seconds of a chat that keep the timed_out/returning head start
+QUEUE_MAX_REQUEUES = int(os.getenv("QUEUE_MAX_REQUEUES", 3))
+QUEUE_REQUEUE_WINDOW = float(os.getenv("QUEUE_REQUEUE_WINDOW", 3600))
+
+# Relayed messages remembered per process so an admin's reply goes to the user whose message it answers
+REPLY_ROUTES = int(os.getenv("REPLY_ROUTES", 10000))
+
+# Updates handled at the same time; updates of one chat still run one after another (1 to disable)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 64))
+
+# Inbound flood protection: each user may send FLOOD_RATE updates per second on average, with bursts of
+# up to FLOOD_BURST (albums arrive as one update per item); admins are exempt (0 to disable)
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", 1))
+FLOOD_BURST = int(os.getenv("FLOOD_BURST", 20))
+
+# Seconds relayed messages are held so albums and bursts go out in one request (0 still merges same-tick messages)
+RELAY_WINDOW = float(os.getenv("RELAY_WINDOW", 0.3))
+
+# Outbound rate limits (Telegram allows about 30 messages/s overall and 1/s per chat)
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", 30))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 1))
+OUTBOUND_MAX_QUEUE = int(os.getenv("OUTBOUND_MAX_QUEUE", 10000))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", 5))
+
+# Persistence of the queue and chat sessions across restarts (empty to disable)
+STATE_DIR = os.getenv("STATE_DIR", "data")
+STATE_FLUSH_INTERVAL = float(os.getenv("STATE_FLUSH_INTERVAL", 0.05))  # Seconds between journal writes
+STATE_COMPACT_EVERY = int(os.getenv("STATE_COMPACT_EVERY", 10000))  # Journal records per snapshot
+
+# Where queue and session state lives: "memory" (this process) or "redis" (shared by several workers)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+if STATE_BACKEND not in ("memory", "redis"):
+    raise ValueError("STATE_BACKEND must be 'memory' or 'redis'")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_PREFIX = os.getenv("REDIS_PREFIX", "pnj")
+TIMEOUT_LEASE_TTL = float(os.getenv("TIMEOUT_LEASE_TTL", 30))  # Seconds a worker owns a firing timeout
+
+# Webhook mode: set WEBHOOK_URL to the public HTTPS address to receive updates by webhook instead of polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8443))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+
+# Prometheus metrics endpoint at http://METRICS_LISTEN:METRICS_PORT/metrics (0 to disable)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+
+# Queue position updates: edit a user's status message when they reach one of the first
+# POSITION_TOP positions or cross a multiple of POSITION_BUCKET_SIZE
+POSITION_TOP = int(os.getenv("POSITION_TOP", 3))
+POSITION_BUCKET_SIZE = int(os.getenv("POSITION_BUCKET_SIZE", 10))
+POSITION_UPDATE_INTERVAL = float(os.getenv("POSITION_UPDATE_INTERVAL", 2))  # Seconds between update passes
+POSITION_UPDATES_PER_PASS = int(os.getenv("POSITION_UPDATES_PER_PASS", 20))
+
+# /stats: counts cover the last STATS_WINDOW seconds; rates are averaged over about STATS_RATE_TAU seconds
+STATS_WINDOW = float(os.getenv("STATS_WINDOW", 3600))
+STATS_RATE_TAU = float(os.getenv("STATS_RATE_TAU", 300))
+
+# Queue ETA: average chat length over about the last ETA_SESSIONS chats (0 hides the estimate)
+ETA_SESSIONS = int(os.getenv("ETA_SESSIONS", 50))
+
+# 1 logs how long each startup step took (imports, state load, ...) once the first update comes in
+STARTUP_PROFILE = int(os.getenv("STARTUP_PROFILE", 0))
+
+# Transcripts of relayed messages, readable by admins with /history (empty to disable)
+TRANSCRIPT_DIR = os.getenv("TRANSCRIPT_DIR", "data/transcripts")
+TRANSCRIPT_SEGMENT_MB = float(os.getenv("TRANSCRIPT_SEGMENT_MB", 16))  # Size at which a new segment file starts
+TRANSCRIPT_RETENTION_DAYS = float(os.getenv("TRANSCRIPT_RETENTION_DAYS", 30))  # 0 keeps segments forever
+TRANSCRIPT_MAX_MB = float(os.getenv("TRANSCRIPT_MAX_MB", 0))  # Total size limit, 0 for none
@@ -0,0 +1,391 @@
+"""Local stand-in for the Telegram Bot API, for load testing the bot on one machine.
+
+Serves the handful of methods the bot calls and delivers a synthetic or
+recorded stream of updates either through getUpdates (polling) or by
+posting to the webhook the bot registers. Point the bot at it with
+Application.builder().base_url("http://127.0.0.1:8081/bot"). Run standalone:
+
+    python -m devtools.fake_bot_api --port 8081 --synthetic 10000
+    python -m devtools.fake_bot_api --port 8081 --replay updates.jsonl
+"""
+from collections import Counter, deque
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qsl
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+
+import httpx
+from telegram.request import BaseRequest, RequestData
+
+from services.http_server import HttpServer, Request, Response
+from services.webhook import SECRET_HEADER
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 1000000, "is_bot": True, "first_name": "PNJ Helper", "username": "pnj_helper_bot"}
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+class ApiError(Exception):
+    """Error reply with a Bot API error code"""
+
+    def __init__(self, code: int, description: str, retry_after: Optional[int] = None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.retry_after = retry_after
+
+
+# Methods that never fail under error injection, so the bot can always start up
+SETUP_METHODS = {"getMe", "getUpdates", "setWebhook", "deleteWebhook", "getWebhookInfo", "close", "logOut"}
+INJECTED_ERRORS = [
+    ApiError(400, "Bad Request: chat not found"),
+    ApiError(403, "Forbidden: bot was blocked by the user"),
+    ApiError(429, "Too Many Requests: retry after 1", retry_after=1),
+    ApiError(502, "Bad Gateway"),
+]
+
+
+def message_update(update_id: int, user_id: int, text: str, message_id: Optional[int] = None,
+                   reply_to: Optional[int] = None) -> dict:
+    """A private text message update; commands get their bot_command entity.
+
+    reply_to makes it a reply to a message the bot sent in that chat.
+    """
+    message = {
+        "message_id": message_id or update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": f"User {user_id}"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    if reply_to is not None:
+        message["reply_to_message"] = {
+            "message_id": reply_to,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": BOT_USER,
+        }
+    return {"update_id": update_id, "message": message}
+
+
+def media_update(update_id: int, user_id: int, media_group_id: Optional[str] = None,
+                 caption: Optional[str] = None) -> dict:
+    """A private photo message update, optionally one item of an album"""
+    update = message_update(update_id, user_id, "")
+    message = update["message"]
+    del message["text"]
+    message["photo"] = [{"file_id": f"photo{update_id}", "file_unique_id": f"p{update_id}", "width": 800, "height": 600}]
+    if media_group_id is not None:
+        message["media_group_id"] = media_group_id
+    if caption is not None:
+        message["caption"] = caption
+    return update
+
+
+def callback_update(update_id: int, user_id: int, data: str, message_id: int = 1) -> dict:
+    """An inline keyboard button press on a message the bot sent the user"""
+    chat = {"id": user_id, "type": "private", "first_name": f"User {user_id}"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {"message_id": message_id, "date": int(time.time()), "chat": chat, "from": BOT_USER},
+        },
+    }
+
+
+def synthetic_updates(count: int, users: int = 1000, first_user_id: int = 100000) -> Iterator[dict]:
+    """Private text messages from `users` users taking turns; every user starts with /chat"""
+    for i in range(count):
+        text = "/chat" if i < users else f"pesan {i}"
+        yield message_update(i + 1, first_user_id + i % users, text)
+
+
+def recorded_updates(path: str) -> Iterator[dict]:
+    """Updates from a JSONL file, one update object per line"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def parse_params(body: bytes, content_type: str) -> Dict[str, Any]:
+    """Decode a Bot API request body; form values are JSON-encoded by the client"""
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    params = {}
+    for name, value in parse_qsl(body.decode(), keep_blank_values=True):
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
+
+
+class FakeBotApi:
+    """Bot API method implementations and the pending update stream"""
+
+    def __init__(self, webhook_batch_size: int = 1, latency: float = 0.0, error_rate: float = 0.0,
+                 record: bool = False, seed: Optional[int] = None, jitter: float = 0.0):
+        self.webhook_batch_size = webhook_batch_size
+        self.latency = latency
+        # Up to this many extra seconds per call, so concurrent calls finish out of order
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.record = record
+        self.requests: List[Tuple[str, Dict[str, Any]]] = []
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._random = random.Random(seed)
+        self.delivered = 0
+        self._pending: Deque[dict] = deque()
+        self._arrived = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._webhook_url = ""
+        self._webhook_secret = ""
+        self._webhook_tasks: List[asyncio.Task] = []
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def feed(self, updates: Iterable[dict]):
+        """Queue updates for delivery, renumbering them so replays never collide"""
+        for update in updates:
+            self._pending.append({**update, "update_id": next(self._update_ids)})
+        if self._pending:
+            self._arrived.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def call(self, method: str, params: Dict[str, Any]) -> Any:
+        handler = getattr(self, f"api_{method.lower()}", None)
+        if handler is None:
+            raise ApiError(404, "Not Found: method not found")
+        self.calls[method] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.jitter * self._random.random())
+        if self.error_rate and method not in SETUP_METHODS and self._random.random() < self.error_rate:
+            error = self._random.choice(INJECTED_ERRORS)
+            self.errors[error.code] += 1
+            raise error
+        if self.record:
+            # In the order requests take effect, which concurrent callers do not control
+            self.requests.append((method, params))
+        return await handler(**params)
+
+    async def respond(self, method: str, params: Dict[str, Any]) -> Tuple[int, dict]:
+        """Run a method and wrap the outcome in a Bot API reply envelope"""
+        try:
+            return 200, {"ok": True, "result": await self.call(method, params)}
+        except ApiError as e:
+            reply = {"ok": False, "error_code": e.code, "description": e.description}
+            if e.retry_after is not None:
+                reply["parameters"] = {"retry_after": e.retry_after}
+            return e.code, reply
+        except (TypeError, ValueError) as e:
+            return 400, {"ok": False, "error_code": 400, "description": f"Bad Request: {e}"}
+
+    def _message(self, chat_id, text: Optional[str] = None) -> dict:
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    # Bot API methods
+    async def api_getme(self, **_):
+        return BOT_USER
+
+    async def api_getupdates(self, offset: int = 0, limit: int = 100, timeout: int = 0, **_):
+        while self._pending and self._pending[0]["update_id"] < offset:
+            self._pending.popleft()
+        if not self._pending and timeout:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        updates = list(itertools.islice(self._pending, min(limit, 100)))
+        self.delivered += len(updates)
+        return updates
+
+    async def api_sendmessage(self, chat_id, text, **_):
+        return self._message(chat_id, text)
+
+    async def api_copymessage(self, chat_id, **_):
+        return {"message_id": next(self._message_ids)}
+
+    async def api_copymessages(self, chat_id, message_ids, **_):
+        return [{"message_id": next(self._message_ids)} for _ in message_ids]
+
+    async def api_forwardmessage(self, chat_id, **_):
+        return self._message(chat_id)
+
+    async def api_editmessagetext(self, text, chat_id=None, message_id=None, **_):
+        if chat_id is None:
+            return True
+        return {**self._message(chat_id, text), "message_id": message_id}
+
+    async def api_answercallbackquery(self, **_):
+        return True
+
+    async def api_setwebhook(self, url, secret_token: str = "", max_connections: int = 40, **_):
+        await self._stop_webhook()
+        self._webhook_url = url
+        self._webhook_secret = secret_token
+        self._http = httpx.AsyncClient(limits=httpx.Limits(max_connections=max_connections))
+        self._webhook_tasks = [asyncio.create_task(self._deliver()) for _ in range(max_connections)]
+        return True
+
+    async def api_deletewebhook(self, drop_pending_updates: bool = False, **_):
+        await self._stop_webhook()
+        if drop_pending_updates:
+            self._pending.clear()
+        return True
+
+    async def api_getwebhookinfo(self, **_):
+        return {"url": self._webhook_url, "has_custom_certificate": False, "pending_update_count": len(self._pending)}
+
+    async def api_close(self, **_):
+        return True
+
+    async def api_logout(self, **_):
+        return True
+
+    # Webhook delivery
+    async def _deliver(self):
+        """Post pending updates to the webhook, webhook_batch_size per request"""
+        headers = {SECRET_HEADER: self._webhook_secret} if self._webhook_secret else {}
+        while True:
+            if not self._pending:
+                self._arrived.clear()
+                await self._arrived.wait()
+                continue
+            count = min(self.webhook_batch_size, len(self._pending))
+            batch = [self._pending.popleft() for _ in range(count)]
+            body = batch[0] if self.webhook_batch_size == 1 else batch
+            try:
+                response = await self._http.post(self._webhook_url, json=body, headers=headers)
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.warning(f"Webhook delivery failed, retrying: {e}")
+                self._pending.extendleft(reversed(batch))
+                self._arrived.set()
+                await asyncio.sleep(0.5)
+                continue
+            self.delivered += count
+
+    async def _stop_webhook(self):
+        for task in self._webhook_tasks:
+            task.cancel()
+        await asyncio.gather(*self._webhook_tasks, return_exceptions=True)
+        self._webhook_tasks = []
+        self._webhook_url = ""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def close(self):
+        await self._stop_webhook()
+
+
+class FakeBotApiServer:
+    """Serves a FakeBotApi over HTTP at /bot<token>/<method>"""
+
+    def __init__(self, api: Optional[FakeBotApi] = None, host: str = "127.0.0.1", port: int = 0):
+        self.api = api or FakeBotApi()
+        self.http = HttpServer(self._handle, host, port)
+
+    @property
+    def port(self) -> int:
+        return self.http.port
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.http.host}:{self.http.port}/bot"
+
+    async def start(self):
+        await self.http.start()
+
+    async def stop(self):
+        await self.api.close()
+        await self.http.stop()
+
+    async def _handle(self, request: Request) -> Response:
+        prefix, _, method = request.path.partition("?")[0].rpartition("/")
+        if not prefix.startswith("/bot"):
+            return 404, {}, b""
+        try:
+            params = parse_params(request.body, request.headers.get("content-type", ""))
+        except ValueError as e:
+            return 400, JSON_HEADERS, json.dumps({"ok": False, "error_code": 400, "description": str(e)}).encode()
+        status, reply = await self.api.respond(method, params)
+        return status, JSON_HEADERS, json.dumps(reply).encode()
+
+
+class FakeBotRequest(BaseRequest):
+    """Hands Bot API calls straight to a FakeBotApi in the same process, skipping HTTP.
+
+    Use with Application.builder().request(...) to exercise handlers against
+    the fake without sockets; latency and errors come from the FakeBotApi.
+    """
+
+    def __init__(self, api: FakeBotApi):
+        self.api = api
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        params = request_data.parameters if request_data is not None else {}
+        status, reply = await self.api.respond(url.rpartition("/")[2], params)
+        return status, json.dumps(reply).encode()
+
+
+async def _serve(options):
+    api = FakeBotApi(webhook_batch_size=options.webhook_batch)
+    server = FakeBotApiServer(api, options.host, options.port)
+    await server.start()
+    logger.info(f"Fake Bot API listening on {server.base_url}")
+    if options.replay:
+        api.feed(recorded_updates(options.replay))
+    else:
+        api.feed(synthetic_updates(options.synthetic, options.users))
+    logger.info(f"Queued {api.pending} updates")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--synthetic", type=int, default=10000, help="number of synthetic updates")
+    parser.add_argument("--users", type=int, default=1000, help="distinct users in the synthetic stream")
+    parser.add_argument("--replay", help="JSONL file of recorded updates to serve instead")
+    parser.add_argument("--webhook-batch", type=int, default=1, help="updates per webhook request")
+    options = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(options))
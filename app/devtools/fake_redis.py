@@ -0,0 +1,444 @@
+"""In-process stand-in for a Redis server, for exercising RedisBackend locally.
+
+Implements only the commands the bot uses, in a single event loop, which
+makes every command atomic just like the real server. Transactions follow
+Redis: MULTI queues commands until EXEC runs them all at once, and EXEC
+returns nil if a key the connection WATCHes was written in the meantime.
+Run standalone with:
+
+    python -m devtools.fake_redis --port 6379
+"""
+from bisect import bisect_left, insort
+from typing import Any, Dict, List, Optional, Set, Tuple
+import argparse
+import asyncio
+import logging
+import time
+
+from services.resp_client import RespError
+
+logger = logging.getLogger(__name__)
+
+
+class _SortedSet:
+    def __init__(self):
+        self.scores: Dict[str, float] = {}
+        self.ordered: List[Tuple[float, str]] = []
+
+    def add(self, member: str, score: float):
+        old = self.scores.get(member)
+        if old is not None:
+            del self.ordered[bisect_left(self.ordered, (old, member))]
+        self.scores[member] = score
+        insort(self.ordered, (score, member))
+
+    def remove(self, member: str) -> bool:
+        score = self.scores.pop(member, None)
+        if score is None:
+            return False
+        del self.ordered[bisect_left(self.ordered, (score, member))]
+        return True
+
+    def rank(self, member: str) -> Optional[int]:
+        score = self.scores.get(member)
+        if score is None:
+            return None
+        return bisect_left(self.ordered, (score, member))
+
+
+class _Status:
+    def __init__(self, text: str):
+        self.text = text
+
+
+OK = _Status("OK")
+QUEUED = _Status("QUEUED")
+
+# Commands that may modify their key, which breaks a WATCH on it
+WRITES = {"SET", "DEL", "INCR", "HSET", "HDEL", "HINCRBY", "SADD", "SREM", "ZADD", "ZREM", "ZPOPMIN"}
+TRANSACTION = {"WATCH", "UNWATCH", "MULTI", "EXEC", "DISCARD"}
+
+
+class Connection:
+    """Transaction state of one client: the keys it watches and the commands queued since MULTI"""
+
+    def __init__(self):
+        self.watched: Set[str] = set()
+        self.dirty = False
+        self.queued: Optional[List[List[str]]] = None
+        self.failed = False
+
+
+def _encode_reply(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, RespError):
+        return b"-%s\r\n" % str(value).encode()
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, _Status):
+        return b"+%s\r\n" % value.text.encode()
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode_reply(item) for item in value)
+    data = str(value).encode()
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def _format_score(score: float) -> str:
+    return str(int(score)) if score == int(score) else repr(score)
+
+
+class FakeRedis:
+    """Command interpreter holding all data in dicts"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.data: Dict[str, Any] = {}
+        self.expires: Dict[str, float] = {}
+        # key -> connections watching it
+        self.watchers: Dict[str, Set[Connection]] = {}
+        self.commands = 0
+
+    def _touch(self, key: str):
+        for connection in self.watchers.pop(key, ()):
+            connection.dirty = True
+
+    def _get(self, key: str, kind, create: bool = False):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= self.clock():
+            self.data.pop(key, None)
+            del self.expires[key]
+            self._touch(key)
+        value = self.data.get(key)
+        if value is None and create:
+            value = self.data[key] = kind()
+        if value is not None and not isinstance(value, kind):
+            raise RespError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def execute(self, args: List[str], connection: Optional[Connection] = None) -> Any:
+        self.commands += 1
+        name = args[0].upper()
+        if name in TRANSACTION:
+            if connection is None:
+                return RespError(f"ERR {name} needs a client connection")
+            return getattr(self, f"_{name.lower()}")(connection, *args[1:])
+        if connection is not None and connection.queued is not None:
+            if not hasattr(self, f"cmd_{name.lower()}"):
+                connection.failed = True
+                return RespError(f"ERR unknown command '{name}'")
+            connection.queued.append(args)
+            return QUEUED
+        return self._run(args)
+
+    def _run(self, args: List[str]) -> Any:
+        name = args[0].upper()
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            return RespError(f"ERR unknown command '{name}'")
+        try:
+            result = handler(*args[1:])
+        except RespError as e:
+            return e
+        except (TypeError, ValueError, IndexError) as e:
+            return RespError(f"ERR {e}")
+        if name in WRITES:
+            for key in args[1:] if name == "DEL" else args[1:2]:
+                self._touch(key)
+        return result
+
+    # Transactions
+    def _watch(self, connection: Connection, *keys):
+        if connection.queued is not None:
+            return RespError("ERR WATCH inside MULTI is not allowed")
+        for key in keys:
+            connection.watched.add(key)
+            self.watchers.setdefault(key, set()).add(connection)
+        return OK
+
+    def _unwatch(self, connection: Connection):
+        for key in connection.watched:
+            watching = self.watchers.get(key)
+            if watching is not None:
+                watching.discard(connection)
+                if not watching:
+                    del self.watchers[key]
+        connection.watched.clear()
+        connection.dirty = False
+        return OK
+
+    def _multi(self, connection: Connection):
+        if connection.queued is not None:
+            return RespError("ERR MULTI calls can not be nested")
+        connection.queued = []
+        connection.failed = False
+        return OK
+
+    def _discard(self, connection: Connection):
+        if connection.queued is None:
+            return RespError("ERR DISCARD without MULTI")
+        connection.queued = None
+        return self._unwatch(connection)
+
+    def _exec(self, connection: Connection):
+        queued, failed, dirty = connection.queued, connection.failed, connection.dirty
+        if queued is None:
+            return RespError("ERR EXEC without MULTI")
+        connection.queued = None
+        self._unwatch(connection)
+        if failed:
+            return RespError("EXECABORT Transaction discarded because of previous errors.")
+        if dirty:
+            return None
+        return [self._run(args) for args in queued]
+
+    # Connection
+    def cmd_ping(self, *args):
+        return _Status("PONG") if not args else args[0]
+
+    def cmd_auth(self, *args):
+        return OK
+
+    def cmd_select(self, db):
+        return OK
+
+    def cmd_flushall(self):
+        for key in list(self.watchers):
+            self._touch(key)
+        self.data.clear()
+        self.expires.clear()
+        return OK
+
+    # Strings
+    def cmd_get(self, key):
+        return self._get(key, str)
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        if "NX" in options and self._get(key, object) is not None:
+            return None
+        self.data[key] = value
+        self.expires.pop(key, None)
+        if "PX" in options:
+            self.expires[key] = self.clock() + int(options[options.index("PX") + 1]) / 1000
+        elif "EX" in options:
+            self.expires[key] = self.clock() + int(options[options.index("EX") + 1])
+        return OK
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._get(key, object) is not None:
+                del self.data[key]
+                removed += 1
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_incr(self, key):
+        value = int(self._get(key, str) or 0) + 1
+        self.data[key] = str(value)
+        return value
+
+    # Hashes
+    def cmd_hset(self, key, *pairs):
+        table = self._get(key, dict, create=True)
+        added = 0
+        for i in range(0, len(pairs), 2):
+            added += pairs[i] not in table
+            table[pairs[i]] = pairs[i + 1]
+        return added
+
+    def cmd_hget(self, key, field):
+        table = self._get(key, dict)
+        return None if table is None else table.get(field)
+
+    def cmd_hdel(self, key, *fields):
+        table = self._get(key, dict)
+        if table is None:
+            return 0
+        return sum(table.pop(field, None) is not None for field in fields)
+
+    def cmd_hexists(self, key, field):
+        table = self._get(key, dict)
+        return table is not None and field in table
+
+    def cmd_hgetall(self, key):
+        table = self._get(key, dict) or {}
+        return [item for pair in table.items() for item in pair]
+
+    def cmd_hincrby(self, key, field, amount):
+        table = self._get(key, dict, create=True)
+        value = int(table.get(field, 0)) + int(amount)
+        table[field] = str(value)
+        return value
+
+    def cmd_hlen(self, key):
+        return len(self._get(key, dict) or {})
+
+    # Sets
+    def cmd_sadd(self, key, *members):
+        members_set = self._get(key, set, create=True)
+        before = len(members_set)
+        members_set.update(members)
+        return len(members_set) - before
+
+    def cmd_srem(self, key, *members):
+        members_set = self._get(key, set)
+        if members_set is None:
+            return 0
+        removed = sum(member in members_set for member in members)
+        members_set.difference_update(members)
+        return removed
+
+    def cmd_smembers(self, key):
+        return sorted(self._get(key, set) or ())
+
+    def cmd_scard(self, key):
+        return len(self._get(key, set) or ())
+
+    def cmd_srandmember(self, key):
+        members_set = self._get(key, set)
+        return next(iter(members_set)) if members_set else None
+
+    # Sorted sets
+    def cmd_zadd(self, key, *args):
+        flags = set()
+        args = list(args)
+        while args and args[0].upper() in ("NX", "XX", "CH"):
+            flags.add(args.pop(0).upper())
+        zset = self._get(key, _SortedSet, create="XX" not in flags)
+        if zset is None:
+            return 0
+        added = changed = 0
+        for i in range(0, len(args), 2):
+            score, member = float(args[i]), args[i + 1]
+            exists = member in zset.scores
+            if ("NX" in flags and exists) or ("XX" in flags and not exists):
+                continue
+            if not exists:
+                added += 1
+            elif zset.scores[member] != score:
+                changed += 1
+            zset.add(member, score)
+        return added + changed if "CH" in flags else added
+
+    def cmd_zrem(self, key, *members):
+        zset = self._get(key, _SortedSet)
+        if zset is None:
+            return 0
+        return sum(zset.remove(member) for member in members)
+
+    def cmd_zrank(self, key, member):
+        zset = self._get(key, _SortedSet)
+        return None if zset is None else zset.rank(member)
+
+    def cmd_zscore(self, key, member):
+        zset = self._get(key, _SortedSet)
+        score = None if zset is None else zset.scores.get(member)
+        return None if score is None else _format_score(score)
+
+    def cmd_zcard(self, key):
+        zset = self._get(key, _SortedSet)
+        return 0 if zset is None else len(zset.scores)
+
+    def cmd_zpopmin(self, key):
+        zset = self._get(key, _SortedSet)
+        if not zset or not zset.ordered:
+            return []
+        score, member = zset.ordered[0]
+        zset.remove(member)
+        return [member, _format_score(score)]
+
+    def cmd_zrange(self, key, start, stop):
+        zset = self._get(key, _SortedSet)
+        if zset is None:
+            return []
+        start, stop = int(start), int(stop)
+        size = len(zset.ordered)
+        if stop < 0:
+            stop += size
+        return [member for _, member in zset.ordered[max(0, start):stop + 1]]
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        zset = self._get(key, _SortedSet)
+        if zset is None:
+            return []
+        low = float("-inf") if low == "-inf" else float(low)
+        high = float("inf") if high == "+inf" else float(high)
+        offset, count = 0, None
+        if options and options[0].upper() == "LIMIT":
+            offset, count = int(options[1]), int(options[2])
+        start = bisect_left(zset.ordered, (low, ""))
+        result = []
+        for score, member in zset.ordered[start:]:
+            if score > high:
+                break
+            result.append(member)
+        result = result[offset:]
+        return result if count is None or count < 0 else result[:count]
+
+
+class FakeRedisServer:
+    """Serves a FakeRedis over TCP with the RESP protocol"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.redis = FakeRedis()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients = {}
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await asyncio.gather(*self._clients.values(), return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._clients[writer] = asyncio.current_task()
+        connection = Connection()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.startswith(b"*"):
+                    args = line.decode().split()
+                else:
+                    args = []
+                    for _ in range(int(line[1:-2])):
+                        length = int((await reader.readline())[1:-2])
+                        args.append((await reader.readexactly(length + 2))[:-2].decode())
+                if args:
+                    writer.write(_encode_reply(self.redis.execute(args, connection)))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.redis._unwatch(connection)
+            self._clients.pop(writer, None)
+            writer.close()
+
+
+async def _serve(host: str, port: int):
+    server = FakeRedisServer(host, port)
+    await server.start()
+    logger.info(f"Fake Redis listening on {server.host}:{server.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    options = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_serve(options.host, options.port))
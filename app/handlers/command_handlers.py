@@ -1,14 +1,24 @@
+from typing import Iterable, Optional
 from telegram import Update
 from telegram.ext import ContextTypes
-from config.settings import ADMIN_USER_ID
-from models.chat_manager import ChatManager
-from utils.helpers import format_queue_message, format_max_queue_message
+from models.state_backend import StateBackend
+from services.eta import WaitEstimator
+from services.live_stats import LiveStats
+from services.position_notifier import PositionNotifier
+from services.transcripts import TranscriptStore
+from utils.helpers import (
+    format_queue_message, format_queue_joined_message, format_max_queue_message, format_history_message,
+    format_stats_message
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+HISTORY_DEFAULT_LIMIT = 20
+HISTORY_MAX_LIMIT = 100
 
-async def handle_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_manager: ChatManager):
+
+async def handle_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE, state: StateBackend):
     user_id = update.effective_user.id
     logger.info(f"Received /start from user {user_id}")
     await update.message.reply_text(
@@ -16,73 +26,88 @@ async def handle_start_command(update: Update, context: ContextTypes.DEFAULT_TYP
     )
 
 
-async def handle_queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_manager: ChatManager):
+async def handle_queue_command(update: Update, context: ContextTypes.DEFAULT_TYPE, state: StateBackend,
+                               positions: Optional[PositionNotifier] = None, eta: Optional[WaitEstimator] = None):
     user_id = update.effective_user.id
-    if user_id == ADMIN_USER_ID:
+    if state.is_agent(user_id):
         await update.message.reply_text("Admin tidak bisa menggunakan perintah ini.")
         return
 
-    if chat_manager.is_user_in_active_chat(user_id):
+    if await state.is_user_in_active_chat(user_id):
         await update.message.reply_text("Kamu sedang dalam sesi obrolan. Gunakan /stop untuk mengakhiri.")
         return
 
-    queue_position = chat_manager.get_user_queue_position(user_id)
+    queue_position = await state.get_user_queue_position(user_id)
     
     if queue_position:
-        total_in_queue = chat_manager.get_queue_size()
-        message = format_queue_message(user_id, queue_position, total_in_queue)
-        await update.message.reply_text(message)
+        total_in_queue = await state.get_queue_size()
+        wait = eta.estimate(queue_position) if eta else None
+        message = format_queue_message(user_id, queue_position, total_in_queue, wait)
+        status = await update.message.reply_text(message)
+        if positions:
+            positions.track(user_id, status.message_id, queue_position)
     else:
         await update.message.reply_text("Kamu tidak ada dalam antrian saat ini.")
 
 
-async def handle_chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_manager: ChatManager):
+async def handle_chat_command(update: Update, context: ContextTypes.DEFAULT_TYPE, state: StateBackend,
+                              positions: Optional[PositionNotifier] = None, eta: Optional[WaitEstimator] = None):
     user_id = update.effective_user.id
     logger.info(f"Received /chat from user {user_id}")
-    if user_id == ADMIN_USER_ID:
+    if state.is_agent(user_id):
         await update.message.reply_text("Admin tidak bisa menggunakan perintah ini.")
         return
 
-    if chat_manager.is_user_in_active_chat(user_id):
+    if await state.is_user_in_active_chat(user_id):
         await update.message.reply_text("Kamu sedang dalam sesi obrolan. Gunakan /stop untuk mengakhiri.")
         return
 
-    queue_position = chat_manager.get_user_queue_position(user_id)
+    queue_position = await state.get_user_queue_position(user_id)
     if queue_position:
-        total_in_queue = chat_manager.get_queue_size()
-        message = format_queue_message(user_id, queue_position, total_in_queue)
-        await update.message.reply_text(message)
+        total_in_queue = await state.get_queue_size()
+        wait = eta.estimate(queue_position) if eta else None
+        message = format_queue_message(user_id, queue_position, total_in_queue, wait)
+        status = await update.message.reply_text(message)
+        if positions:
+            positions.track(user_id, status.message_id, queue_position)
         return
 
     # Check if queue is full
-    if chat_manager.get_queue_size() >= chat_manager.max_queue_size:
-        await update.message.reply_text(format_max_queue_message(chat_manager.max_queue_size))
+    if await state.get_queue_size() >= state.max_queue_size:
+        await update.message.reply_text(format_max_queue_message(state.max_queue_size))
         return
 
-    # Add user to queue
-    success = chat_manager.add_user_to_queue(user_id)
+    # Add user to queue; the checks above may be stale by now, so the add decides
+    success = await state.add_user_to_queue(user_id)
     if not success:
-        await update.message.reply_text("Terjadi kesalahan saat memasukkan kamu ke antrian.")
+        if await state.get_queue_size() >= state.max_queue_size:
+            # Someone else took the last place in the meantime
+            await update.message.reply_text(format_max_queue_message(state.max_queue_size))
+        elif await state.is_user_in_active_chat(user_id):
+            await update.message.reply_text("Kamu sedang dalam sesi obrolan. Gunakan /stop untuk mengakhiri.")
+        else:
+            await update.message.reply_text("Terjadi kesalahan saat memasukkan kamu ke antrian.")
         return
 
-    queue_position = chat_manager.get_user_queue_position(user_id)
-    total_in_queue = chat_manager.get_queue_size()
+    if positions:
+        # A user with a head start may have been placed ahead of others
+        positions.queue_changed()
+    queue_position = await state.get_user_queue_position(user_id)
+    total_in_queue = await state.get_queue_size()
 
-    await update.message.reply_text(
-        f"Kamu telah masuk dalam antrian. Kamu di posisi #{queue_position} dari {total_in_queue}. Mohon menunggu."
-    )
+    wait = eta.estimate(queue_position) if eta and queue_position else None
+    status = await update.message.reply_text(format_queue_joined_message(queue_position, total_in_queue, wait))
+    # Later position changes are shown by editing this message
+    if positions and queue_position:
+        positions.track(user_id, status.message_id, queue_position)
 
-    # If user is first in queue and admin is not in chat, start the chat
-    if queue_position == 1 and not chat_manager.is_user_in_active_chat(ADMIN_USER_ID):
-        # This will be handled by the main bot logic when the first user is processed
-        pass
+    # The chat itself is started by the main bot logic as soon as an admin slot is free
 
 
-async def handle_stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE, chat_manager: ChatManager):
+async def handle_stop_command(update: Update, context: ContextTypes.DEFAULT_TYPE, state: StateBackend):
     user_id = update.effective_user.id
     logger.info(f"Received /stop from user {user_id}")
-    if (chat_manager.get_active_chat_partner(user_id) == ADMIN_USER_ID or 
-        chat_manager.get_active_chat_partner(ADMIN_USER_ID) == user_id):
+    if await state.get_active_chat_partner(user_id) is not None:
         # This will be handled by the main bot logic
         pass
     else:
@@ -98,4 +123,37 @@ Perintah yang tersedia:
 /stop - Mengakhiri sesi obrolan saat ini
 /help - Menampilkan pesan bantuan ini
     """
-    await update.message.reply_text(help_text)
\ No newline at end of file
+    await update.message.reply_text(help_text)
+
+async def handle_history_command(update: Update, context: ContextTypes.DEFAULT_TYPE, state: StateBackend,
+                                 transcripts: Optional[TranscriptStore]):
+    user_id = update.effective_user.id
+    if not state.is_agent(user_id):
+        await update.message.reply_text("Perintah ini hanya untuk admin.")
+        return
+    if transcripts is None:
+        await update.message.reply_text("Riwayat obrolan tidak diaktifkan.")
+        return
+
+    try:
+        target_id = int(context.args[0])
+        limit = int(context.args[1]) if len(context.args) > 1 else HISTORY_DEFAULT_LIMIT
+    except (IndexError, ValueError):
+        await update.message.reply_text("Gunakan: /history <user_id> [jumlah pesan]")
+        return
+
+    entries = await transcripts.history(target_id, max(1, min(limit, HISTORY_MAX_LIMIT)))
+    await update.message.reply_text(format_history_message(target_id, entries))
+
+
+async def handle_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE, state: StateBackend,
+                               stats: LiveStats, admin_ids: Iterable[int]):
+    user_id = update.effective_user.id
+    if not state.is_agent(user_id):
+        await update.message.reply_text("Perintah ini hanya untuk admin.")
+        return
+
+    # Aggregates are kept up to date as events happen, so nothing is scanned here
+    queued = await state.get_queue_size()
+    active = sum([len(await state.get_agent_sessions(admin_id)) for admin_id in admin_ids])
+    await update.message.reply_text(format_stats_message(stats.snapshot(), queued, active))
@@ -0,0 +1,102 @@
+from typing import Dict, Iterable, List, Optional
+import time
+
+LEAST_LOADED = "least_loaded"
+LONGEST_IDLE = "longest_idle"
+DISPATCH_STRATEGIES = (LEAST_LOADED, LONGEST_IDLE)
+
+
+class Agent:
+    """An admin with a fixed number of concurrent session slots"""
+
+    def __init__(self, user_id: int, max_sessions: int, idle_since: float):
+        self.user_id = user_id
+        self.max_sessions = max_sessions
+        # Ordered by last activity; the last entry is the session the agent is focused on
+        self.sessions: List[int] = []
+        # Time of the agent's last assignment or release
+        self.idle_since = idle_since
+
+    @property
+    def load(self) -> float:
+        return len(self.sessions) / self.max_sessions
+
+    @property
+    def has_free_slot(self) -> bool:
+        return len(self.sessions) < self.max_sessions
+
+
+class AgentPool:
+    """Tracks which agent serves which users and picks agents for new sessions"""
+
+    def __init__(self, agent_ids: Iterable[int], max_sessions: int = 1,
+                 strategy: str = LEAST_LOADED, clock=time.monotonic):
+        if strategy not in DISPATCH_STRATEGIES:
+            raise ValueError(f"Unknown dispatch strategy: {strategy}")
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.clock = clock
+        self.strategy = strategy
+        now = clock()
+        self.agents: Dict[int, Agent] = {}
+        for agent_id in agent_ids:
+            self.agents.setdefault(agent_id, Agent(agent_id, max_sessions, now))
+        self.free_slots = sum(agent.max_sessions for agent in self.agents.values())
+
+    def is_agent(self, user_id: int) -> bool:
+        """Check if user is one of the agents"""
+        return user_id in self.agents
+
+    @property
+    def total_slots(self) -> int:
+        return sum(agent.max_sessions for agent in self.agents.values())
+
+    def choose_agent(self) -> Optional[int]:
+        """Pick the agent that should take the next session, or None if all slots are taken"""
+        if not self.free_slots:
+            return None
+        candidates = [agent for agent in self.agents.values() if agent.has_free_slot]
+        if self.strategy == LONGEST_IDLE:
+            # Whoever has gone longest without a new chat or a finished one, however many they hold
+            best = min(candidates, key=lambda agent: (agent.idle_since, agent.load))
+        else:
+            best = min(candidates, key=lambda agent: (agent.load, agent.idle_since))
+        return best.user_id
+
+    def assign(self, agent_id: int, user_id: int):
+        """Give a session slot of an agent to a user"""
+        agent = self.agents[agent_id]
+        if not agent.has_free_slot:
+            raise ValueError(f"Agent {agent_id} has no free session slot")
+        agent.sessions.append(user_id)
+        self.free_slots -= 1
+        agent.idle_since = self.clock()
+
+    def release(self, agent_id: int, user_id: int) -> bool:
+        """Free the slot a user held with an agent"""
+        agent = self.agents.get(agent_id)
+        if agent is None or user_id not in agent.sessions:
+            return False
+        agent.sessions.remove(user_id)
+        self.free_slots += 1
+        agent.idle_since = self.clock()
+        return True
+
+    def focus(self, agent_id: int, user_id: int):
+        """Mark a session as the agent's most recently active one"""
+        sessions = self.agents[agent_id].sessions
+        if sessions and sessions[-1] != user_id and user_id in sessions:
+            sessions.remove(user_id)
+            sessions.append(user_id)
+
+    def focused_session(self, agent_id: int) -> Optional[int]:
+        """The user the agent most recently exchanged messages with"""
+        agent = self.agents.get(agent_id)
+        if agent is None or not agent.sessions:
+            return None
+        return agent.sessions[-1]
+
+    def sessions_of(self, agent_id: int) -> List[int]:
+        """Users currently served by an agent"""
+        agent = self.agents.get(agent_id)
+        return list(agent.sessions) if agent else []
@@ -1,28 +1,96 @@
-from collections import deque
-from datetime import datetime
-from typing import Dict, Optional
-import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+import time
+
+from models.agent_pool import AgentPool, LEAST_LOADED
+from models.priority_queue import NORMAL, PriorityQueue, choose_class
+from models.timeout_scheduler import TimeoutScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """One running chat: the admin serving it, its wall-clock start and how long the user queued for it"""
+    __slots__ = ("admin_id", "started_at", "waited")
+
+    def __init__(self, admin_id: int, started_at: float, waited: Optional[float] = None):
+        self.admin_id = admin_id
+        self.started_at = started_at
+        self.waited = waited
+
 
 class ChatManager:
-    def __init__(self, max_queue_size: int = 10, chat_timeout: int = 300):
-        self.user_queue = deque()
-        self.active_chats = {}
-        self.chat_start_times = {}
-        self.timeout_tasks = {}
+    def __init__(self, max_queue_size: int = 10, chat_timeout: int = 300, agent_ids: Iterable[int] = (),
+                 agent_max_sessions: int = 1, dispatch_strategy: str = LEAST_LOADED,
+                 priority_classes: Optional[Dict[str, float]] = None, vip_ids: Iterable[int] = (),
+                 max_requeues: int = 3, requeue_window: float = 3600, clock=time.monotonic):
+        self.user_queue = PriorityQueue(priority_classes)
+        self.vip_ids = set(vip_ids)
+        self.max_requeues = max_requeues
+        self.requeue_window = requeue_window
+        # user_id -> [timed_out, requeues, ended_at] of their last chat, kept for requeue_window seconds
+        self.history: Dict[int, List] = {}
+        self._history_limit = 1024
+        # user_id -> Session; the agent side lives in the agent pool
+        self.sessions: Dict[int, Session] = {}
+        self.agents = AgentPool(agent_ids, agent_max_sessions, dispatch_strategy, clock=clock)
+        self.timeouts = TimeoutScheduler(chat_timeout, clock=clock)
         self.max_queue_size = max_queue_size
         self.chat_timeout = chat_timeout
+        # Optional StateStore that journals every queue and session mutation
+        self.store = None
+
+    def _record(self, op: str, user_id: int, **fields):
+        if self.store is not None:
+            self.store.record(op, user_id, **fields)
+
+    def _record_deadline(self, user_id: int):
+        if self.store is not None:
+            # The scheduler runs on a monotonic clock; persist a wall clock deadline
+            remaining = self.timeouts.deadline(user_id) - self.timeouts.clock()
+            self.store.record("deadline", user_id, deadline=time.time() + remaining)
 
     def add_user_to_queue(self, user_id: int) -> bool:
         """Add user to queue if not already in queue or active chat"""
-        if user_id in self.active_chats:
+        if user_id in self.sessions or self.agents.is_agent(user_id):
             return False
         if user_id in self.user_queue:
             return False
         if len(self.user_queue) >= self.max_queue_size:
             return False
-        self.user_queue.append(user_id)
+        now = self.timeouts.clock()
+        cls = self._priority_class(user_id, now)
+        self.user_queue.append(user_id, cls, now)
+        self._record("enqueue", user_id, cls=cls, since=time.time())
         return True
 
+    def _priority_class(self, user_id: int, now: float) -> str:
+        """Class a joining user is queued in; counts the join as a re-queue after a recent chat"""
+        timed_out = None
+        requeues = 0
+        entry = self.history.get(user_id)
+        if entry is not None and now - entry[2] <= self.requeue_window:
+            entry[1] += 1
+            timed_out, requeues = entry[0], entry[1]
+        return choose_class(self.user_queue.boosts, user_id in self.vip_ids, timed_out, requeues,
+                            self.max_requeues)
+
+    def _remember_end(self, user_id: int, timed_out: bool):
+        now = self.timeouts.clock()
+        entry = self.history.get(user_id)
+        requeues = entry[1] if entry is not None and now - entry[2] <= self.requeue_window else 0
+        self.history[user_id] = [timed_out, requeues, now]
+        if len(self.history) > self._history_limit:
+            # Forget chats older than the window; the limit grows with what is left
+            self.history = {
+                user: entry for user, entry in self.history.items() if now - entry[2] <= self.requeue_window
+            }
+            self._history_limit = max(1024, 2 * len(self.history))
+
+    def get_user_priority_class(self, user_id: int) -> Optional[str]:
+        """Priority class a queued user waits in, or None if not in queue"""
+        return self.user_queue.class_of(user_id)
+
     def get_user_queue_position(self, user_id: int) -> Optional[int]:
         """Get user's position in queue (1-indexed), or None if not in queue"""
         if user_id in self.user_queue:
@@ -34,68 +102,162 @@ class ChatManager:
         return user_id in self.user_queue
 
     def is_user_in_active_chat(self, user_id: int) -> bool:
-        """Check if user is in active chat"""
-        return user_id in self.active_chats
+        """Check if user is in active chat; for agents, whether they serve anyone"""
+        if self.agents.is_agent(user_id):
+            return bool(self.agents.sessions_of(user_id))
+        return user_id in self.sessions
+
+    def is_agent(self, user_id: int) -> bool:
+        """Check if user is one of the admins serving the queue"""
+        return self.agents.is_agent(user_id)
 
     def start_chat(self, user_id: int, admin_id: int):
         """Start a chat session between user and admin"""
+        waited = None
         if user_id in self.user_queue:
+            waited = self.timeouts.clock() - self.user_queue.arrival_of(user_id)
             self.user_queue.remove(user_id)
-        self.active_chats[user_id] = admin_id
-        self.active_chats[admin_id] = user_id
-        self.chat_start_times[user_id] = datetime.now()
-
-    def end_chat(self, user_id: int, admin_id: int):
-        """End a chat session"""
-        self.active_chats.pop(user_id, None)
-        self.active_chats.pop(admin_id, None)
-        self.chat_start_times.pop(user_id, None)
-        
-        # Cancel timeout task if exists
-        if user_id in self.timeout_tasks:
-            self.timeout_tasks[user_id].cancel()
-            del self.timeout_tasks[user_id]
+        self.agents.assign(admin_id, user_id)
+        started_at = time.time()
+        self.sessions[user_id] = Session(admin_id, started_at, waited)
+        self._record("start", user_id, admin=admin_id, started_at=started_at)
+
+    def end_chat(self, user_id: int, admin_id: int, timed_out: bool = False) -> bool:
+        """End a chat session; returns False if it was already over"""
+        session = self.sessions.get(user_id)
+        if session is None or session.admin_id != admin_id:
+            return False
+        self._remember_end(user_id, timed_out)
+        del self.sessions[user_id]
+        self.agents.release(admin_id, user_id)
+        self.timeouts.cancel(user_id)
+        self._record("end", user_id, ended_at=time.time())
+        return True
+
+    def claim_next_session(self) -> Optional[Tuple[int, int]]:
+        """Pair the next queued user with a free agent, start their chat and arm its timeout"""
+        if not self.user_queue:
+            return None
+        admin_id = self.agents.choose_agent()
+        if admin_id is None:
+            return None
+        user_id = self.user_queue.peek()
+        self.start_chat(user_id, admin_id)
+        # Armed in the same step, so a session can never be left without a timeout
+        self.start_timeout_task(user_id, admin_id)
+        return user_id, admin_id
+
+    def get_agent_sessions(self, admin_id: int) -> List[int]:
+        """Users currently in a chat with an admin"""
+        return self.agents.sessions_of(admin_id)
+
+    def touch_session(self, user_id: int):
+        """Make a user's session the one its admin's replies go to"""
+        session = self.sessions.get(user_id)
+        if session is not None:
+            self.agents.focus(session.admin_id, user_id)
 
     def get_next_user_in_queue(self) -> Optional[int]:
         """Get the next user in queue"""
-        if self.user_queue:
-            return self.user_queue[0]
-        return None
+        return self.user_queue.peek()
 
-    def start_timeout_task(self, user_id: int, admin_id: int, callback):
-        """Start a timeout task for a chat session"""
-        if user_id in self.timeout_tasks:
-            self.timeout_tasks[user_id].cancel()
-        self.timeout_tasks[user_id] = asyncio.create_task(
-            self._timeout_task(user_id, admin_id, callback)
-        )
-
-    async def _timeout_task(self, user_id: int, admin_id: int, callback):
-        """Internal timeout task"""
-        try:
-            await asyncio.sleep(self.chat_timeout)
-            if self.active_chats.get(user_id) == admin_id:
-                await callback(user_id, admin_id)
-        except asyncio.CancelledError:
-            pass
+    def start_timeout_task(self, user_id: int, admin_id: int):
+        """Arm the timeout for a chat session"""
+        self.timeouts.arm(user_id, admin_id)
+        self._record_deadline(user_id)
+
+    def reset_timeout(self, user_id: int) -> bool:
+        """Push back the timeout of a chat session after activity"""
+        if not self.timeouts.reset(user_id):
+            return False
+        self._record_deadline(user_id)
+        return True
 
     def cancel_timeout_task(self, user_id: int):
-        """Cancel timeout task for a user"""
-        if user_id in self.timeout_tasks:
-            self.timeout_tasks[user_id].cancel()
-            del self.timeout_tasks[user_id]
+        """Cancel timeout for a user"""
+        self.timeouts.cancel(user_id)
+
+    def start_timeout_scheduler(self, callback):
+        """Start the background ticker that calls callback(user_id, admin_id) on timeout"""
+        async def on_expired(user_id: int, admin_id: int):
+            # Expiries are fired one after another; by the time this one runs the chat may
+            # have ended and a new one, with a fresh timeout, started with the same admin
+            session = self.sessions.get(user_id)
+            if session is not None and session.admin_id == admin_id and user_id not in self.timeouts:
+                await callback(user_id, admin_id)
+
+        self.timeouts.start(on_expired)
+
+    async def stop_timeout_scheduler(self):
+        """Stop the background timeout ticker"""
+        await self.timeouts.stop()
 
     def get_queue_size(self) -> int:
         """Get current queue size"""
         return len(self.user_queue)
 
+    def get_queued_users(self) -> List[int]:
+        """Users in the queue, front first"""
+        return list(self.user_queue)
+
     def get_active_chat_partner(self, user_id: int) -> Optional[int]:
-        """Get the chat partner for a user"""
-        return self.active_chats.get(user_id)
+        """Get the chat partner for a user; for admins, their most recently active user"""
+        if self.agents.is_agent(user_id):
+            return self.agents.focused_session(user_id)
+        session = self.sessions.get(user_id)
+        return None if session is None else session.admin_id
 
     def get_chat_duration(self, user_id: int) -> Optional[float]:
         """Get duration of current chat in seconds"""
-        if user_id in self.chat_start_times:
-            start_time = self.chat_start_times[user_id]
-            return (datetime.now() - start_time).total_seconds()
-        return None
\ No newline at end of file
+        session = self.sessions.get(user_id)
+        if session is None:
+            return None
+        return time.time() - session.started_at
+
+    def get_queue_wait(self, user_id: int) -> Optional[float]:
+        """Seconds a user in a chat waited in the queue for it, or None if not known"""
+        session = self.sessions.get(user_id)
+        return None if session is None else session.waited
+
+    def export_state(self) -> Dict[str, Any]:
+        """Plain-dict copy of the queue and sessions, as stored in snapshots"""
+        now = time.time()
+        clock_now = self.timeouts.clock()
+        sessions = {}
+        for user_id, session in self.sessions.items():
+            deadline = self.timeouts.deadline(user_id)
+            sessions[user_id] = {
+                "admin": session.admin_id,
+                "started_at": session.started_at,
+                "deadline": None if deadline is None else now + deadline - clock_now,
+            }
+        queue = [
+            [user_id, cls, now - (clock_now - arrival)] for user_id, cls, arrival in self.user_queue.entries()
+        ]
+        return {"queue": queue, "sessions": sessions}
+
+    def restore_state(self, state: Dict[str, Any]):
+        """Rebuild the queue and sessions from export_state() output and re-arm timeouts"""
+        now = time.time()
+        for user_id, session in state["sessions"].items():
+            admin_id = session["admin"]
+            if not self.agents.is_agent(admin_id) or not self.agents.agents[admin_id].has_free_slot:
+                logger.warning(f"Dropping restored chat of user {user_id}: admin {admin_id} has no free slot")
+                self._record("end", user_id)
+                continue
+            self.agents.assign(admin_id, user_id)
+            self.sessions[user_id] = Session(admin_id, session["started_at"])
+            deadline = session["deadline"]
+            timeout = self.chat_timeout if deadline is None else max(0.0, deadline - now)
+            self.timeouts.arm(user_id, admin_id, timeout=timeout)
+        # Entries are [user_id, class, waiting since]; older snapshots hold bare user ids
+        entries = [entry if isinstance(entry, list) else [entry, None, None] for entry in state["queue"]]
+        clock_now = self.timeouts.clock()
+        # Arrivals must be appended in order; users without one keep their place at the back
+        for user_id, cls, since in sorted(entries, key=lambda entry: now if entry[2] is None else entry[2]):
+            if user_id in self.sessions or user_id in self.user_queue:
+                continue
+            if cls not in self.user_queue.boosts:
+                cls = NORMAL
+            arrival = clock_now if since is None else clock_now - max(0.0, now - since)
+            self.user_queue.append(user_id, cls, arrival)
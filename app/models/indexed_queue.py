@@ -0,0 +1,188 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+_EMPTY = object()
+
+
+class IndexedQueue:
+    """FIFO queue with O(1) membership and O(log n) position lookup and removal.
+
+    Every appended item gets a slot (a sequence number). A Fenwick tree over the
+    slots counts the live items, so the rank of an item is a prefix sum and the
+    k-th item is a tree descent. Removed slots are left empty and reclaimed when
+    the slot array is rebuilt, which keeps every operation amortized O(log n).
+
+    Items may carry a sort key that never decreases from one append to the
+    next (an arrival time, say). The keys are then sorted by slot, so the
+    number of items below a given key is a binary search plus a prefix sum.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self._slots: Dict[Hashable, int] = {}
+        self._items: List[object] = []
+        # Unboxed doubles: 8 bytes a slot instead of a pointer plus a float object
+        self._keys = array("d")
+        self._tree: List[int] = []
+        self._capacity = 0
+        self._head = 0
+        self._tail = 0
+        self._reset(max(1, capacity))
+
+    def _reset(self, capacity: int):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self._capacity = size
+        self._items = [_EMPTY] * size
+        self._keys = array("d", bytes(8 * size))
+        self._tree = [0] * (size + 1)
+        self._head = 0
+        self._tail = 0
+
+    def _rebuild(self):
+        """Compact live items into a fresh slot array sized for further growth"""
+        live = [
+            (item, key)
+            for item, key in zip(self._items[self._head:self._tail], self._keys[self._head:self._tail])
+            if item is not _EMPTY
+        ]
+        self._reset(max(64, 2 * len(live)))
+        tree = self._tree
+        for slot, (item, key) in enumerate(live):
+            self._items[slot] = item
+            self._keys[slot] = key
+            self._slots[item] = slot
+            tree[slot + 1] += 1
+        # Linear-time Fenwick construction: push each node into its parent
+        for i in range(1, self._capacity + 1):
+            parent = i + (i & -i)
+            if parent <= self._capacity:
+                tree[parent] += tree[i]
+        self._tail = len(live)
+
+    def _add(self, slot: int, delta: int):
+        i = slot + 1
+        tree = self._tree
+        capacity = self._capacity
+        while i <= capacity:
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, slot: int) -> int:
+        """Number of live items in slots [0, slot]"""
+        i = slot + 1
+        total = 0
+        tree = self._tree
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def append(self, item: Hashable, key: float = 0.0):
+        """Add an item at the back of the queue, with a key no lower than the previous one"""
+        if item in self._slots:
+            raise ValueError(f"{item!r} is already in the queue")
+        if self._tail and key < self._keys[self._tail - 1]:
+            raise ValueError(f"key {key!r} is lower than the key of the last item")
+        if self._tail == self._capacity:
+            self._rebuild()
+        slot = self._tail
+        self._items[slot] = item
+        self._keys[slot] = key
+        self._slots[item] = slot
+        self._add(slot, 1)
+        self._tail += 1
+
+    def remove(self, item: Hashable):
+        """Remove an item from anywhere in the queue"""
+        slot = self._slots.pop(item, None)
+        if slot is None:
+            raise ValueError(f"{item!r} is not in the queue")
+        self._items[slot] = _EMPTY
+        self._add(slot, -1)
+        self._skip_empty_head()
+
+    def popleft(self) -> Hashable:
+        """Remove and return the item at the front of the queue"""
+        if not self._slots:
+            raise IndexError("pop from an empty queue")
+        self._skip_empty_head()
+        item = self._items[self._head]
+        self.remove(item)
+        return item
+
+    def peek(self) -> Optional[Hashable]:
+        """Return the item at the front of the queue without removing it"""
+        if not self._slots:
+            return None
+        self._skip_empty_head()
+        return self._items[self._head]
+
+    def index(self, item: Hashable) -> int:
+        """Return the 0-based position of an item"""
+        slot = self._slots.get(item)
+        if slot is None:
+            raise ValueError(f"{item!r} is not in the queue")
+        return self._prefix(slot) - 1
+
+    def key_of(self, item: Hashable) -> float:
+        """Return the key an item was appended with"""
+        slot = self._slots.get(item)
+        if slot is None:
+            raise ValueError(f"{item!r} is not in the queue")
+        return self._keys[slot]
+
+    def count_below(self, key: float, inclusive: bool = False) -> int:
+        """Number of items whose key is lower than key (or equal to it, if inclusive)"""
+        # Keys of emptied slots stay in place, so the slot range is still sorted
+        bisect = bisect_right if inclusive else bisect_left
+        slot = bisect(self._keys, key, self._head, self._tail)
+        return self._prefix(slot - 1) if slot else 0
+
+    def select(self, position: int) -> Hashable:
+        """Return the item at a 0-based position"""
+        if position < 0:
+            position += len(self._slots)
+        if not 0 <= position < len(self._slots):
+            raise IndexError("queue index out of range")
+        # Fenwick descent for the smallest slot whose prefix sum exceeds position
+        tree = self._tree
+        node = 0
+        remaining = position
+        step = self._capacity
+        while step:
+            nxt = node + step
+            if nxt <= self._capacity and tree[nxt] <= remaining:
+                node = nxt
+                remaining -= tree[nxt]
+            step >>= 1
+        return self._items[node]
+
+    def _skip_empty_head(self):
+        items = self._items
+        while self._head < self._tail and items[self._head] is _EMPTY:
+            self._head += 1
+
+    def __getitem__(self, position: int) -> Hashable:
+        return self.select(position)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def keyed(self) -> Iterator[Tuple[float, Hashable]]:
+        """(key, item) pairs, front first"""
+        for item, key in zip(self._items[self._head:self._tail], self._keys[self._head:self._tail]):
+            if item is not _EMPTY:
+                yield key, item
+
+    def __iter__(self) -> Iterator[Hashable]:
+        for item in self._items[self._head:self._tail]:
+            if item is not _EMPTY:
+                yield item
+
+    def __repr__(self) -> str:
+        return f"IndexedQueue({list(self)!r})"
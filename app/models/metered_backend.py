@@ -0,0 +1,119 @@
+from typing import List, Optional, Tuple
+
+from models.state_backend import StateBackend, TimeoutCallback
+from services.eta import WaitEstimator
+from services.live_stats import LiveStats
+from services.metrics import QUEUE_WAIT_SECONDS, SESSION_SECONDS, STATE_OP_SECONDS
+
+
+class MeteredBackend(StateBackend):
+    """Times every operation of another backend and records queue waits and session lengths.
+
+    Queue waits are asked from the backend once a chat starts, so users who
+    joined through another worker or before a restart are counted too. The
+    same events feed `stats`, if given, for the /stats command, and chat
+    lengths feed `eta`, if given, for the wait shown to queued users.
+    """
+
+    def __init__(self, backend: StateBackend, stats: Optional[LiveStats] = None,
+                 eta: Optional[WaitEstimator] = None):
+        self.backend = backend
+        self.stats = stats
+        self.eta = eta
+        self.max_queue_size = backend.max_queue_size
+        self._timers = {
+            op: STATE_OP_SECONDS.labels(op)
+            for op in (
+                "add_user_to_queue", "get_user_queue_position", "get_user_queue_positions", "get_queue_size",
+                "get_queued_users", "is_user_in_active_chat", "get_active_chat_partner", "get_agent_sessions",
+                "claim_next_session", "end_chat", "touch_session", "get_chat_duration", "get_queue_wait",
+                "start_timeout_task", "reset_timeout",
+            )
+        }
+
+    def is_agent(self, user_id: int) -> bool:
+        return self.backend.is_agent(user_id)
+
+    async def add_user_to_queue(self, user_id: int) -> bool:
+        with self._timers["add_user_to_queue"].time():
+            added = await self.backend.add_user_to_queue(user_id)
+        if added and self.stats is not None:
+            self.stats.record_join()
+        return added
+
+    async def get_user_queue_position(self, user_id: int) -> Optional[int]:
+        with self._timers["get_user_queue_position"].time():
+            return await self.backend.get_user_queue_position(user_id)
+
+    async def get_user_queue_positions(self, user_ids: List[int]) -> List[Optional[int]]:
+        with self._timers["get_user_queue_positions"].time():
+            return await self.backend.get_user_queue_positions(user_ids)
+
+    async def get_queue_size(self) -> int:
+        with self._timers["get_queue_size"].time():
+            return await self.backend.get_queue_size()
+
+    async def get_queued_users(self) -> List[int]:
+        with self._timers["get_queued_users"].time():
+            return await self.backend.get_queued_users()
+
+    async def is_user_in_active_chat(self, user_id: int) -> bool:
+        with self._timers["is_user_in_active_chat"].time():
+            return await self.backend.is_user_in_active_chat(user_id)
+
+    async def get_active_chat_partner(self, user_id: int) -> Optional[int]:
+        with self._timers["get_active_chat_partner"].time():
+            return await self.backend.get_active_chat_partner(user_id)
+
+    async def get_agent_sessions(self, admin_id: int) -> List[int]:
+        with self._timers["get_agent_sessions"].time():
+            return await self.backend.get_agent_sessions(admin_id)
+
+    async def claim_next_session(self) -> Optional[Tuple[int, int]]:
+        with self._timers["claim_next_session"].time():
+            claimed = await self.backend.claim_next_session()
+        if claimed is not None:
+            wait = await self.get_queue_wait(claimed[0])
+            if wait is not None:
+                QUEUE_WAIT_SECONDS.observe(wait)
+            if self.stats is not None:
+                self.stats.record_start(wait)
+        return claimed
+
+    async def end_chat(self, user_id: int, admin_id: int, timed_out: bool = False) -> bool:
+        duration = await self.get_chat_duration(user_id)
+        with self._timers["end_chat"].time():
+            ended = await self.backend.end_chat(user_id, admin_id, timed_out)
+        if ended and duration is not None:
+            SESSION_SECONDS.observe(duration)
+            if self.eta is not None:
+                self.eta.record_end(duration)
+        if ended and self.stats is not None:
+            self.stats.record_end(duration, timed_out)
+        return ended
+
+    async def touch_session(self, user_id: int):
+        with self._timers["touch_session"].time():
+            return await self.backend.touch_session(user_id)
+
+    async def get_chat_duration(self, user_id: int) -> Optional[float]:
+        with self._timers["get_chat_duration"].time():
+            return await self.backend.get_chat_duration(user_id)
+
+    async def get_queue_wait(self, user_id: int) -> Optional[float]:
+        with self._timers["get_queue_wait"].time():
+            return await self.backend.get_queue_wait(user_id)
+
+    async def start_timeout_task(self, user_id: int, admin_id: int):
+        with self._timers["start_timeout_task"].time():
+            return await self.backend.start_timeout_task(user_id, admin_id)
+
+    async def reset_timeout(self, user_id: int) -> bool:
+        with self._timers["reset_timeout"].time():
+            return await self.backend.reset_timeout(user_id)
+
+    async def start(self, timeout_callback: TimeoutCallback):
+        await self.backend.start(timeout_callback)
+
+    async def stop(self):
+        await self.backend.stop()
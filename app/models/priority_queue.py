@@ -0,0 +1,138 @@
+from operator import itemgetter
+from typing import Dict, Hashable, Iterator, Optional, Tuple
+
+from models.indexed_queue import IndexedQueue
+
+# Priority classes a waiting user can be in
+VIP = "vip"
+TIMED_OUT = "timed_out"  # their last chat ended by timeout
+RETURNING = "returning"  # their last chat ended normally
+NORMAL = "normal"
+
+
+def choose_class(boosts: Dict[str, float], vip: bool, timed_out: Optional[bool], requeues: int,
+                 max_requeues: int) -> str:
+    """Class of a user joining the queue.
+
+    timed_out is None for users without a recent chat; requeues counts their
+    re-joins since then, including this one. Past max_requeues a user joins
+    as a normal user. Classes missing from boosts are skipped.
+    """
+    if vip and VIP in boosts:
+        return VIP
+    if timed_out is not None and requeues <= max_requeues:
+        cls = TIMED_OUT if timed_out else RETURNING
+        if cls in boosts:
+            return cls
+    return NORMAL
+
+
+class PriorityQueue:
+    """Waiting queue that serves users by arrival time minus the head start of their class.
+
+    Each class gives its users a head start of some seconds over normal
+    users. Everyone's priority grows with the time they have waited, so a
+    user of a lower class is only passed by users of a higher class who
+    arrived less than the difference in head start after them, and nobody
+    starves. Because the sort key (arrival minus head start) never changes
+    while a user waits, every class is a FIFO IndexedQueue: the next user is
+    the best of the class heads, and a position is one IndexedQueue.index()
+    plus a count_below() in each other class, both O(log n).
+
+    On equal keys the class with the larger head start goes first.
+    """
+
+    def __init__(self, boosts: Optional[Dict[str, float]] = None):
+        self.boosts = {NORMAL: 0.0, **(boosts or {})}
+        self._order = sorted(self.boosts, key=lambda cls: -self.boosts[cls])
+        self._rank = {cls: rank for rank, cls in enumerate(self._order)}
+        self._queues = {cls: IndexedQueue() for cls in self._order}
+        self._class_of: Dict[Hashable, str] = {}
+
+    def append(self, item: Hashable, cls: str = NORMAL, arrival: float = 0.0):
+        """Add an item that arrived at `arrival`; arrivals within a class must not decrease"""
+        if cls not in self.boosts:
+            raise ValueError(f"Unknown priority class {cls!r}")
+        if item in self._class_of:
+            raise ValueError(f"{item!r} is already in the queue")
+        self._queues[cls].append(item, key=arrival - self.boosts[cls])
+        self._class_of[item] = cls
+
+    def _front_class(self) -> Optional[str]:
+        front = None
+        front_key = 0.0
+        for cls in self._order:
+            queue = self._queues[cls]
+            if queue:
+                key = queue.key_of(queue.peek())
+                if front is None or key < front_key:
+                    front, front_key = cls, key
+        return front
+
+    def popleft(self) -> Hashable:
+        """Remove and return the item to serve next"""
+        cls = self._front_class()
+        if cls is None:
+            raise IndexError("pop from an empty queue")
+        item = self._queues[cls].popleft()
+        del self._class_of[item]
+        return item
+
+    def peek(self) -> Optional[Hashable]:
+        """Return the item to serve next without removing it"""
+        cls = self._front_class()
+        return None if cls is None else self._queues[cls].peek()
+
+    def remove(self, item: Hashable):
+        """Remove an item from anywhere in the queue"""
+        cls = self._class_of.pop(item, None)
+        if cls is None:
+            raise ValueError(f"{item!r} is not in the queue")
+        self._queues[cls].remove(item)
+
+    def index(self, item: Hashable) -> int:
+        """Return the 0-based position of an item in serving order"""
+        cls = self._class_of.get(item)
+        if cls is None:
+            raise ValueError(f"{item!r} is not in the queue")
+        queue = self._queues[cls]
+        key = queue.key_of(item)
+        rank = self._rank[cls]
+        position = queue.index(item)
+        for other_cls, other in self._queues.items():
+            if other is not queue and other:
+                position += other.count_below(key, inclusive=self._rank[other_cls] < rank)
+        return position
+
+    def class_of(self, item: Hashable) -> Optional[str]:
+        return self._class_of.get(item)
+
+    def arrival_of(self, item: Hashable) -> float:
+        cls = self._class_of[item]
+        return self._queues[cls].key_of(item) + self.boosts[cls]
+
+    def entries(self) -> Iterator[Tuple[Hashable, str, float]]:
+        """(item, class, arrival) in serving order"""
+        for item in self:
+            yield item, self._class_of[item], self.arrival_of(item)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._class_of
+
+    def __len__(self) -> int:
+        return len(self._class_of)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        streams = [self._queues[cls] for cls in self._order if self._queues[cls]]
+        if len(streams) == 1:
+            yield from streams[0]
+            return
+        # Each class is already sorted, so this sort only merges the runs; being stable,
+        # it keeps the class order on equal keys
+        entries = [entry for queue in streams for entry in queue.keyed()]
+        entries.sort(key=itemgetter(0))
+        for _, item in entries:
+            yield item
+
+    def __repr__(self) -> str:
+        return f"PriorityQueue({list(self)!r})"
@@ -0,0 +1,308 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import socket
+import time
+
+from models.agent_pool import LEAST_LOADED, LONGEST_IDLE
+from models.priority_queue import NORMAL, choose_class
+from models.state_backend import StateBackend, TimeoutCallback
+from services.resp_client import RespClient
+
+logger = logging.getLogger(__name__)
+
+
+class RedisBackend(StateBackend):
+    """Queue and session state in a Redis-compatible server, shared by several bot workers.
+
+    Transitions that touch several keys run as WATCH/MULTI/EXEC transactions
+    on a connection of their own: the state they depend on is read under
+    WATCH, and the writes are applied all together or, if another worker
+    changed a watched key in between, not at all and the attempt is
+    retried. A worker that dies half-way leaves nothing half-done.
+
+    * enqueue: watches the user's session, the queue and their chat history;
+      adds them scored by the join time minus the head start of their
+      priority class, unless the queue is full.
+    * claim-next: watches the queue and the agent loads; pops the head and
+      books it on the agent chosen by the dispatch strategy.
+    * end: watches the session, so exactly one caller ends it.
+    * timeouts: deadlines are a sorted set shared by all workers; a worker
+      must win ``SET lease NX PX`` before it may fire end_chat_callback.
+
+    Transactions of one worker take turns on its connection; everything
+    else is pipelined on the shared client.
+    """
+
+    def __init__(self, client: RespClient, agent_ids: Iterable[int], agent_max_sessions: int = 1,
+                 dispatch_strategy: str = LEAST_LOADED, max_queue_size: int = 10, chat_timeout: int = 300,
+                 prefix: str = "pnj", worker_id: Optional[str] = None, lease_ttl: float = 30,
+                 tick_interval: float = 1.0, priority_classes: Optional[Dict[str, float]] = None,
+                 vip_ids: Iterable[int] = (), max_requeues: int = 3, requeue_window: float = 3600,
+                 clock: Callable[[], float] = time.time):
+        self.client = client
+        self.agent_ids = list(dict.fromkeys(agent_ids))
+        self.agent_max_sessions = agent_max_sessions
+        self.dispatch_strategy = dispatch_strategy
+        self.max_queue_size = max_queue_size
+        self.chat_timeout = chat_timeout
+        self.prefix = prefix
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_ttl = lease_ttl
+        self.tick_interval = tick_interval
+        self.boosts = {NORMAL: 0.0, **(priority_classes or {})}
+        self.vip_ids = set(vip_ids)
+        self.max_requeues = max_requeues
+        self.requeue_window = requeue_window
+        self.clock = clock
+        self._agent_set = set(self.agent_ids)
+        # WATCH state belongs to a connection, so transactions get their own
+        self._tx = client.dedicated()
+        self._tx_lock = asyncio.Lock()
+        self._ticker: Optional[asyncio.Task] = None
+        # user_id -> task ending that expired session; cancelled on stop
+        self._firing: Dict[int, asyncio.Task] = {}
+
+    def _key(self, *parts) -> str:
+        return ":".join((self.prefix,) + tuple(str(part) for part in parts))
+
+    def is_agent(self, user_id: int) -> bool:
+        return user_id in self._agent_set
+
+    async def add_user_to_queue(self, user_id: int) -> bool:
+        if self.is_agent(user_id):
+            return False
+        queue, sessions, history_key = self._key("queue"), self._key("sessions"), self._key("history", user_id)
+        async with self._tx_lock:
+            while True:
+                _, in_chat, score, size, history = await self._tx.pipeline(
+                    ("WATCH", sessions, queue, history_key),
+                    ("HEXISTS", sessions, user_id), ("ZSCORE", queue, user_id), ("ZCARD", queue), ("GET", history_key),
+                )
+                if in_chat or score is not None or size >= self.max_queue_size:
+                    await self._tx.execute("UNWATCH")
+                    return False
+                now = self.clock()
+                cls, remember = self._priority_class(user_id, history, now)
+                # The score holds the head start too, so the join time is kept for the wait at claim
+                commands = [
+                    ("ZADD", queue, now - self.boosts[cls], user_id),
+                    ("HSET", self._key("joined"), user_id, now),
+                ]
+                if remember is not None:
+                    commands.append(remember)
+                if await self._tx.transaction(*commands) is not None:
+                    return True
+
+    def _priority_class(self, user_id: int, history: Optional[str], now: float) -> Tuple[str, Optional[tuple]]:
+        """Class a joining user is queued in, and the command counting the join as a re-queue after a recent chat"""
+        timed_out = None
+        requeues = 0
+        remember = None
+        # "timed_out requeues ended_at" of the last chat, expiring requeue_window seconds after it ended
+        if history is not None:
+            flag, requeues, ended_at = history.split()
+            timed_out, requeues = flag == "1", int(requeues) + 1
+            remember = self._remember(user_id, timed_out, requeues, float(ended_at), now)
+        return choose_class(self.boosts, user_id in self.vip_ids, timed_out, requeues, self.max_requeues), remember
+
+    def _remember(self, user_id: int, timed_out: bool, requeues: int, ended_at: float, now: float) -> Optional[tuple]:
+        """Command storing the chat history of a user, or None once it has expired"""
+        ttl = int((ended_at + self.requeue_window - now) * 1000)
+        if ttl <= 0:
+            return None
+        return "SET", self._key("history", user_id), f"{int(timed_out)} {requeues} {ended_at}", "PX", ttl
+
+    async def get_user_queue_position(self, user_id: int) -> Optional[int]:
+        rank = await self.client.execute("ZRANK", self._key("queue"), user_id)
+        return None if rank is None else rank + 1
+
+    async def get_user_queue_positions(self, user_ids: List[int]) -> List[Optional[int]]:
+        if not user_ids:
+            return []
+        queue = self._key("queue")
+        ranks = await self.client.pipeline(*(("ZRANK", queue, user_id) for user_id in user_ids))
+        return [None if rank is None else rank + 1 for rank in ranks]
+
+    async def get_queue_size(self) -> int:
+        return await self.client.execute("ZCARD", self._key("queue"))
+
+    async def get_queued_users(self) -> List[int]:
+        return [int(user_id) for user_id in await self.client.execute("ZRANGE", self._key("queue"), 0, -1)]
+
+    async def is_user_in_active_chat(self, user_id: int) -> bool:
+        if self.is_agent(user_id):
+            return await self.client.execute("SCARD", self._key("agent", user_id)) > 0
+        return bool(await self.client.execute("HEXISTS", self._key("sessions"), user_id))
+
+    async def get_active_chat_partner(self, user_id: int) -> Optional[int]:
+        if self.is_agent(user_id):
+            partner = await self.client.execute("HGET", self._key("focus"), user_id)
+            if partner is None:
+                partner = await self.client.execute("SRANDMEMBER", self._key("agent", user_id))
+        else:
+            partner = await self.client.execute("HGET", self._key("sessions"), user_id)
+        return None if partner is None else int(partner)
+
+    async def get_agent_sessions(self, admin_id: int) -> List[int]:
+        members = await self.client.execute("SMEMBERS", self._key("agent", admin_id))
+        return [int(member) for member in members]
+
+    def _agent_candidates(self, loads: Dict[int, int], idle: Dict[int, float]) -> List[int]:
+        """Agents with a free slot, ordered by the dispatch strategy"""
+        if self.dispatch_strategy == LONGEST_IDLE:
+            key = lambda agent: (idle.get(agent, 0.0), loads.get(agent, 0))
+        else:
+            key = lambda agent: (loads.get(agent, 0) / self.agent_max_sessions, idle.get(agent, 0.0))
+        return [agent for agent in sorted(self.agent_ids, key=key) if loads.get(agent, 0) < self.agent_max_sessions]
+
+    @staticmethod
+    def _pairs(flat: List[str], kind) -> dict:
+        """HGETALL reply as a dict of agent id -> value"""
+        return {int(flat[i]): kind(flat[i + 1]) for i in range(0, len(flat), 2)}
+
+    async def claim_next_session(self) -> Optional[Tuple[int, int]]:
+        queue, load, idle = self._key("queue"), self._key("load"), self._key("idle")
+        if not await self.client.execute("ZCARD", queue):
+            return None
+        async with self._tx_lock:
+            while True:
+                _, head, loads, idle_since = await self._tx.pipeline(
+                    ("WATCH", queue, load), ("ZRANGE", queue, 0, 0), ("HGETALL", load), ("HGETALL", idle)
+                )
+                candidates = self._agent_candidates(self._pairs(loads, int), self._pairs(idle_since, float))
+                if not head or not candidates:
+                    await self._tx.execute("UNWATCH")
+                    return None
+                user_id, admin_id = int(head[0]), candidates[0]
+                now = self.clock()
+                claimed = await self._tx.transaction(
+                    ("ZREM", queue, user_id),
+                    ("HINCRBY", load, admin_id, 1),
+                    ("HSET", self._key("sessions"), user_id, admin_id),
+                    ("ZADD", self._key("deadlines"), now + self.chat_timeout, user_id),
+                    ("HSET", self._key("started"), user_id, now),
+                    ("SADD", self._key("agent", admin_id), user_id),
+                    ("HSET", self._key("focus"), admin_id, user_id),
+                    ("HSET", idle, admin_id, now),
+                )
+                if claimed is not None:
+                    return user_id, admin_id
+
+    async def end_chat(self, user_id: int, admin_id: int, timed_out: bool = False) -> bool:
+        sessions, focus, history_key = self._key("sessions"), self._key("focus"), self._key("history", user_id)
+        async with self._tx_lock:
+            while True:
+                _, partner, focused, history = await self._tx.pipeline(
+                    ("WATCH", sessions, focus, history_key),
+                    ("HGET", sessions, user_id), ("HGET", focus, admin_id), ("GET", history_key),
+                )
+                if partner is None or int(partner) != admin_id:
+                    await self._tx.execute("UNWATCH")
+                    return False
+                now = self.clock()
+                commands = [
+                    ("HDEL", sessions, user_id),
+                    ("HINCRBY", self._key("load"), admin_id, -1),
+                    ("HSET", self._key("idle"), admin_id, now),
+                    ("SREM", self._key("agent", admin_id), user_id),
+                    ("HDEL", self._key("started"), user_id),
+                    ("HDEL", self._key("joined"), user_id),
+                    ("ZREM", self._key("deadlines"), user_id),
+                ]
+                if focused is not None and int(focused) == user_id:
+                    commands.append(("HDEL", focus, admin_id))
+                requeues = 0 if history is None else int(history.split()[1])
+                remember = self._remember(user_id, timed_out, requeues, now, now)
+                if remember is not None:
+                    commands.append(remember)
+                if await self._tx.transaction(*commands) is not None:
+                    return True
+
+    async def touch_session(self, user_id: int):
+        admin_id = await self.client.execute("HGET", self._key("sessions"), user_id)
+        if admin_id is not None:
+            await self.client.execute("HSET", self._key("focus"), admin_id, user_id)
+
+    async def get_chat_duration(self, user_id: int) -> Optional[float]:
+        started = await self.client.execute("HGET", self._key("started"), user_id)
+        return None if started is None else self.clock() - float(started)
+
+    async def get_queue_wait(self, user_id: int) -> Optional[float]:
+        joined, started = await self.client.pipeline(
+            ("HGET", self._key("joined"), user_id), ("HGET", self._key("started"), user_id)
+        )
+        return None if joined is None or started is None else float(started) - float(joined)
+
+    async def start_timeout_task(self, user_id: int, admin_id: int):
+        await self.client.execute("ZADD", self._key("deadlines"), self.clock() + self.chat_timeout, user_id)
+
+    async def reset_timeout(self, user_id: int) -> bool:
+        changed = await self.client.execute(
+            "ZADD", self._key("deadlines"), "XX", "CH", self.clock() + self.chat_timeout, user_id
+        )
+        return bool(changed)
+
+    async def _fire(self, callback: TimeoutCallback, user_id: int, now: float):
+        """End one expired session if this worker wins its lease"""
+        lease = self._key("lease", user_id)
+        if await self.client.execute("SET", lease, self.worker_id, "NX", "PX", int(self.lease_ttl * 1000)) != "OK":
+            return
+        try:
+            deadline = await self.client.execute("ZSCORE", self._key("deadlines"), user_id)
+            if deadline is None or float(deadline) > now:
+                return
+            admin_id = await self.client.execute("HGET", self._key("sessions"), user_id)
+            if admin_id is None:
+                await self.client.execute("ZREM", self._key("deadlines"), user_id)
+                return
+            await callback(user_id, int(admin_id))
+        except Exception as e:
+            logger.error(f"Timeout callback failed for {user_id}: {e}")
+        finally:
+            await self.client.execute("DEL", lease)
+
+    async def fire_expired(self, callback: TimeoutCallback) -> int:
+        """Start a task for every expired session not already being ended here; returns how many were started"""
+        now = self.clock()
+        due = await self.client.execute("ZRANGEBYSCORE", self._key("deadlines"), "-inf", now, "LIMIT", 0, 100)
+        started = 0
+        for member in due:
+            user_id = int(member)
+            if user_id in self._firing:
+                continue
+            task = asyncio.create_task(self._fire(callback, user_id, now))
+            self._firing[user_id] = task
+            task.add_done_callback(lambda _, user_id=user_id: self._firing.pop(user_id, None))
+            started += 1
+        return started
+
+    async def _run(self, callback: TimeoutCallback):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            try:
+                await self.fire_expired(callback)
+            except ConnectionError as e:
+                logger.error(f"Timeout ticker could not reach the state server: {e}")
+
+    async def start(self, timeout_callback: TimeoutCallback):
+        await self.client.connect()
+        await self._tx.connect()
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.create_task(self._run(timeout_callback))
+
+    async def stop(self):
+        if self._ticker is not None:
+            self._ticker.cancel()
+            try:
+                await self._ticker
+            except asyncio.CancelledError:
+                pass
+            self._ticker = None
+        for task in self._firing.values():
+            task.cancel()
+        if self._firing:
+            await asyncio.gather(*self._firing.values(), return_exceptions=True)
+        await self.client.close()
+        await self._tx.close()
@@ -0,0 +1,170 @@
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List, Optional, Tuple
+import logging
+import time
+
+from models.chat_manager import ChatManager
+
+logger = logging.getLogger(__name__)
+
+TimeoutCallback = Callable[[int, int], Awaitable[None]]
+
+
+class StateBackend(ABC):
+    """Queue and session state shared by the handlers.
+
+    Mirrors the public API of ChatManager, but every operation is a coroutine
+    so the state can live in another process. Each method is atomic on its
+    own: two workers can never claim the same user or the same agent slot,
+    a claimed session always has its timeout armed, and only one caller of
+    end_chat for a session gets True.
+    """
+
+    max_queue_size: int
+
+    @abstractmethod
+    def is_agent(self, user_id: int) -> bool:
+        """Check if user is one of the admins serving the queue (static configuration)"""
+
+    @abstractmethod
+    async def add_user_to_queue(self, user_id: int) -> bool:
+        """Add user to queue if not already queued, chatting, or over the size limit"""
+
+    @abstractmethod
+    async def get_user_queue_position(self, user_id: int) -> Optional[int]:
+        """Get user's position in queue (1-indexed), or None if not in queue"""
+
+    @abstractmethod
+    async def get_user_queue_positions(self, user_ids: List[int]) -> List[Optional[int]]:
+        """get_user_queue_position for several users in one call"""
+
+    @abstractmethod
+    async def get_queue_size(self) -> int:
+        """Get current queue size"""
+
+    @abstractmethod
+    async def get_queued_users(self) -> List[int]:
+        """Users in the queue, front first"""
+
+    @abstractmethod
+    async def is_user_in_active_chat(self, user_id: int) -> bool:
+        """Check if user is in active chat; for agents, whether they serve anyone"""
+
+    @abstractmethod
+    async def get_active_chat_partner(self, user_id: int) -> Optional[int]:
+        """Get the chat partner for a user; for admins, their most recently active user"""
+
+    @abstractmethod
+    async def get_agent_sessions(self, admin_id: int) -> List[int]:
+        """Users currently in a chat with an admin"""
+
+    @abstractmethod
+    async def claim_next_session(self) -> Optional[Tuple[int, int]]:
+        """Pair the next queued user with a free agent, start their chat and arm its timeout"""
+
+    @abstractmethod
+    async def end_chat(self, user_id: int, admin_id: int, timed_out: bool = False) -> bool:
+        """End a chat session (that timed out, if timed_out); returns False if it was already over"""
+
+    @abstractmethod
+    async def touch_session(self, user_id: int):
+        """Make a user's session the one its admin's replies go to"""
+
+    @abstractmethod
+    async def get_chat_duration(self, user_id: int) -> Optional[float]:
+        """Get duration of current chat in seconds"""
+
+    @abstractmethod
+    async def get_queue_wait(self, user_id: int) -> Optional[float]:
+        """Seconds a user in a chat waited in the queue for it, or None if not known"""
+
+    @abstractmethod
+    async def start_timeout_task(self, user_id: int, admin_id: int):
+        """Arm the timeout for a chat session"""
+
+    @abstractmethod
+    async def reset_timeout(self, user_id: int) -> bool:
+        """Push back the timeout of a chat session after activity"""
+
+    @abstractmethod
+    async def start(self, timeout_callback: TimeoutCallback):
+        """Load state and start the timeout ticker; timeout_callback(user_id, admin_id) ends a chat"""
+
+    @abstractmethod
+    async def stop(self):
+        """Stop background tasks and release resources"""
+
+
+class InMemoryBackend(StateBackend):
+    """Process-local state held in a ChatManager, optionally journaled to a StateStore"""
+
+    def __init__(self, chat_manager: ChatManager, store=None):
+        self.chat_manager = chat_manager
+        self.store = store
+        self.max_queue_size = chat_manager.max_queue_size
+
+    def is_agent(self, user_id: int) -> bool:
+        return self.chat_manager.is_agent(user_id)
+
+    async def add_user_to_queue(self, user_id: int) -> bool:
+        return self.chat_manager.add_user_to_queue(user_id)
+
+    async def get_user_queue_position(self, user_id: int) -> Optional[int]:
+        return self.chat_manager.get_user_queue_position(user_id)
+
+    async def get_user_queue_positions(self, user_ids: List[int]) -> List[Optional[int]]:
+        return [self.chat_manager.get_user_queue_position(user_id) for user_id in user_ids]
+
+    async def get_queue_size(self) -> int:
+        return self.chat_manager.get_queue_size()
+
+    async def get_queued_users(self) -> List[int]:
+        return self.chat_manager.get_queued_users()
+
+    async def is_user_in_active_chat(self, user_id: int) -> bool:
+        return self.chat_manager.is_user_in_active_chat(user_id)
+
+    async def get_active_chat_partner(self, user_id: int) -> Optional[int]:
+        return self.chat_manager.get_active_chat_partner(user_id)
+
+    async def get_agent_sessions(self, admin_id: int) -> List[int]:
+        return self.chat_manager.get_agent_sessions(admin_id)
+
+    async def claim_next_session(self) -> Optional[Tuple[int, int]]:
+        return self.chat_manager.claim_next_session()
+
+    async def end_chat(self, user_id: int, admin_id: int, timed_out: bool = False) -> bool:
+        return self.chat_manager.end_chat(user_id, admin_id, timed_out)
+
+    async def touch_session(self, user_id: int):
+        self.chat_manager.touch_session(user_id)
+
+    async def get_chat_duration(self, user_id: int) -> Optional[float]:
+        return self.chat_manager.get_chat_duration(user_id)
+
+    async def get_queue_wait(self, user_id: int) -> Optional[float]:
+        return self.chat_manager.get_queue_wait(user_id)
+
+    async def start_timeout_task(self, user_id: int, admin_id: int):
+        self.chat_manager.start_timeout_task(user_id, admin_id)
+
+    async def reset_timeout(self, user_id: int) -> bool:
+        return self.chat_manager.reset_timeout(user_id)
+
+    async def start(self, timeout_callback: TimeoutCallback):
+        if self.store is not None:
+            started = time.perf_counter()
+            state = self.store.load()
+            self.chat_manager.store = self.store
+            self.chat_manager.restore_state(state)
+            self.store.start(self.chat_manager.export_state)
+            logger.info(
+                f"Restored {len(state['queue'])} queued users and {len(state['sessions'])} chats "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms."
+            )
+        self.chat_manager.start_timeout_scheduler(timeout_callback)
+
+    async def stop(self):
+        await self.chat_manager.stop_timeout_scheduler()
+        if self.store is not None:
+            await self.store.close()
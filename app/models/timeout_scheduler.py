@@ -0,0 +1,152 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+import asyncio
+import heapq
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TimeoutScheduler:
+    """Session timeouts driven by one background ticker.
+
+    Deadlines live in a dict and a min-heap with lazy deletion. Resetting a
+    deadline only rewrites the dict entry; the stale heap entry is noticed when
+    it reaches the top and is pushed back with the current deadline. Cancelled
+    keys are dropped the same way, so no task or timer handle is created per
+    message. Expiry callbacks run as tasks of their own, so a burst of
+    timeouts ends its chats side by side and never holds up the ticker.
+    """
+
+    def __init__(self, timeout: float, clock: Callable[[], float] = time.monotonic, tick_interval: float = 1.0):
+        self.timeout = timeout
+        self.clock = clock
+        self.tick_interval = tick_interval
+        self._deadlines: Dict[Hashable, float] = {}
+        self._payloads: Dict[Hashable, Any] = {}
+        # Deadline of the one live heap entry for each key; anything else in the heap is stale
+        self._scheduled: Dict[Hashable, float] = {}
+        self._heap: List[Tuple[float, int, Hashable]] = []
+        self._counter = 0
+        self._ticker: Optional[asyncio.Task] = None
+        # Expiry callbacks still running; cancelled on stop
+        self._firing: Set[asyncio.Task] = set()
+
+    def arm(self, key: Hashable, payload: Any = None, timeout: Optional[float] = None, now: Optional[float] = None):
+        """Set (or replace) the deadline for a key"""
+        now = self.clock() if now is None else now
+        deadline = now + (self.timeout if timeout is None else timeout)
+        self._deadlines[key] = deadline
+        self._payloads[key] = payload
+        scheduled = self._scheduled.get(key)
+        if scheduled is None or deadline < scheduled:
+            self._push(key, deadline)
+
+    def reset(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """Push a key's deadline back by the full timeout; only touches the dict"""
+        if key not in self._deadlines:
+            return False
+        now = self.clock() if now is None else now
+        deadline = now + self.timeout
+        if deadline > self._deadlines[key]:
+            self._deadlines[key] = deadline
+        else:
+            self.arm(key, self._payloads[key], now=now)
+        return True
+
+    def cancel(self, key: Hashable):
+        """Forget a key; its heap entry is discarded when it surfaces"""
+        self._deadlines.pop(key, None)
+        self._payloads.pop(key, None)
+        self._scheduled.pop(key, None)
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._scheduled):
+            self._compact()
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        """Current deadline for a key, in clock units"""
+        return self._deadlines.get(key)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._deadlines
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def _push(self, key: Hashable, deadline: float):
+        self._counter += 1
+        heapq.heappush(self._heap, (deadline, self._counter, key))
+        self._scheduled[key] = deadline
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._scheduled.get(entry[2]) == entry[0]]
+        heapq.heapify(self._heap)
+
+    def poll(self, now: Optional[float] = None) -> List[Tuple[Hashable, Any]]:
+        """Remove and return every (key, payload) whose deadline has passed"""
+        now = self.clock() if now is None else now
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            scheduled, _, key = heapq.heappop(self._heap)
+            if self._scheduled.get(key) != scheduled:
+                continue
+            deadline = self._deadlines[key]
+            if deadline > now:
+                # Deadline was reset since this entry was pushed
+                self._push(key, deadline)
+                continue
+            del self._deadlines[key]
+            del self._scheduled[key]
+            expired.append((key, self._payloads.pop(key, None)))
+        return expired
+
+    def next_deadline(self) -> Optional[float]:
+        """Earliest heap entry; may be earlier than the real next expiry"""
+        return self._heap[0][0] if self._heap else None
+
+    async def _fire(self, callback: Callable[[Hashable, Any], Awaitable[None]], key: Hashable, payload: Any):
+        try:
+            await callback(key, payload)
+        except Exception as e:
+            logger.error(f"Timeout callback failed for {key}: {e}")
+
+    async def fire_expired(self, callback: Callable[[Hashable, Any], Awaitable[None]], now: Optional[float] = None) -> int:
+        """Poll and start the callback for each expired key as a task; returns how many were started"""
+        expired = self.poll(now)
+        for key, payload in expired:
+            task = asyncio.create_task(self._fire(callback, key, payload))
+            self._firing.add(task)
+            task.add_done_callback(self._firing.discard)
+        return len(expired)
+
+    async def wait_fired(self):
+        """Wait for the expiry callbacks started so far"""
+        if self._firing:
+            await asyncio.gather(*self._firing)
+
+    async def _run(self, callback: Callable[[Hashable, Any], Awaitable[None]]):
+        while True:
+            delay = self.tick_interval
+            next_deadline = self.next_deadline()
+            if next_deadline is not None:
+                delay = min(delay, max(0.0, next_deadline - self.clock()))
+            await asyncio.sleep(delay)
+            await self.fire_expired(callback)
+
+    def start(self, callback: Callable[[Hashable, Any], Awaitable[None]]):
+        """Start the background ticker on the running event loop"""
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.create_task(self._run(callback))
+
+    async def stop(self):
+        """Stop the background ticker and any expiry callbacks still running"""
+        if self._ticker is not None:
+            self._ticker.cancel()
+            try:
+                await self._ticker
+            except asyncio.CancelledError:
+                pass
+            self._ticker = None
+        for task in self._firing:
+            task.cancel()
+        if self._firing:
+            await asyncio.gather(*self._firing, return_exceptions=True)
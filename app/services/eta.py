@@ -0,0 +1,37 @@
+from typing import Optional
+
+
+class WaitEstimator:
+    """Estimated queue wait for a position, from recent chat lengths and the number of session slots.
+
+    While every slot is busy a slot frees up on average every mean / slots
+    seconds, so the user at position p is served after about p of those.
+    The mean is exponentially weighted over about the last `sessions` chats
+    and is updated once per ended chat, together with the seconds per
+    position; an estimate is then one multiplication. Until the first chat
+    ends there is no estimate. Each worker learns from the chats it ends
+    itself, which is a fair sample of all of them.
+    """
+
+    def __init__(self, slots: int, sessions: int = 50):
+        self.slots = slots
+        self.alpha = 1 / sessions
+        # Decayed sum of chat lengths and of their weights; their ratio is the mean
+        self._sum = 0.0
+        self._weight = 0.0
+        self.mean: Optional[float] = None
+        self.per_position: Optional[float] = None
+
+    def record_end(self, duration: float):
+        """Learn from a chat that just ended after `duration` seconds"""
+        keep = 1 - self.alpha
+        self._sum = self._sum * keep + duration
+        self._weight = self._weight * keep + 1
+        self.mean = self._sum / self._weight
+        self.per_position = self.mean / max(1, self.slots)
+
+    def estimate(self, position: int) -> Optional[float]:
+        """Seconds the user at `position` (1-based) can expect to wait, or None without data"""
+        if self.per_position is None:
+            return None
+        return position * self.per_position
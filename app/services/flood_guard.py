@@ -0,0 +1,161 @@
+from array import array
+from typing import Callable, Optional
+import logging
+import time
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from services.metrics import FLOOD_DROPPED
+from services.outbound import NOTICE
+from utils.helpers import format_flood_message
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of RateTable.hit
+ALLOWED = 0
+LIMITED = 1  # first rejected update of a flood; the sender gets one notice
+DROPPED = 2  # rejected silently
+
+_EMPTY = -(1 << 63)
+# Fibonacci hashing spreads sequential ids over the table
+_MIX = 0x9E3779B97F4A7C15
+
+
+class RateTable:
+    """GCRA state for many keys in flat arrays, with open addressing.
+
+    Each key keeps only its theoretical arrival time (TAT) and a flag saying
+    whether it was told it is flooding. A key whose TAT has passed has its
+    whole burst available again, exactly like a key never seen, so such
+    idle entries are reused by new keys and left out when the table is
+    rebuilt. Memory therefore follows the number of keys active within
+    about `burst / rate` seconds, not the number of keys ever seen.
+    """
+
+    def __init__(self, rate: float, burst: int, capacity: int = 1024, max_load: float = 0.5):
+        self.interval = 1.0 / rate
+        # A key may run this far ahead of its steady rate before it is limited
+        self.tolerance = self.interval * (burst - 1)
+        self.min_capacity = 1 << max(4, (capacity - 1).bit_length())
+        self.max_load = max_load
+        self.rebuilds = 0
+        self._allocate(self.min_capacity)
+
+    def _allocate(self, capacity: int):
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self._shift = 64 - (capacity.bit_length() - 1)
+        self._limit = int(capacity * self.max_load)
+        self._keys = array("q", [_EMPTY]) * capacity
+        self._tats = array("d", [0.0]) * capacity
+        self._noticed = bytearray(capacity)
+        # Slots that are not _EMPTY, idle or not; probe chains end at the first _EMPTY
+        self._used = 0
+
+    def __len__(self) -> int:
+        return self._used
+
+    @property
+    def nbytes(self) -> int:
+        return self.capacity * (self._keys.itemsize + self._tats.itemsize + 1)
+
+    def hit(self, key: int, now: float) -> int:
+        """Count one update for a key; returns ALLOWED, LIMITED or DROPPED"""
+        keys = self._keys
+        tats = self._tats
+        mask = self._mask
+        i = ((key * _MIX) & 0xFFFFFFFFFFFFFFFF) >> self._shift
+        reusable = -1
+        while True:
+            found = keys[i]
+            if found == key:
+                break
+            if found == _EMPTY:
+                if reusable < 0:
+                    if self._used >= self._limit:
+                        self._rebuild(now)
+                        return self.hit(key, now)
+                    reusable = i
+                    self._used += 1
+                i = reusable
+                keys[i] = key
+                tats[i] = now
+                self._noticed[i] = 0
+                break
+            if reusable < 0 and tats[i] <= now:
+                reusable = i
+            i = (i + 1) & mask
+
+        tat = tats[i]
+        if tat <= now:
+            # Fully recovered, so a later flood gets its own notice
+            tat = now
+            self._noticed[i] = 0
+        if tat - now > self.tolerance:
+            if self._noticed[i]:
+                return DROPPED
+            self._noticed[i] = 1
+            return LIMITED
+        tats[i] = tat + self.interval
+        return ALLOWED
+
+    def _rebuild(self, now: float):
+        """Rehash the entries that are not idle, growing or shrinking the arrays to fit them"""
+        live = [
+            (key, tat, noticed)
+            for key, tat, noticed in zip(self._keys, self._tats, self._noticed)
+            if key != _EMPTY and tat > now
+        ]
+        capacity = self.min_capacity
+        # Leave room for as many new keys as there are live ones before the next rebuild
+        while 2 * len(live) >= capacity * self.max_load:
+            capacity *= 2
+        self._allocate(capacity)
+        keys, tats, mask = self._keys, self._tats, self._mask
+        for key, tat, noticed in live:
+            i = ((key * _MIX) & 0xFFFFFFFFFFFFFFFF) >> self._shift
+            while keys[i] != _EMPTY:
+                i = (i + 1) & mask
+            keys[i] = key
+            tats[i] = tat
+            self._noticed[i] = noticed
+        self._used = len(live)
+        self.rebuilds += 1
+
+
+class FloodGuard:
+    """Drops updates from users who send faster than `rate` per second beyond a burst of `burst`.
+
+    Registered as a TypeHandler in a group before the regular handlers. A
+    flooding user gets one notice, then their updates are dropped without any
+    reply until their allowance has recovered. Users for whom `exempt`
+    returns True (the admins) are never limited.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: int = 20, capacity: int = 1024,
+                 exempt: Optional[Callable[[int], bool]] = None, clock: Callable[[], float] = time.monotonic):
+        self.table = RateTable(rate, burst, capacity)
+        self.exempt = exempt
+        self.clock = clock
+        self._limited = FLOOD_DROPPED.labels("notice")
+        self._dropped = FLOOD_DROPPED.labels("silent")
+
+    async def check(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        if user is None or (self.exempt is not None and self.exempt(user.id)):
+            return
+        outcome = self.table.hit(user.id, self.clock())
+        if outcome == ALLOWED:
+            return
+        if outcome == LIMITED:
+            self._limited.inc()
+            logger.info(f"User {user.id} is flooding; dropping their updates for a while")
+            try:
+                priority = {"rate_limit_args": NOTICE} if getattr(context.bot, "rate_limiter", None) else {}
+                await context.bot.send_message(user.id, format_flood_message(), **priority)
+            except Exception as e:
+                logger.warning(f"Failed to send flood notice to user {user.id}: {e}")
+        else:
+            self._dropped.inc()
+        raise ApplicationHandlerStop
@@ -0,0 +1,197 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import math
+import time
+
+
+class RollingCounter:
+    """Events in the last `window` seconds, counted in `buckets` slices of a ring.
+
+    Adding is O(1): the slot for the current slice is reset when the ring
+    comes round to it again. The total is kept alongside, so reading is O(1)
+    too apart from expiring slices that have gone stale since the last call.
+    The window slides one slice at a time, so the count covers between
+    window - window/buckets and window seconds.
+    """
+
+    def __init__(self, window: float = 3600, buckets: int = 60, clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.slice = window / buckets
+        self.clock = clock
+        self._counts = [0] * buckets
+        self._total = 0
+        self._current = int(clock() // self.slice)
+
+    def _advance(self, now: float):
+        current = int(now // self.slice)
+        if current == self._current:
+            return
+        counts = self._counts
+        # Slices skipped over are now outside the window; at most a full turn of the ring needs clearing
+        for tick in range(self._current + 1, min(current, self._current + len(counts)) + 1):
+            slot = tick % len(counts)
+            self._total -= counts[slot]
+            counts[slot] = 0
+        self._current = current
+
+    def add(self, amount: int = 1):
+        self._advance(self.clock())
+        self._counts[self._current % len(self._counts)] += amount
+        self._total += amount
+
+    @property
+    def total(self) -> int:
+        self._advance(self.clock())
+        return self._total
+
+
+class EwmaRate:
+    """Events per second, averaged with exponentially decaying weights over about `tau` seconds"""
+
+    def __init__(self, tau: float = 300, clock: Callable[[], float] = time.monotonic):
+        self.tau = tau
+        self.clock = clock
+        self._rate = 0.0
+        self._updated = clock()
+
+    def _decayed(self, now: float) -> float:
+        return self._rate * math.exp(-(now - self._updated) / self.tau)
+
+    def add(self, amount: float = 1):
+        now = self.clock()
+        self._rate = self._decayed(now) + amount / self.tau
+        self._updated = now
+
+    @property
+    def rate(self) -> float:
+        return self._decayed(self.clock())
+
+
+class DDSketch:
+    """Quantiles of positive values with a bounded relative error (DDSketch).
+
+    A value x is counted in bin ceil(log(x) / log(gamma)), gamma = (1 + a) /
+    (1 - a); every value in a bin is within a relative error a of the bin's
+    representative value, however skewed the data. Adding is one log and a
+    dict update. At 1% error, values from a millisecond to a day fit in
+    under 600 bins; beyond `max_bins` the lowest bins are merged, which only
+    costs accuracy on the smallest values. Zero and negative values share a
+    single bin reported as 0.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 1024):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        bins = self.bins
+        bins[index] = bins.get(index, 0) + 1
+        if len(bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        """Merge the two lowest bins into the higher one"""
+        lowest, second = sorted(self.bins)[:2]
+        self.bins[second] += self.bins.pop(lowest)
+
+    def _value(self, index: int) -> float:
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated q-quantile, or None before the first value"""
+        return self.quantiles((q,))[0]
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        """Estimated quantiles for ascending qs, in one pass over the bins"""
+        if not self.count:
+            return [None] * len(qs)
+        results = []
+        seen = self.zero_count
+        indexes = iter(sorted(self.bins))
+        index = None
+        for q in qs:
+            rank = q * (self.count - 1)
+            if rank < self.zero_count:
+                results.append(0.0)
+                continue
+            while seen <= rank:
+                index = next(indexes, None)
+                if index is None:
+                    break
+                seen += self.bins[index]
+            results.append(self.max if index is None else min(self._value(index), self.max))
+        return results
+
+
+class LiveStats:
+    """Running aggregates of queue and chat activity for the /stats command.
+
+    Fed from the state backend as users join the queue, chats start and chats
+    end; each event costs O(1) and the memory used is fixed, however long the
+    bot runs. Counts cover the last `window` seconds and rates are EWMAs over
+    about `tau` seconds; wait and session quantiles cover the whole uptime.
+    """
+
+    def __init__(self, window: float = 3600, tau: float = 300, relative_accuracy: float = 0.01,
+                 clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.started = clock()
+        self.window = window
+        self.tau = tau
+        self.joins = RollingCounter(window, clock=clock)
+        self.starts = RollingCounter(window, clock=clock)
+        self.ends = RollingCounter(window, clock=clock)
+        self.timeouts = RollingCounter(window, clock=clock)
+        self.join_rate = EwmaRate(tau, clock)
+        self.start_rate = EwmaRate(tau, clock)
+        self.waits = DDSketch(relative_accuracy)
+        self.sessions = DDSketch(relative_accuracy)
+
+    def record_join(self):
+        self.joins.add()
+        self.join_rate.add()
+
+    def record_start(self, wait: Optional[float] = None):
+        """A chat started; wait is how long the user queued, when known"""
+        self.starts.add()
+        self.start_rate.add()
+        if wait is not None:
+            self.waits.add(wait)
+
+    def record_end(self, duration: Optional[float] = None, timed_out: bool = False):
+        self.ends.add()
+        if timed_out:
+            self.timeouts.add()
+        if duration is not None:
+            self.sessions.add(duration)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current values, cheap enough to build on every /stats"""
+        return {
+            "uptime": self.clock() - self.started,
+            "window": self.window,
+            "joins": self.joins.total,
+            "starts": self.starts.total,
+            "ends": self.ends.total,
+            "timeouts": self.timeouts.total,
+            "join_rate": self.join_rate.rate,
+            "start_rate": self.start_rate.rate,
+            "waits": self.waits.quantiles((0.5, 0.9, 0.99)),
+            "wait_count": self.waits.count,
+            "sessions": self.sessions.quantiles((0.5, 0.9, 0.99)),
+            "session_count": self.sessions.count,
+        }
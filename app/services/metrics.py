@@ -0,0 +1,267 @@
+from bisect import bisect_left
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+import functools
+import logging
+
+from services.http_server import HttpServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+# Seconds; handler and API calls are expected in the millisecond range
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Seconds; queue waits and chat sessions last minutes
+DURATION_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(perf_counter() - self.start)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["Registry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self.labels()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """The child series for one combination of label values (kept forever, so keep values few)"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in self._children.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing total"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, such as a queue depth"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default.dec(amount)
+
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional["Registry"] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self) -> _Timer:
+        return self._default.time()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """All metrics exposed by one process"""
+
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        if any(existing.name == metric.name for existing in self.metrics):
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = Histogram("pnj_handler_seconds", "Time spent handling one update", ("handler",))
+BOT_API_SECONDS = Histogram("pnj_bot_api_seconds", "Bot API request latency", ("method",))
+BOT_API_ERRORS = Counter("pnj_bot_api_errors_total", "Failed Bot API requests", ("method", "error"))
+OUTBOUND_WAIT_SECONDS = Histogram("pnj_outbound_wait_seconds", "Time a Bot API request waited for the rate limiter")
+STATE_OP_SECONDS = Histogram("pnj_state_op_seconds", "Queue and session state operation latency", ("op",))
+QUEUE_WAIT_SECONDS = Histogram(
+    "pnj_queue_wait_seconds", "Time users waited in the queue before a chat started", buckets=DURATION_BUCKETS
+)
+SESSION_SECONDS = Histogram("pnj_session_seconds", "Length of finished chat sessions", buckets=DURATION_BUCKETS)
+QUEUE_DEPTH = Gauge("pnj_queue_depth", "Users waiting in the queue")
+ACTIVE_SESSIONS = Gauge("pnj_active_sessions", "Chat sessions in progress")
+OUTBOUND_QUEUE_DEPTH = Gauge("pnj_outbound_queue_depth", "Bot API requests waiting in the rate limiter")
+POSITION_UPDATES = Counter("pnj_position_updates_total", "Queue position messages edited or resent")
+FLOOD_DROPPED = Counter("pnj_flood_dropped_total", "Updates dropped from users sending too fast", ("kind",))
+RELAY_BATCH_SIZE = Histogram(
+    "pnj_relay_batch_size", "Messages relayed per copy request", buckets=(1, 2, 3, 5, 10, 20, 50, 100)
+)
+
+
+def timed_handler(name: str, callback: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """Wrap a handler callback so its run time lands in HANDLER_SECONDS"""
+    child = HANDLER_SECONDS.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        start = perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            child.observe(perf_counter() - start)
+
+    return wrapper
+
+
+class MetricsServer:
+    """Serves a registry at /metrics for Prometheus to scrape"""
+
+    def __init__(self, registry: Registry = REGISTRY, host: str = "127.0.0.1", port: int = 9090,
+                 collect: Optional[Callable[[], Awaitable[None]]] = None):
+        self.registry = registry
+        self.collect = collect
+        self.http = HttpServer(self._handle, host, port)
+
+    @property
+    def port(self) -> int:
+        return self.http.port
+
+    async def start(self):
+        await self.http.start()
+        logger.info(f"Metrics available at http://{self.http.host}:{self.http.port}/metrics")
+
+    async def stop(self):
+        await self.http.stop()
+
+    async def _handle(self, request: Request) -> Response:
+        if request.path.partition("?")[0] != "/metrics":
+            return 404, {}, b""
+        if request.method != "GET":
+            return 405, {"Allow": "GET"}, b""
+        if self.collect is not None:
+            # Gauges that are cheaper to read on demand than to keep up to date
+            await self.collect()
+        body = self.registry.render().encode()
+        return 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}, body
@@ -0,0 +1,322 @@
+from collections import deque
+from typing import Any, Callable, Coroutine, Deque, Dict, List, Optional, Tuple, Union
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from telegram.ext import BaseRateLimiter
+
+from services.metrics import BOT_API_ERRORS, BOT_API_SECONDS, OUTBOUND_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Lower value is sent first
+RELAY = 0
+REPLY = 1
+NOTICE = 2
+
+ENDPOINT_PRIORITIES = {
+    "copyMessage": RELAY,
+    "copyMessages": RELAY,
+    "forwardMessage": RELAY,
+    "answerCallbackQuery": REPLY,
+    "editMessageText": REPLY,
+}
+
+
+class OutboundQueueFull(NetworkError):
+    """Raised for a request that was dropped because the outbound queue is full"""
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until one token is available"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    def __init__(self, seq: int, priority: int, key, endpoint: str, callback, args, kwargs,
+                 future: asyncio.Future, queued_at: float):
+        self.seq = seq
+        self.priority = priority
+        self.key = key
+        self.endpoint = endpoint
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.queued_at = queued_at
+        self.attempts = 0
+
+
+class OutboundDispatcher(BaseRateLimiter[int]):
+    """Priority queue plus token buckets in front of every Bot API request.
+
+    Plugged into the application with ``Application.builder().rate_limiter()``,
+    so every ``send_message``, ``copy_message``, ``reply_text`` and so on goes
+    through it. Requests for the same chat are sent one at a time and in
+    order; across chats the head with the best priority goes first. Relayed
+    chat messages outrank replies, which outrank notices. The priority can be
+    overridden per call with ``rate_limit_args``.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: float = 3,
+                 group_rate: float = 20 / 60, max_queue: int = 10_000, max_retries: int = 5,
+                 base_backoff: float = 0.5, max_backoff: float = 30, max_chat_buckets: int = 10_000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_chat_buckets = max_chat_buckets
+        self.clock = clock
+
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+        self._chat_queues: Dict[Any, Deque[_Job]] = {}
+        # (priority, seq, key) for chats whose head job may be sent now
+        self._ready: List[Tuple[int, int, Any]] = []
+        # (not_before, seq, key) for chats waiting on their bucket or a retry
+        self._delayed: List[Tuple[float, int, Any]] = []
+        self._inflight = set()
+        self._paused_until = 0.0
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._sends = set()
+
+        self.queue_depth = 0
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for monitoring"""
+        return {
+            "queue_depth": self.queue_depth,
+            "inflight": len(self._inflight),
+            "sent": self.sent,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    async def initialize(self) -> None:
+        # Called twice on startup (by the Application and by its Updater); replacing the
+        # event under a running worker would leave it waiting on the old one forever
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    async def shutdown(self) -> None:
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for queue in self._chat_queues.values():
+            for job in queue:
+                if not job.future.done():
+                    job.future.cancel()
+        self._chat_queues.clear()
+        self._ready.clear()
+        self._delayed.clear()
+        self.queue_depth = 0
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        priority = rate_limit_args if rate_limit_args is not None else ENDPOINT_PRIORITIES.get(endpoint, NOTICE)
+        if self.queue_depth >= self.max_queue:
+            self.dropped += 1
+            raise OutboundQueueFull(f"Outbound queue full, dropped {endpoint}")
+
+        seq = next(self._seq)
+        chat_id = data.get("chat_id")
+        # Requests without a chat (e.g. answerCallbackQuery) only share the global bucket
+        key = chat_id if chat_id is not None else ("request", seq)
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(seq, priority, key, endpoint, callback, args, kwargs, future, self.clock())
+        self._enqueue(job)
+        return await job.future
+
+    def _enqueue(self, job: _Job):
+        queue = self._chat_queues.get(job.key)
+        if queue is None:
+            queue = self._chat_queues[job.key] = deque()
+        queue.append(job)
+        self.queue_depth += 1
+        if len(queue) == 1 and job.key not in self._inflight:
+            heapq.heappush(self._ready, (job.priority, job.seq, job.key))
+            self._wake()
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _bucket_for(self, key, now: float) -> Optional[TokenBucket]:
+        if not isinstance(key, int):
+            return None
+        bucket = self._chat_buckets.get(key)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_chat_buckets:
+                self._prune_buckets(now)
+            rate = self.group_rate if key < 0 else self.chat_rate
+            bucket = self._chat_buckets[key] = TokenBucket(rate, self.chat_burst, now)
+        return bucket
+
+    def _prune_buckets(self, now: float):
+        """Forget buckets that have refilled completely; they would be recreated identically"""
+        self._chat_buckets = {
+            key: bucket for key, bucket in self._chat_buckets.items()
+            if key in self._chat_queues or not bucket.is_full(now)
+        }
+
+    def _schedule_head(self, key, not_before: float = 0.0):
+        queue = self._chat_queues.get(key)
+        if not queue:
+            self._chat_queues.pop(key, None)
+            return
+        head = queue[0]
+        if not_before > self.clock():
+            heapq.heappush(self._delayed, (not_before, head.seq, key))
+        else:
+            heapq.heappush(self._ready, (head.priority, head.seq, key))
+        self._wake()
+
+    async def _run(self):
+        while True:
+            now = self.clock()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, key = heapq.heappop(self._delayed)
+                self._schedule_head(key)
+
+            wait = None
+            if self._paused_until > now:
+                wait = self._paused_until - now
+            elif self._ready:
+                wait = self._global.delay(now)
+            if wait is None or wait > 0:
+                if self._delayed:
+                    next_delayed = self._delayed[0][0] - now
+                    wait = next_delayed if wait is None else min(wait, next_delayed)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, key = heapq.heappop(self._ready)
+            bucket = self._bucket_for(key, now)
+            if bucket is not None:
+                delay = bucket.delay(now)
+                if delay > 0:
+                    self._schedule_head(key, now + delay)
+                    continue
+                bucket.consume(now)
+            self._global.consume(now)
+
+            job = self._chat_queues[key].popleft()
+            self.queue_depth -= 1
+            OUTBOUND_WAIT_SECONDS.observe(now - job.queued_at)
+            self._inflight.add(key)
+            task = asyncio.create_task(self._send(job))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, job: _Job):
+        retry_at = None
+        try:
+            result = await self._call(job)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            # Flood control is applied bot-wide, so stop sending to everyone for a while
+            self._paused_until = max(self._paused_until, self.clock() + retry_after)
+            retry_at = self._retry(job, e, retry_after)
+        except (BadRequest, TimedOut) as e:
+            # Not transient, or the request may already have been delivered
+            self._fail(job, e)
+        except NetworkError as e:
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** job.attempts)
+            retry_at = self._retry(job, e, backoff)
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._inflight.discard(job.key)
+            self._schedule_head(job.key, retry_at or 0.0)
+
+    async def _call(self, job: _Job):
+        """Make the actual Bot API request, recording its latency and outcome"""
+        start = time.perf_counter()
+        try:
+            return await job.callback(*job.args, **job.kwargs)
+        except Exception as e:
+            BOT_API_ERRORS.labels(job.endpoint, type(e).__name__).inc()
+            raise
+        finally:
+            BOT_API_SECONDS.labels(job.endpoint).observe(time.perf_counter() - start)
+
+    def _retry(self, job: _Job, error: Exception, delay: float) -> Optional[float]:
+        """Put a job back at the head of its chat queue; returns when it may be sent again"""
+        job.attempts += 1
+        if job.attempts > self.max_retries or job.future.done():
+            self.dropped += 1
+            logger.error(f"Giving up on outbound request to {job.key} after {job.attempts} attempts: {error}")
+            if not job.future.done():
+                job.future.set_exception(error)
+            return None
+        self.retried += 1
+        logger.warning(f"Retrying outbound request to {job.key} in {delay:.1f}s: {error}")
+        self._chat_queues.setdefault(job.key, deque()).appendleft(job)
+        self.queue_depth += 1
+        return self.clock() + delay
+
+    def _fail(self, job: _Job, error: Exception):
+        self.failed += 1
+        if not job.future.done():
+            job.future.set_exception(error)
@@ -0,0 +1,174 @@
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+
+from telegram import Bot
+from telegram.error import BadRequest, TelegramError
+
+from models.state_backend import StateBackend
+from services.eta import WaitEstimator
+from services.metrics import POSITION_UPDATES
+from services.outbound import NOTICE
+from utils.helpers import format_queue_message
+
+logger = logging.getLogger(__name__)
+
+# Tracked users ranked per backend call; with Redis each call is one round trip
+LOOKUP_BATCH = 256
+
+
+class _Status:
+    __slots__ = ("message_id", "bucket")
+
+    def __init__(self, message_id: int, bucket: int):
+        self.message_id = message_id
+        self.bucket = bucket
+
+
+class PositionNotifier:
+    """Keeps one status message per waiting user up to date as the queue advances.
+
+    Positions are grouped into buckets: each of the first `top` positions is
+    its own bucket, after that every `bucket_size` positions share one. A
+    user's message is only edited when their bucket changes, so a long queue
+    moving by one costs a handful of edits instead of one per user. Changes
+    are coalesced into passes at most every `interval` seconds, each sending
+    at most `max_per_pass` edits at the lowest outbound priority. With an
+    `eta`, each edit also carries the estimated wait for the new position.
+
+    A pass never reads the whole queue: it ranks only tracked users, front
+    buckets first, in batches, and stops once it has `max_per_pass` edits.
+    """
+
+    def __init__(self, top: int = 3, bucket_size: int = 10, interval: float = 2.0, max_per_pass: int = 20,
+                 eta: Optional[WaitEstimator] = None):
+        self.top = top
+        self.bucket_size = bucket_size
+        self.interval = interval
+        self.max_per_pass = max_per_pass
+        self.eta = eta
+        self._status: Dict[int, _Status] = {}
+        # bucket -> tracked users last told a position in it
+        self._buckets: Dict[int, Set[int]] = {}
+        self._changed: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def bucket_of(self, position: int) -> int:
+        if position <= self.top:
+            return position
+        return self.top + -(-position // self.bucket_size)
+
+    def track(self, user_id: int, message_id: int, position: int):
+        """Use this message for the user's future position updates"""
+        self._untrack(user_id)
+        bucket = self.bucket_of(position)
+        self._status[user_id] = _Status(message_id, bucket)
+        self._buckets.setdefault(bucket, set()).add(user_id)
+
+    def _untrack(self, user_id: int):
+        status = self._status.pop(user_id, None)
+        if status is not None:
+            self._move(user_id, status.bucket, None)
+
+    def _move(self, user_id: int, old: int, new: Optional[int]):
+        users = self._buckets[old]
+        users.discard(user_id)
+        if not users:
+            del self._buckets[old]
+        if new is not None:
+            self._buckets.setdefault(new, set()).add(user_id)
+
+    def queue_changed(self):
+        """Schedule a pass; cheap enough to call after every claim"""
+        if self._changed is not None:
+            self._changed.set()
+
+    async def update(self, bot: Bot, state: StateBackend) -> int:
+        """Edit the messages of users whose bucket changed; returns the number of edits"""
+        if not self._status:
+            return 0
+        total = await state.get_queue_size()
+        due: List[Tuple[int, int, _Status]] = []
+        batch: List[int] = []
+        stopped = False
+        for bucket in sorted(self._buckets):
+            batch.extend(self._buckets.get(bucket, ()))
+            if len(batch) >= LOOKUP_BATCH:
+                await self._find_due(state, batch, due)
+                batch = []
+                if len(due) >= self.max_per_pass:
+                    stopped = True
+                    break
+        if batch:
+            await self._find_due(state, batch, due)
+
+        # Lookups yield to handlers, which may have untracked or re-tracked a user since
+        edits = [entry for entry in due if self._status.get(entry[0]) is entry[2]][:self.max_per_pass]
+        for user_id, position, status in edits:
+            bucket = self.bucket_of(position)
+            self._move(user_id, status.bucket, bucket)
+            status.bucket = bucket
+        await asyncio.gather(*(
+            self._push(bot, user_id, position, total, status) for user_id, position, status in edits
+        ))
+        if stopped or len(due) > len(edits):
+            self.queue_changed()
+        return len(edits)
+
+    async def _find_due(self, state: StateBackend, user_ids: List[int], due: List[Tuple[int, int, _Status]]):
+        """Add the users whose bucket changed to `due`; forget those no longer queued"""
+        positions = await state.get_user_queue_positions(user_ids)
+        for user_id, position in zip(user_ids, positions):
+            status = self._status.get(user_id)
+            if status is None:
+                continue
+            if position is None:
+                self._untrack(user_id)
+            elif self.bucket_of(position) != status.bucket:
+                due.append((user_id, position, status))
+
+    async def _push(self, bot: Bot, user_id: int, position: int, total: int, status: _Status):
+        wait = self.eta.estimate(position) if self.eta else None
+        text = format_queue_message(user_id, position, total, wait)
+        priority = {"rate_limit_args": NOTICE} if getattr(bot, "rate_limiter", None) else {}
+        try:
+            await bot.edit_message_text(text, chat_id=user_id, message_id=status.message_id, **priority)
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return
+            # The status message is gone or too old to edit; start a new one
+            try:
+                message = await bot.send_message(user_id, text, **priority)
+                status.message_id = message.message_id
+            except TelegramError as e:
+                logger.warning(f"Failed to send queue position to user {user_id}: {e}")
+                return
+        except TelegramError as e:
+            logger.warning(f"Failed to update queue position for user {user_id}: {e}")
+            return
+        POSITION_UPDATES.inc()
+
+    async def _run(self, bot: Bot, state: StateBackend):
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            try:
+                await self.update(bot, state)
+            except Exception as e:
+                logger.error(f"Queue position update failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, bot: Bot, state: StateBackend):
+        if self._worker is None or self._worker.done():
+            self._changed = asyncio.Event()
+            self._worker = asyncio.create_task(self._run(bot, state))
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._changed = None
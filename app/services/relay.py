@@ -0,0 +1,133 @@
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+
+from telegram import Bot, Message
+from telegram.error import BadRequest
+
+from services.metrics import RELAY_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Bot API limit for copyMessages
+MAX_BATCH = 100
+
+# relay_finished(from_chat_id, to_chat_id, messages, error, copied_ids); error is None on success and
+# copied_ids are the ids of the copies in the recipient's chat, in the same order as messages
+FinishedCallback = Callable[[int, int, List[Message], Optional[Exception], List[int]], Awaitable[None]]
+
+
+class _Batch:
+    __slots__ = ("messages", "timer")
+
+    def __init__(self):
+        self.messages: List[Message] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class RelayBuffer:
+    """Collects messages relayed between the same two chats and copies them in bulk.
+
+    The first message for a (from, to) pair opens a batch that is sent
+    `window` seconds later, or as soon as it holds `max_batch` messages. A
+    batch of one is sent with copyMessage, larger ones with a single
+    copyMessages call, which keeps albums together and costs one request
+    (and one token of the chat's rate limit) instead of one per message.
+    Batches of the same pair are sent one after another, in order. If the
+    API refuses a batch, it is split in halves and each is sent again, so
+    one message that cannot be copied fails on its own.
+
+    Handlers only add() and return, so the per-chat update processor can
+    hand them the rest of a burst while the window is open.
+    """
+
+    def __init__(self, window: float = 0.3, max_batch: int = MAX_BATCH):
+        self.window = window
+        self.max_batch = min(max_batch, MAX_BATCH)
+        self._open: Dict[Tuple[int, int], _Batch] = {}
+        # Last send started for each pair; the next one waits for it
+        self._sending: Dict[Tuple[int, int], asyncio.Task] = {}
+        self._bot: Optional[Bot] = None
+        self._finished: Optional[FinishedCallback] = None
+
+    def add(self, from_chat_id: int, to_chat_id: int, message: Message):
+        """Queue one message to be copied from one chat to another"""
+        if message is None:
+            raise ValueError("No message to relay")
+        key = (from_chat_id, to_chat_id)
+        batch = self._open.get(key)
+        if batch is None:
+            batch = self._open[key] = _Batch()
+            batch.timer = asyncio.get_running_loop().call_later(self.window, self._send, key)
+        batch.messages.append(message)
+        if len(batch.messages) >= self.max_batch:
+            self._send(key)
+
+    def _send(self, key: Tuple[int, int]) -> Optional[asyncio.Task]:
+        batch = self._open.pop(key, None)
+        if batch is None:
+            return self._sending.get(key)
+        batch.timer.cancel()
+        task = asyncio.create_task(self._copy(key, batch.messages, self._sending.get(key)))
+        self._sending[key] = task
+        task.add_done_callback(lambda done: self._sent(key, done))
+        return task
+
+    def _sent(self, key: Tuple[int, int], task: asyncio.Task):
+        if self._sending.get(key) is task:
+            del self._sending[key]
+
+    async def _copy(self, key: Tuple[int, int], messages: List[Message], previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        # Message ids grow with arrival, so sorting keeps the order the sender used
+        await self._copy_batch(key, sorted(messages, key=lambda message: message.message_id))
+
+    async def _copy_batch(self, key: Tuple[int, int], messages: List[Message]):
+        from_chat_id, to_chat_id = key
+        error = None
+        copied_ids = []
+        try:
+            if len(messages) == 1:
+                copy = await self._bot.copy_message(to_chat_id, from_chat_id, messages[0].message_id)
+                copied_ids = [copy.message_id]
+            else:
+                copies = await self._bot.copy_messages(
+                    to_chat_id, from_chat_id, [message.message_id for message in messages]
+                )
+                copied_ids = [copy.message_id for copy in copies]
+            RELAY_BATCH_SIZE.observe(len(messages))
+        except BadRequest as e:
+            if len(messages) > 1:
+                # Most likely one message the API will not copy; the halves go out in order
+                middle = len(messages) // 2
+                await self._copy_batch(key, messages[:middle])
+                await self._copy_batch(key, messages[middle:])
+                return
+            logger.error(f"Failed to relay a message from {from_chat_id} to {to_chat_id}: {e}")
+            error = e
+        except Exception as e:
+            logger.error(f"Failed to relay {len(messages)} messages from {from_chat_id} to {to_chat_id}: {e}")
+            error = e
+        if self._finished is not None:
+            try:
+                await self._finished(from_chat_id, to_chat_id, messages, error, copied_ids)
+            except Exception as e:
+                logger.error(f"Relay callback failed for {from_chat_id}: {e}")
+
+    async def flush(self, from_chat_id: int, to_chat_id: int):
+        """Send whatever is buffered between two chats and wait until it is out"""
+        task = self._send((from_chat_id, to_chat_id))
+        if task is not None:
+            await asyncio.wait([task])
+
+    def start(self, bot: Bot, finished: Optional[FinishedCallback] = None):
+        self._bot = bot
+        self._finished = finished
+
+    async def close(self):
+        """Send every open batch and wait for all sends to finish"""
+        for key in list(self._open):
+            self._send(key)
+        if self._sending:
+            await asyncio.wait(list(self._sending.values()))
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+
+class ReplyRouter:
+    """Remembers which user each message relayed into an admin's chat came from.
+
+    An admin serving several users at once answers one of them by replying
+    to a message from that user, or to one of their own messages to that
+    user; the reply is routed to whoever the replied message belongs to.
+    Entries are keyed by (admin_id, message_id) in an LRU map of at most
+    `capacity` entries, so a long session only forgets its oldest messages.
+    When a session ends its entries move to a tombstone map of the same
+    size, so a late reply to that chat can be told apart from a reply to a
+    message the router never saw. The maps are local to this process: with
+    several workers, a reply handled by a worker that did not relay the
+    message is unknown here and goes to the admin's focused session.
+    """
+
+    def __init__(self, capacity: int = 10_000):
+        self.capacity = capacity
+        self._owners: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+        self._by_user: Dict[int, Set[Tuple[int, int]]] = {}
+        # Keys of sessions that are over, oldest first
+        self._ended: "OrderedDict[Tuple[int, int], None]" = OrderedDict()
+
+    def remember(self, admin_id: int, message_ids: Iterable[int], user_id: int):
+        """Record messages in an admin's chat as belonging to a user's session"""
+        keys = self._by_user.setdefault(user_id, set())
+        for message_id in message_ids:
+            key = (admin_id, message_id)
+            self._owners[key] = user_id
+            self._owners.move_to_end(key)
+            keys.add(key)
+        while len(self._owners) > self.capacity:
+            key, owner = self._owners.popitem(last=False)
+            owner_keys = self._by_user.get(owner)
+            if owner_keys is not None:
+                owner_keys.discard(key)
+                if not owner_keys:
+                    del self._by_user[owner]
+
+    def lookup(self, admin_id: int, message_id: int) -> Optional[int]:
+        """User whose message in an admin's chat this is, or None if unknown"""
+        key = (admin_id, message_id)
+        user_id = self._owners.get(key)
+        if user_id is not None:
+            self._owners.move_to_end(key)
+        return user_id
+
+    def ended(self, admin_id: int, message_id: int) -> bool:
+        """Whether a message in an admin's chat belongs to a session that is over"""
+        return (admin_id, message_id) in self._ended
+
+    def end_session(self, user_id: int):
+        """Forget every message of a user's session, keeping a tombstone for each"""
+        for key in self._by_user.pop(user_id, ()):
+            self._owners.pop(key, None)
+            self._ended[key] = None
+        while len(self._ended) > self.capacity:
+            self._ended.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._owners)
@@ -0,0 +1,166 @@
+from collections import deque
+from typing import Any, Deque, List, Optional
+from urllib.parse import urlparse
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RespError(Exception):
+    """Error reply from a Redis-compatible server"""
+
+
+def encode_command(*args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        elif isinstance(arg, str):
+            data = arg.encode()
+        else:
+            data = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """Parse one RESP2 reply; bulk strings are decoded as UTF-8"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        return RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2].decode()
+    if kind == b"*":
+        length = int(body)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise ConnectionError(f"Unexpected RESP reply: {line!r}")
+
+
+class RespClient:
+    """Minimal pipelining client for the Redis protocol (RESP2).
+
+    Commands from concurrent coroutines are written as they come and their
+    replies are matched in order by a single reader task, so callers never
+    wait for each other's round trips.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0, password: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: Deque[asyncio.Future] = deque()
+        self._reader_task: Optional[asyncio.Task] = None
+        self._connecting: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "RespClient":
+        """Build a client from redis://[:password@]host[:port][/db]"""
+        parsed = urlparse(url)
+        db = int(parsed.path.lstrip("/") or 0)
+        return cls(parsed.hostname or "localhost", parsed.port or 6379, db, parsed.password)
+
+    async def connect(self):
+        if self._connecting is None:
+            self._connecting = asyncio.Lock()
+        async with self._connecting:
+            if self._writer is not None:
+                return
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+            self._reader_task = asyncio.create_task(self._read_loop())
+            if self.password:
+                await self.execute("AUTH", self.password)
+            if self.db:
+                await self.execute("SELECT", self.db)
+
+    async def _read_loop(self):
+        try:
+            while True:
+                reply = await read_reply(self._reader)
+                future = self._pending.popleft()
+                if future.done():
+                    continue
+                if isinstance(reply, RespError):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+        except (ConnectionError, asyncio.IncompleteReadError) as e:
+            logger.error(f"Lost connection to {self.host}:{self.port}: {e}")
+            self._fail_pending(e)
+        finally:
+            self._reader = None
+            self._writer = None
+
+    def _fail_pending(self, error: Exception):
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(ConnectionError(str(error)))
+
+    async def execute(self, *args) -> Any:
+        """Send one command and wait for its reply"""
+        if self._writer is None:
+            await self.connect()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(future)
+        self._writer.write(encode_command(*args))
+        return await future
+
+    async def pipeline(self, *commands) -> List[Any]:
+        """Send several commands back to back and wait for all their replies.
+
+        No other command on this connection lands between them. The first
+        error reply, if any, is raised once every reply is in.
+        """
+        if self._writer is None:
+            await self.connect()
+        loop = asyncio.get_running_loop()
+        futures = []
+        for _ in commands:
+            futures.append(loop.create_future())
+            self._pending.append(futures[-1])
+        self._writer.write(b"".join(encode_command(*args) for args in commands))
+        replies = await asyncio.gather(*futures, return_exceptions=True)
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+        return replies
+
+    async def transaction(self, *commands) -> Optional[List[Any]]:
+        """Run commands in MULTI/EXEC; their replies, or None if a WATCHed key changed first"""
+        return (await self.pipeline(("MULTI",), *commands, ("EXEC",)))[-1]
+
+    def dedicated(self) -> "RespClient":
+        """Client for the same server on a connection of its own, for WATCH"""
+        return RespClient(self.host, self.port, self.db, self.password)
+
+    async def close(self):
+        writer = self._writer
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+        if writer is not None:
+            writer.close()
+            await writer.wait_closed()
+        self._writer = None
+        self._fail_pending(ConnectionError("Client closed"))
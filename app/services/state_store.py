@@ -0,0 +1,197 @@
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "snapshot.json"
+JOURNAL_FILE = "journal.log"
+
+
+def empty_state() -> Dict[str, Any]:
+    return {"seq": 0, "queue": [], "sessions": {}}
+
+
+def apply_record(state: Dict[str, Any], record: Dict[str, Any]):
+    """Apply one journal record to a state whose queue is an insertion-ordered dict of user -> [class, since]"""
+    op = record["op"]
+    user = record["user"]
+    queue = state["queue"]
+    sessions = state["sessions"]
+    if op == "enqueue":
+        if user not in sessions:
+            queue.setdefault(user, [record.get("cls"), record.get("since")])
+    elif op == "dequeue":
+        queue.pop(user, None)
+    elif op == "start":
+        queue.pop(user, None)
+        sessions[user] = {"admin": record["admin"], "started_at": record["started_at"], "deadline": None}
+    elif op == "end":
+        sessions.pop(user, None)
+    elif op == "deadline":
+        if user in sessions:
+            sessions[user]["deadline"] = record["deadline"]
+    state["seq"] = record["seq"]
+
+
+class StateStore:
+    """Append-only journal of queue/session mutations, compacted into snapshots.
+
+    Mutations are buffered in memory and written by one background task in
+    batches, each followed by a single fsync in a worker thread. Deadline
+    updates are coalesced per user within a batch. Every record carries a
+    sequence number and the snapshot remembers the last one it covers, so a
+    crash between writing a snapshot and truncating the journal replays
+    nothing twice.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = 0.05, compact_every: int = 10_000):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self._seq = 0
+        self._buffer: List[Dict[str, Any]] = []
+        self._deadlines: Dict[int, float] = {}
+        self._records_since_snapshot = 0
+        self._snapshot_source: Optional[Callable[[], Dict[str, Any]]] = None
+        self._journal = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # Writes run in worker threads; a cancelled flush may still be writing
+        self._io_lock = threading.Lock()
+
+    def load(self) -> Dict[str, Any]:
+        """Rebuild state from the last snapshot plus the journal tail"""
+        os.makedirs(self.directory, exist_ok=True)
+        state = empty_state()
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            # JSON object keys are strings
+            state["sessions"] = {int(user): session for user, session in state["sessions"].items()}
+        # Entries are [user, class, waiting since]; older snapshots hold bare user ids
+        queue = {}
+        for entry in state["queue"]:
+            if isinstance(entry, list):
+                queue[entry[0]] = entry[1:]
+            else:
+                queue[entry] = [None, None]
+        state["queue"] = queue
+        replayed = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn write at the tail after a crash
+                        logger.warning("Ignoring unreadable journal record")
+                        continue
+                    if record["seq"] <= state["seq"]:
+                        continue
+                    apply_record(state, record)
+                    replayed += 1
+        state["queue"] = [[user, *info] for user, info in state["queue"].items()]
+        self._seq = state["seq"]
+        self._records_since_snapshot = replayed
+        return state
+
+    def record(self, op: str, user: int, **fields):
+        """Buffer a mutation; it is written by the next batch"""
+        if op == "deadline":
+            self._deadlines[user] = fields["deadline"]
+        else:
+            if op == "end":
+                self._deadlines.pop(user, None)
+            self._seq += 1
+            self._buffer.append({"seq": self._seq, "op": op, "user": user, **fields})
+        if self._wakeup is not None and not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        batch = self._buffer
+        for user, deadline in self._deadlines.items():
+            self._seq += 1
+            batch.append({"seq": self._seq, "op": "deadline", "user": user, "deadline": deadline})
+        self._buffer = []
+        self._deadlines = {}
+        return batch
+
+    def _append(self, lines: str):
+        with self._io_lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write(lines)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def _write_snapshot(self, state: Dict[str, Any]):
+        with self._io_lock:
+            self._replace_snapshot(state)
+
+    def _replace_snapshot(self, state: Dict[str, Any]):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # Records up to state["seq"] are now covered; start an empty journal
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    async def flush(self):
+        """Write buffered records and compact into a snapshot when due"""
+        loop = asyncio.get_running_loop()
+        batch = self._take_batch()
+        if batch:
+            lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in batch)
+            await loop.run_in_executor(None, self._append, lines)
+            self._records_since_snapshot += len(batch)
+        if self._snapshot_source is not None and self._records_since_snapshot >= self.compact_every:
+            # Capture state and drop the pending buffer in one step: the snapshot already covers it
+            state = self._snapshot_source()
+            self._take_batch()
+            state["seq"] = self._seq
+            await loop.run_in_executor(None, self._write_snapshot, state)
+            self._records_since_snapshot = 0
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to persist state: {e}")
+
+    def start(self, snapshot_source: Callable[[], Dict[str, Any]]):
+        """Start the background writer; snapshot_source returns the live state as a dict"""
+        self._snapshot_source = snapshot_source
+        self._wakeup = asyncio.Event()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop the writer after a final flush"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        with self._io_lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
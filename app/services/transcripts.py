@@ -0,0 +1,449 @@
+from array import array
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# length, crc32 of the rest of the record
+_PREFIX = struct.Struct("<II")
+# prev pointer, user, admin, session, direction, timestamp, message_id; the UTF-8 text follows
+_FIELDS = struct.Struct("<qqqqBdq")
+HEADER_SIZE = _PREFIX.size + _FIELDS.size
+MAX_TEXT_BYTES = 8192
+
+# A pointer packs (segment number, byte offset) into one int
+_OFFSET_BITS = 40
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+
+_COMPRESSED_MAGIC = b"PNJZ"
+# magic, block size, raw size, block count; then (offset, length) per block
+_COMPRESSED_HEADER = struct.Struct("<4sIQI")
+_BLOCK_ENTRY = struct.Struct("<QI")
+# Small blocks keep a random read cheap: one record costs one block inflate
+BLOCK_SIZE = 16 * 1024
+
+_INDEX_MAGIC = b"PNJI"
+_INDEX_HEADER = struct.Struct("<4sq")
+INDEX_FILE = "index.bin"
+
+
+class TranscriptEntry(NamedTuple):
+    user_id: int
+    admin_id: int
+    session_id: int
+    direction: int
+    timestamp: float
+    message_id: int
+    text: str
+
+
+def _pointer(segment: int, offset: int) -> int:
+    return (segment << _OFFSET_BITS) | offset
+
+
+def _segment_path(directory: str, segment: int, compressed: bool = False) -> str:
+    return os.path.join(directory, f"{segment:08d}.seg{'z' if compressed else ''}")
+
+
+class _RawSegment:
+    """Reads an uncompressed segment through mmap"""
+
+    def __init__(self, f):
+        self.size = os.fstat(f.fileno()).st_size
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+
+    def read(self, offset: int, size: int) -> bytes:
+        return self._map[offset:offset + size]
+
+    def close(self):
+        if self.size:
+            self._map.close()
+
+
+class _CompressedSegment:
+    """Reads a block-compressed segment through mmap, inflating only the blocks it touches"""
+
+    def __init__(self, f):
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.block_size, self.size, count = _COMPRESSED_HEADER.unpack_from(self._map, 0)
+        if magic != _COMPRESSED_MAGIC:
+            raise ValueError("Not a compressed transcript segment")
+        self._blocks = [
+            _BLOCK_ENTRY.unpack_from(self._map, _COMPRESSED_HEADER.size + i * _BLOCK_ENTRY.size)
+            for i in range(count)
+        ]
+        self._cached_block = -1
+        self._cached = b""
+
+    def _block(self, number: int) -> bytes:
+        if number != self._cached_block:
+            offset, length = self._blocks[number]
+            self._cached = zlib.decompress(self._map[offset:offset + length])
+            self._cached_block = number
+        return self._cached
+
+    def read(self, offset: int, size: int) -> bytes:
+        size = max(0, min(size, self.size - offset))
+        parts = []
+        while size > 0:
+            number, start = divmod(offset, self.block_size)
+            chunk = self._block(number)[start:start + size]
+            parts.append(chunk)
+            offset += len(chunk)
+            size -= len(chunk)
+        return b"".join(parts)
+
+    def close(self):
+        self._map.close()
+
+
+def _compress_file(raw_path: str, compressed_path: str):
+    with open(raw_path, "rb") as f:
+        data = f.read()
+    blocks = [zlib.compress(data[i:i + BLOCK_SIZE], 6) for i in range(0, len(data), BLOCK_SIZE)]
+    offset = _COMPRESSED_HEADER.size + len(blocks) * _BLOCK_ENTRY.size
+    table = []
+    for block in blocks:
+        table.append(_BLOCK_ENTRY.pack(offset, len(block)))
+        offset += len(block)
+    tmp_path = compressed_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_COMPRESSED_HEADER.pack(_COMPRESSED_MAGIC, BLOCK_SIZE, len(data), len(blocks)))
+        f.write(b"".join(table))
+        f.write(b"".join(blocks))
+        f.flush()
+        os.fsync(f.fileno())
+    # Keep the time of the last record for the retention policy
+    stat = os.stat(raw_path)
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(tmp_path, compressed_path)
+
+
+class TranscriptStore:
+    """Segmented append-only log of relayed messages with a per-user index.
+
+    Every record stores a pointer to the previous record of the same user,
+    and the index keeps only each user's latest pointer, so reading the last
+    N messages of a user is N random reads through mmap. Segments rotate at
+    `segment_size`; closed segments are block-compressed and dropped after
+    `retention_days` or when the log exceeds `max_bytes`. Records are
+    buffered on the event loop and all file work happens in worker threads.
+    """
+
+    def __init__(self, directory: str, segment_size: int = 16 * 1024 * 1024, retention_days: float = 30,
+                 max_bytes: int = 0, flush_interval: float = 0.2):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self._index: Dict[int, int] = {}
+        self._sessions: Dict[int, Tuple[int, int]] = {}
+        self._segment = 1
+        self._offset = 0
+        self._pending: List[Tuple[int, bytearray]] = []
+        self._rotated = False
+        self._last_session_id = 0
+        self._file = None
+        self._file_segment = 0
+        self._flusher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._maintenance: Optional[asyncio.Future] = None
+        # Flushes from the writer task, history() and close() must reach the file in order
+        self._flush_lock = asyncio.Lock()
+        # Serializes the writer thread, compaction and readers opening files
+        self._io_lock = threading.Lock()
+
+    # Recording (event loop)
+    def _new_session_id(self) -> int:
+        # Microsecond timestamps, bumped if two sessions start in the same tick
+        self._last_session_id = max(self._last_session_id + 1, time.time_ns() // 1000)
+        return self._last_session_id
+
+    def end_session(self, user_id: int):
+        """The next message of this user starts a new session"""
+        self._sessions.pop(user_id, None)
+
+    def record(self, user_id: int, admin_id: int, direction: int, message_id: int, text: str,
+               timestamp: Optional[float] = None):
+        """Buffer one relayed message; it is written by the next flush"""
+        session = self._sessions.get(user_id)
+        if session is None or session[0] != admin_id:
+            session = self._sessions[user_id] = (admin_id, self._new_session_id())
+        body = text.encode("utf-8")[:MAX_TEXT_BYTES]
+        fields = _FIELDS.pack(
+            self._index.get(user_id, -1), user_id, admin_id, session[1], direction,
+            time.time() if timestamp is None else timestamp, message_id,
+        )
+        length = HEADER_SIZE + len(body)
+        if self._offset and self._offset + length > self.segment_size:
+            self._segment += 1
+            self._offset = 0
+            self._rotated = True
+        data = _PREFIX.pack(length, zlib.crc32(body, zlib.crc32(fields))) + fields + body
+        if self._pending and self._pending[-1][0] == self._segment:
+            self._pending[-1][1].extend(data)
+        else:
+            self._pending.append((self._segment, bytearray(data)))
+        self._index[user_id] = _pointer(self._segment, self._offset)
+        self._offset += length
+        if self._wakeup is not None and not self._wakeup.is_set():
+            self._wakeup.set()
+
+    # Writing (worker threads)
+    def _write(self, chunks: List[Tuple[int, bytearray]], index: Optional[Tuple[int, Dict[int, int]]]):
+        with self._io_lock:
+            for segment, data in chunks:
+                if self._file is not None and self._file_segment != segment:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self._file.close()
+                    self._file = None
+                if self._file is None:
+                    self._file = open(_segment_path(self.directory, segment), "ab")
+                    self._file_segment = segment
+                self._file.write(data)
+            if self._file is not None:
+                self._file.flush()
+            if index is not None:
+                self._write_index(*index)
+
+    def _write_index(self, checkpoint: int, index: Dict[int, int]):
+        """Persist the index as it was at `checkpoint`, so loading only scans newer records"""
+        pairs = array("q")
+        for user_id, pointer in index.items():
+            pairs.append(user_id)
+            pairs.append(pointer)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_INDEX_HEADER.pack(_INDEX_MAGIC, checkpoint))
+            pairs.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def _segments(self) -> Dict[int, str]:
+        """Segment number -> path, preferring the raw file while both exist"""
+        found = {}
+        for name in os.listdir(self.directory):
+            stem, _, extension = name.partition(".")
+            if stem.isdigit() and extension in ("seg", "segz"):
+                if extension == "seg" or int(stem) not in found:
+                    found[int(stem)] = os.path.join(self.directory, name)
+        return found
+
+    def _maintain(self, active_segment: int) -> int:
+        """Compress closed segments and apply retention; returns the oldest segment kept"""
+        with self._io_lock:
+            # Never touch the file the writer has open, even if newer records are still buffered
+            if self._file is not None:
+                active_segment = min(active_segment, self._file_segment)
+            segments = self._segments()
+        for segment, path in sorted(segments.items()):
+            if segment >= active_segment or path.endswith(".segz"):
+                continue
+            compressed_path = _segment_path(self.directory, segment, compressed=True)
+            _compress_file(path, compressed_path)
+            with self._io_lock:
+                os.unlink(path)
+            segments[segment] = compressed_path
+
+        closed = sorted(segment for segment in segments if segment < active_segment)
+        sizes = {segment: os.path.getsize(segments[segment]) for segment in segments}
+        total = sum(sizes.values())
+        cutoff = time.time() - self.retention_days * 86400
+        for segment in closed:
+            too_old = self.retention_days and os.path.getmtime(segments[segment]) < cutoff
+            too_big = self.max_bytes and total > self.max_bytes
+            if not (too_old or too_big):
+                break
+            with self._io_lock:
+                os.unlink(segments[segment])
+            total -= sizes.pop(segment)
+            logger.info(f"Removed transcript segment {segment} by retention policy")
+        return min(sizes, default=active_segment)
+
+    # Reading (worker threads)
+    def _open(self, segment: int):
+        with self._io_lock:
+            for compressed in (False, True):
+                try:
+                    with open(_segment_path(self.directory, segment, compressed), "rb") as f:
+                        return _CompressedSegment(f) if compressed else _RawSegment(f)
+                except FileNotFoundError:
+                    continue
+        return None
+
+    @staticmethod
+    def _read_record(reader, offset: int) -> Optional[Tuple[int, int, TranscriptEntry]]:
+        """(length, prev pointer, entry) for the record at offset, or None if it is missing or torn"""
+        prefix = reader.read(offset, _PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            return None
+        length, crc = _PREFIX.unpack(prefix)
+        if length < HEADER_SIZE:
+            return None
+        rest = reader.read(offset + _PREFIX.size, length - _PREFIX.size)
+        if len(rest) != length - _PREFIX.size or zlib.crc32(rest) != crc:
+            return None
+        prev, user_id, admin_id, session_id, direction, timestamp, message_id = _FIELDS.unpack_from(rest)
+        text = rest[_FIELDS.size:].decode("utf-8", errors="replace")
+        return length, prev, TranscriptEntry(user_id, admin_id, session_id, direction, timestamp, message_id, text)
+
+    def _read_chain(self, pointer: int, limit: int) -> List[TranscriptEntry]:
+        readers = {}
+        entries = []
+        try:
+            while pointer >= 0 and len(entries) < limit:
+                segment, offset = pointer >> _OFFSET_BITS, pointer & _OFFSET_MASK
+                if segment not in readers:
+                    readers[segment] = self._open(segment)
+                reader = readers[segment]
+                # The segment may have been removed by retention
+                record = self._read_record(reader, offset) if reader is not None else None
+                if record is None:
+                    break
+                _, pointer, entry = record
+                entries.append(entry)
+        finally:
+            for reader in readers.values():
+                if reader is not None:
+                    reader.close()
+        entries.reverse()
+        return entries
+
+    def _load(self) -> Tuple[Dict[int, int], int, int]:
+        """Index plus the segment and offset to continue writing at"""
+        os.makedirs(self.directory, exist_ok=True)
+        index: Dict[int, int] = {}
+        checkpoint = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                magic, checkpoint = _INDEX_HEADER.unpack(f.read(_INDEX_HEADER.size))
+                pairs = array("q")
+                pairs.frombytes(f.read())
+            if magic == _INDEX_MAGIC:
+                index = dict(zip(pairs[::2], pairs[1::2]))
+            else:
+                checkpoint = 0
+
+        segments = self._segments()
+        if not segments:
+            return index, 1, 0
+        last = max(segments)
+        start_segment, start_offset = checkpoint >> _OFFSET_BITS, checkpoint & _OFFSET_MASK
+        end_offset = 0
+        for segment in sorted(segments):
+            if segment < start_segment:
+                continue
+            reader = self._open(segment)
+            offset = start_offset if segment == start_segment else 0
+            try:
+                while True:
+                    record = self._read_record(reader, offset)
+                    if record is None:
+                        break
+                    length, _, entry = record
+                    index[entry.user_id] = _pointer(segment, offset)
+                    offset += length
+            finally:
+                reader.close()
+            end_offset = offset
+        if segments[last].endswith(".segz"):
+            return index, last + 1, 0
+        if end_offset < os.path.getsize(segments[last]):
+            # Drop a torn record left by a crash so new records follow valid ones
+            logger.warning(f"Truncating torn transcript record in segment {last}")
+            with open(segments[last], "r+b") as f:
+                f.truncate(end_offset)
+        return index, last, end_offset
+
+    # Lifecycle and queries (event loop)
+    async def start(self):
+        """Load the index and start the background writer"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self._index, self._segment, self._offset = await loop.run_in_executor(None, self._load)
+        logger.info(
+            f"Loaded transcript index for {len(self._index)} users "
+            f"in {(time.perf_counter() - started) * 1000:.1f} ms."
+        )
+        self._wakeup = asyncio.Event()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+        self._start_maintenance()
+
+    def _start_maintenance(self):
+        if self._maintenance is None or self._maintenance.done():
+            self._maintenance = asyncio.ensure_future(self._maintain_and_prune())
+
+    async def _maintain_and_prune(self):
+        loop = asyncio.get_running_loop()
+        try:
+            oldest = await loop.run_in_executor(None, self._maintain, self._segment)
+        except OSError as e:
+            logger.error(f"Transcript maintenance failed: {e}")
+            return
+        first_kept = _pointer(oldest, 0)
+        if any(pointer < first_kept for pointer in self._index.values()):
+            self._index = {user: pointer for user, pointer in self._index.items() if pointer >= first_kept}
+
+    async def flush(self):
+        """Write buffered records; after a rotation also save the index and compress"""
+        async with self._flush_lock:
+            chunks, self._pending = self._pending, []
+            rotated, self._rotated = self._rotated, False
+            index = (_pointer(self._segment, self._offset), self._index.copy()) if rotated else None
+            if chunks or index:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, chunks, index)
+        if rotated:
+            self._start_maintenance()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to write transcripts: {e}")
+
+    async def history(self, user_id: int, limit: int = 20) -> List[TranscriptEntry]:
+        """The last `limit` messages relayed for a user, oldest first"""
+        pointer = self._index.get(user_id)
+        if pointer is None:
+            return []
+        await self.flush()
+        return await asyncio.get_running_loop().run_in_executor(None, self._read_chain, pointer, limit)
+
+    async def close(self):
+        """Flush, save the index and stop background work"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+        if self._maintenance is not None:
+            await self._maintenance
+        loop = asyncio.get_running_loop()
+        async with self._flush_lock:
+            checkpoint = _pointer(self._segment, self._offset)
+            await loop.run_in_executor(None, self._write, [], (checkpoint, self._index.copy()))
+        with self._io_lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
@@ -0,0 +1,82 @@
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Hashable, Optional
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update: object) -> Optional[Hashable]:
+    """The chat an update belongs to, or None for updates that need no ordering"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return update.effective_user.id
+    return None
+
+
+class ChatSerializedProcessor(BaseUpdateProcessor):
+    """Runs updates of different chats concurrently and those of one chat in arrival order.
+
+    Each busy chat has a mailbox. An update for a chat that is already being
+    handled is parked in its mailbox and the call returns at once, so it does
+    not hold one of the `max_concurrent_updates` slots while it waits; the task
+    handling the chat drains the mailbox before it lets go. A chat flooding
+    the bot therefore occupies one slot, never all of them.
+
+    Updates of different chats may still touch the same session (an admin and
+    their user, or a timeout), so every state transition must stay atomic on
+    its own.
+    """
+
+    __slots__ = ("_mailboxes",)
+
+    def __init__(self, max_concurrent_updates: int = 64):
+        super().__init__(max_concurrent_updates)
+        # Present only while a task is handling the chat
+        self._mailboxes: Dict[Hashable, Deque[Awaitable[Any]]] = {}
+
+    @property
+    def busy_chats(self) -> int:
+        return len(self._mailboxes)
+
+    @property
+    def parked_updates(self) -> int:
+        return sum(len(mailbox) for mailbox in self._mailboxes.values())
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        key = chat_key(update)
+        if key is None:
+            await coroutine
+            return
+        mailbox = self._mailboxes.get(key)
+        if mailbox is not None:
+            mailbox.append(coroutine)
+            return
+
+        mailbox = self._mailboxes[key] = deque()
+        try:
+            while True:
+                try:
+                    await coroutine
+                except Exception as e:
+                    # Application.process_update already ran the error handlers
+                    logger.debug("Update for chat %s failed: %s", key, e)
+                if not mailbox:
+                    return
+                coroutine = mailbox.popleft()
+        finally:
+            del self._mailboxes[key]
+            for parked in mailbox:
+                # Only reached if the draining task was cancelled
+                parked.close()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,66 @@
+import hmac
+import json
+import logging
+
+from telegram import Update
+from telegram.ext import Application
+
+from services.http_server import HttpServer, Request, Response
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+class WebhookServer:
+    """Receives updates over HTTP and hands them to the application's update queue.
+
+    Telegram posts one update per request, but the endpoint also accepts a
+    JSON array of updates so load generators can push in bulk. The response
+    is sent as soon as the updates are queued; the application processes
+    them in the background.
+    """
+
+    def __init__(self, application: Application, secret_token: str, path: str = "/telegram",
+                 host: str = "0.0.0.0", port: int = 8443):
+        self.application = application
+        self.secret_token = secret_token
+        self.path = path
+        self.http = HttpServer(self._handle, host, port)
+        self.received = 0
+        self.rejected = 0
+
+    @property
+    def port(self) -> int:
+        return self.http.port
+
+    async def start(self):
+        await self.http.start()
+        logger.info(f"Webhook listening on {self.http.host}:{self.http.port}{self.path}")
+
+    async def stop(self):
+        await self.http.stop()
+
+    async def _handle(self, request: Request) -> Response:
+        if request.path != self.path:
+            return 404, {}, b""
+        if request.method != "POST":
+            return 405, {"Allow": "POST"}, b""
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            self.rejected += 1
+            return 403, {}, b""
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return 400, {}, b""
+
+        bot = self.application.bot
+        queue = self.application.update_queue
+        for data in payload if isinstance(payload, list) else (payload,):
+            update = Update.de_json(data, bot)
+            if update is not None:
+                queue.put_nowait(update)
+                self.received += 1
+        return 200, JSON_HEADERS, b'{"ok":true}'
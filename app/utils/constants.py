@@ -0,0 +1,3 @@
+# Direction of a relayed message, as stored in transcripts
+TO_ADMIN = 0
+TO_USER = 1
@@ -1,18 +1,54 @@
+from datetime import datetime
+from typing import Optional
+import math
+
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+from utils.constants import TO_ADMIN
+
+
+# Built once and shared: Telegram objects cannot be changed after they are made
+STOP_CHAT_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Akhiri Obrolan", callback_data="stop_chat")]])
+
 
 def create_stop_chat_keyboard():
-    """Create inline keyboard with stop chat button"""
-    keyboard = [[InlineKeyboardButton("❌ Akhiri Obrolan", callback_data="stop_chat")]]
+    """Inline keyboard with stop chat button"""
+    return STOP_CHAT_KEYBOARD
+
+
+def create_stop_session_keyboard(user_id: int):
+    """Create inline keyboard with a button that ends one of an admin's sessions"""
+    keyboard = [[InlineKeyboardButton(f"❌ Akhiri obrolan dengan {user_id}", callback_data=f"stop_chat:{user_id}")]]
     return InlineKeyboardMarkup(keyboard)
 
 
-def format_queue_message(user_id: int, position: int, total_in_queue: int) -> str:
-    """Format message for queue status"""
+def format_wait_estimate(seconds: Optional[float]) -> str:
+    """Sentence with the estimated wait, to append to a queue message; empty without an estimate"""
+    if seconds is None:
+        return ""
+    minutes = math.ceil(seconds / 60)
+    if minutes <= 1:
+        return " Perkiraan waktu tunggu: kurang dari 1 menit."
+    if minutes < 60:
+        return f" Perkiraan waktu tunggu: sekitar {minutes} menit."
+    hours, minutes = divmod(minutes, 60)
+    return f" Perkiraan waktu tunggu: sekitar {hours} jam {minutes} menit."
+
+
+def format_queue_message(user_id: int, position: int, total_in_queue: int, eta: Optional[float] = None) -> str:
+    """Format message for queue status; eta is the estimated wait in seconds, if known"""
     if position == 1:
-        return f"Kamu saat ini di posisi #{position} dari {total_in_queue} antrian. Kamu akan segera dihubungkan ke admin."
+        return (f"Kamu saat ini di posisi #{position} dari {total_in_queue} antrian. "
+                f"Kamu akan segera dihubungkan ke admin.{format_wait_estimate(eta)}")
     else:
-        return f"Kamu saat ini di posisi #{position} dari {total_in_queue} antrian. Mohon bersabar."
+        return (f"Kamu saat ini di posisi #{position} dari {total_in_queue} antrian. "
+                f"Mohon bersabar.{format_wait_estimate(eta)}")
+
+
+def format_queue_joined_message(position: int, total_in_queue: int, eta: Optional[float] = None) -> str:
+    """Format message for a user who just joined the queue"""
+    return (f"Kamu telah masuk dalam antrian. Kamu di posisi #{position} dari {total_in_queue}. "
+            f"Mohon menunggu.{format_wait_estimate(eta)}")
 
 
 def format_chat_started_message(is_user: bool) -> str:
@@ -30,4 +66,93 @@ def format_chat_ended_message() -> str:
 
 def format_max_queue_message(max_size: int) -> str:
     """Format message when queue is full"""
-    return f"Maaf, antrian sedang penuh (maksimal {max_size} pengguna). Silakan coba lagi nanti."
\ No newline at end of file
+    return f"Maaf, antrian sedang penuh (maksimal {max_size} pengguna). Silakan coba lagi nanti."
+
+def format_flood_message() -> str:
+    """Format the one notice a user gets when they send too fast"""
+    return "Kamu mengirim pesan terlalu cepat. Pesan berikutnya akan diabaikan sebentar, mohon tunggu."
+
+
+def format_seconds(seconds) -> str:
+    """Short human-readable duration"""
+    if seconds is None:
+        return "-"
+    if seconds < 60:
+        return f"{seconds:.0f} dtk"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} mnt"
+    return f"{seconds / 3600:.1f} jam"
+
+
+def format_stats_message(snapshot: dict, queued: int, active: int) -> str:
+    """Format the /stats overview from a LiveStats snapshot"""
+    window = format_seconds(snapshot["window"])
+    waits = ", ".join(
+        f"{name} {format_seconds(value)}" for name, value in zip(("p50", "p90", "p99"), snapshot["waits"])
+    )
+    sessions = ", ".join(
+        f"{name} {format_seconds(value)}" for name, value in zip(("p50", "p90", "p99"), snapshot["sessions"])
+    )
+    return "\n".join([
+        f"Statistik bot (berjalan {format_seconds(snapshot['uptime'])})",
+        "",
+        f"Menunggu di antrian: {queued}",
+        f"Obrolan aktif: {active}",
+        "",
+        f"Dalam {window} terakhir:",
+        f"- masuk antrian: {snapshot['joins']}",
+        f"- obrolan dimulai: {snapshot['starts']}",
+        f"- obrolan selesai: {snapshot['ends']} ({snapshot['timeouts']} karena timeout)",
+        "",
+        f"Laju saat ini: {snapshot['join_rate'] * 60:.1f} masuk/menit, "
+        f"{snapshot['start_rate'] * 60:.1f} dimulai/menit",
+        "",
+        f"Waktu tunggu ({snapshot['wait_count']} obrolan): {waits}",
+        f"Durasi obrolan ({snapshot['session_count']} obrolan): {sessions}",
+    ])
+
+
+def format_history_message(user_id: int, entries: list) -> str:
+    """Format a user's recent transcript, newest last, within Telegram's message limit"""
+    if not entries:
+        return f"Belum ada riwayat obrolan untuk user {user_id}."
+    lines = []
+    session_id = None
+    for entry in entries:
+        if entry.session_id != session_id:
+            session_id = entry.session_id
+            lines.append(f"— Sesi dengan admin {entry.admin_id} —")
+        sender = "User" if entry.direction == TO_ADMIN else "Admin"
+        lines.append(f"[{datetime.fromtimestamp(entry.timestamp):%d-%m %H:%M}] {sender}: {entry.text}")
+    header = f"Riwayat obrolan user {user_id} ({len(entries)} pesan terakhir):"
+    text = "\n".join(lines)
+    # Telegram messages are limited to 4096 characters; keep the newest part
+    room = 4096 - len(header) - 2
+    if len(text) > room:
+        text = "…" + text[-(room - 1):]
+    return f"{header}\n\n{text}"
+
+
+ATTACHMENT_LABELS = {
+    "PhotoSize": "foto",
+    "Video": "video",
+    "Document": "dokumen",
+    "Voice": "pesan suara",
+    "Audio": "audio",
+    "VideoNote": "video bulat",
+    "Sticker": "stiker",
+    "Animation": "GIF",
+    "Contact": "kontak",
+    "Location": "lokasi",
+}
+
+
+def describe_message(message) -> str:
+    """Text of a message for transcripts; media become a label plus their caption"""
+    if message.text:
+        return message.text
+    attachment = message.effective_attachment
+    if isinstance(attachment, (list, tuple)):
+        attachment = attachment[-1] if attachment else None
+    label = ATTACHMENT_LABELS.get(type(attachment).__name__, "lampiran")
+    return f"[{label}] {message.caption}" if message.caption else f"[{label}]"